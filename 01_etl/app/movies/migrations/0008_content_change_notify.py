@@ -0,0 +1,66 @@
+from django.db import migrations
+
+CONTENT_TABLES = (
+    'film_work',
+    'genre',
+    'person',
+    'genre_film_work',
+    'person_film_work',
+)
+
+CREATE_NOTIFY_FUNCTION = """
+CREATE OR REPLACE FUNCTION content.notify_content_change()
+RETURNS trigger AS $$
+DECLARE
+    row_data jsonb;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        row_data := to_jsonb(OLD);
+    ELSE
+        row_data := to_jsonb(NEW);
+    END IF;
+    PERFORM pg_notify('content_changes', json_build_object(
+        'table', TG_TABLE_NAME,
+        'operation', TG_OP,
+        'id', row_data->>'id',
+        'film_work_id', row_data->>'film_work_id'
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+CREATE_NOTIFY_TRIGGER = """
+CREATE TRIGGER {table}_notify_content_change
+AFTER INSERT OR UPDATE OR DELETE ON content.{table}
+FOR EACH ROW EXECUTE PROCEDURE content.notify_content_change();
+"""
+
+DROP_NOTIFY_TRIGGER = """
+DROP TRIGGER IF EXISTS {table}_notify_content_change ON content.{table};
+"""
+
+DROP_NOTIFY_FUNCTION = """
+DROP FUNCTION IF EXISTS content.notify_content_change();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0007_modified_id_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=CREATE_NOTIFY_FUNCTION,
+            reverse_sql=DROP_NOTIFY_FUNCTION,
+        ),
+        *(
+            migrations.RunSQL(
+                sql=CREATE_NOTIFY_TRIGGER.format(table=table),
+                reverse_sql=DROP_NOTIFY_TRIGGER.format(table=table),
+            )
+            for table in CONTENT_TABLES
+        ),
+    ]
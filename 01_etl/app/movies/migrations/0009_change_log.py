@@ -0,0 +1,106 @@
+from django.db import migrations
+
+CONTENT_TABLES = (
+    'film_work',
+    'genre',
+    'person',
+    'genre_film_work',
+    'person_film_work',
+)
+
+# Триггеры журнала выключены до запуска ETL в режиме change_log,
+# см. 0011_change_log_opt_in.
+CREATE_CHANGE_LOG = """
+CREATE TABLE IF NOT EXISTS content.change_log (
+    id bigserial PRIMARY KEY,
+    entity_type text NOT NULL,
+    entity_id uuid NOT NULL,
+    operation text NOT NULL,
+    film_work_id uuid,
+    related_id uuid,
+    created timestamp with time zone NOT NULL DEFAULT now()
+);
+"""
+
+DROP_CHANGE_LOG = """
+DROP TABLE IF EXISTS content.change_log;
+"""
+
+# Для строк связей film_work_id - фильм, related_id - персона или жанр.
+# При UPDATE связи записывается и старая строка: она могла указывать
+# на другой фильм или персону, которые тоже нужно переиндексировать.
+CREATE_LOG_FUNCTION = """
+CREATE OR REPLACE FUNCTION content.log_content_change()
+RETURNS trigger AS $$
+DECLARE
+    row_data jsonb;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        row_data := to_jsonb(OLD);
+    ELSE
+        row_data := to_jsonb(NEW);
+    END IF;
+    INSERT INTO content.change_log (
+        entity_type, entity_id, operation, film_work_id, related_id
+    ) VALUES (
+        TG_TABLE_NAME,
+        (row_data->>'id')::uuid,
+        TG_OP,
+        (row_data->>'film_work_id')::uuid,
+        COALESCE(row_data->>'person_id', row_data->>'genre_id')::uuid
+    );
+    IF TG_OP = 'UPDATE' AND row_data ? 'film_work_id' THEN
+        row_data := to_jsonb(OLD);
+        INSERT INTO content.change_log (
+            entity_type, entity_id, operation, film_work_id, related_id
+        ) VALUES (
+            TG_TABLE_NAME,
+            (row_data->>'id')::uuid,
+            TG_OP,
+            (row_data->>'film_work_id')::uuid,
+            COALESCE(row_data->>'person_id', row_data->>'genre_id')::uuid
+        );
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+CREATE_LOG_TRIGGER = """
+CREATE TRIGGER {table}_log_content_change
+AFTER INSERT OR UPDATE OR DELETE ON content.{table}
+FOR EACH ROW EXECUTE PROCEDURE content.log_content_change();
+"""
+
+DROP_LOG_TRIGGER = """
+DROP TRIGGER IF EXISTS {table}_log_content_change ON content.{table};
+"""
+
+DROP_LOG_FUNCTION = """
+DROP FUNCTION IF EXISTS content.log_content_change();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0008_content_change_notify'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=CREATE_CHANGE_LOG,
+            reverse_sql=DROP_CHANGE_LOG,
+        ),
+        migrations.RunSQL(
+            sql=CREATE_LOG_FUNCTION,
+            reverse_sql=DROP_LOG_FUNCTION,
+        ),
+        *(
+            migrations.RunSQL(
+                sql=CREATE_LOG_TRIGGER.format(table=table),
+                reverse_sql=DROP_LOG_TRIGGER.format(table=table),
+            )
+            for table in CONTENT_TABLES
+        ),
+    ]
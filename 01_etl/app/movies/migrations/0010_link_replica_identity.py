@@ -0,0 +1,29 @@
+from django.db import migrations
+
+LINK_TABLES = (
+    'genre_film_work',
+    'person_film_work',
+)
+
+# Логическая репликация по умолчанию передаёт для DELETE только первичный
+# ключ, а ETL нужны film_work_id и person_id/genre_id удалённой связи.
+SET_REPLICA_IDENTITY = """
+ALTER TABLE content.{table} REPLICA IDENTITY {identity};
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0009_change_log'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=SET_REPLICA_IDENTITY.format(table=table, identity='FULL'),
+            reverse_sql=SET_REPLICA_IDENTITY.format(
+                table=table, identity='DEFAULT',
+            ),
+        )
+        for table in LINK_TABLES
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations
+
+CONTENT_TABLES = (
+    'film_work',
+    'genre',
+    'person',
+    'genre_film_work',
+    'person_film_work',
+)
+
+# Триггеры content.change_log стоят каждой записи в content лишней
+# вставки в журнал (две для UPDATE связи): это WAL, autovacuum и место
+# под таблицу, которая растёт, пока её не очищает ETL в режиме
+# ETL_MODE=change_log. Поэтому по умолчанию триггеры выключены: ETL
+# включает их при запуске в этом режиме и выключает, очищая журнал,
+# в остальных. Для ALTER TABLE роли ETL нужно владеть таблицами content,
+# иначе ETL остановится при запуске.
+SET_LOG_TRIGGER = """
+ALTER TABLE content.{table} {action} TRIGGER {table}_log_content_change;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0010_link_replica_identity'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=SET_LOG_TRIGGER.format(table=table, action='DISABLE'),
+            reverse_sql=SET_LOG_TRIGGER.format(table=table, action='ENABLE'),
+        )
+        for table in CONTENT_TABLES
+    ]
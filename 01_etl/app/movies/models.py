@@ -42,6 +42,12 @@ class Genre(UUIDMixin, TimeStampedMixin):
                 fields=('name',),
             ),
         ]
+        indexes = [
+            models.Index(
+                fields=('modified', 'id'),
+                name='genre_modified_id_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -56,6 +62,12 @@ class Person(UUIDMixin, TimeStampedMixin):
         db_table = template_tablename.format(tablename='person')
         verbose_name = _('person')
         verbose_name_plural = _('persons')
+        indexes = [
+            models.Index(
+                fields=('modified', 'id'),
+                name='person_modified_id_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.full_name
@@ -125,6 +137,10 @@ class Filmwork(UUIDMixin, TimeStampedMixin):
                 fields=('type',),
                 name='film_work_type_idx',
             ),
+            models.Index(
+                fields=('modified', 'id'),
+                name='film_work_modified_id_idx',
+            ),
         ]
 
     def __str__(self):
@@ -1,4 +1,5 @@
 from pathlib import Path
+from typing import Optional
 
 from dotenv import load_dotenv
 from pydantic import BaseConfig, BaseSettings, Field
@@ -26,12 +27,12 @@ class PostgresDSL(BaseSettings):
 
 
 class RedisDSL(BaseSettings):
-    hosts: str
+    host: str
     port: str
 
     class Config(BaseConfig):
         fields = {
-            'hosts': {'env': 'REDIS_HOST'},
+            'host': {'env': 'REDIS_HOST'},
             'port': {'env': 'REDIS_PORT'},
         }
 
@@ -47,10 +48,88 @@ class ElasticDSL(BaseSettings):
         }
 
 
+class EtlSettings(BaseSettings):
+    mode: str = Field('sequential')
+    itersize: Optional[int] = Field(None)
+    aggregate_films: bool = Field(False)
+    transform: str = Field('default')
+    batch_size: int = Field(100)
+    batch_min_size: int = Field(10)
+    batch_max_size: int = Field(5000)  # noqa: WPS432
+    batch_max_seconds: float = Field(5.0)  # noqa: WPS432
+    queue_size: int = Field(4)
+    extract_workers: int = Field(1)
+    transform_workers: int = Field(1)
+    bulk_threads: int = Field(1)
+    bulk_chunk_size: int = Field(500)  # noqa: WPS432
+    bulk_max_chunk_bytes: int = Field(10 * 1024 * 1024)
+    bulk_max_retries: int = Field(5)
+    backpressure: bool = Field(True)
+    backpressure_interval: float = Field(5.0)  # noqa: WPS432
+    backpressure_latency: float = Field(2.0)  # noqa: WPS432
+    shards: int = Field(8)
+    lease_ttl: float = Field(30.0)  # noqa: WPS432
+    change_set_storage: str = Field('memory')
+    fingerprints: bool = Field(False)
+    checkpoint_lag: float = Field(1.0)
+    poll_interval: int = Field(60)
+    notify: bool = Field(False)
+    notify_debounce: float = Field(1.0)
+    reindex_threads: int = Field(4)
+    reindex_batch_size: int = Field(1000)
+    use_copy: bool = Field(False)
+    replication_slot: str = Field('etl_content')
+    replication_timeout: float = Field(1.0)
+    sink: str = Field('ndjson')
+    sink_dir: str = Field('snapshots')
+    sink_compress: bool = Field(True)
+    sink_max_bytes: int = Field(256 * 1024 * 1024)  # noqa: WPS432
+
+    class Config(BaseConfig):
+        fields = {
+            'mode': {'env': 'ETL_MODE'},
+            'itersize': {'env': 'ETL_ITERSIZE'},
+            'aggregate_films': {'env': 'ETL_AGGREGATE_FILMS'},
+            'transform': {'env': 'ETL_TRANSFORM'},
+            'batch_size': {'env': 'ETL_BATCH_SIZE'},
+            'batch_min_size': {'env': 'ETL_BATCH_MIN_SIZE'},
+            'batch_max_size': {'env': 'ETL_BATCH_MAX_SIZE'},
+            'batch_max_seconds': {'env': 'ETL_BATCH_MAX_SECONDS'},
+            'queue_size': {'env': 'ETL_QUEUE_SIZE'},
+            'extract_workers': {'env': 'ETL_EXTRACT_WORKERS'},
+            'transform_workers': {'env': 'ETL_TRANSFORM_WORKERS'},
+            'bulk_threads': {'env': 'ETL_BULK_THREADS'},
+            'bulk_chunk_size': {'env': 'ETL_BULK_CHUNK_SIZE'},
+            'bulk_max_chunk_bytes': {'env': 'ETL_BULK_MAX_CHUNK_BYTES'},
+            'bulk_max_retries': {'env': 'ETL_BULK_MAX_RETRIES'},
+            'backpressure': {'env': 'ETL_BACKPRESSURE'},
+            'backpressure_interval': {'env': 'ETL_BACKPRESSURE_INTERVAL'},
+            'backpressure_latency': {'env': 'ETL_BACKPRESSURE_LATENCY'},
+            'shards': {'env': 'ETL_SHARDS'},
+            'lease_ttl': {'env': 'ETL_LEASE_TTL'},
+            'change_set_storage': {'env': 'ETL_CHANGE_SET_STORAGE'},
+            'fingerprints': {'env': 'ETL_FINGERPRINTS'},
+            'checkpoint_lag': {'env': 'ETL_CHECKPOINT_LAG'},
+            'poll_interval': {'env': 'ETL_POLL_INTERVAL'},
+            'notify': {'env': 'ETL_NOTIFY'},
+            'notify_debounce': {'env': 'ETL_NOTIFY_DEBOUNCE'},
+            'reindex_threads': {'env': 'ETL_REINDEX_THREADS'},
+            'reindex_batch_size': {'env': 'ETL_REINDEX_BATCH_SIZE'},
+            'use_copy': {'env': 'ETL_COPY'},
+            'replication_slot': {'env': 'ETL_REPLICATION_SLOT'},
+            'replication_timeout': {'env': 'ETL_REPLICATION_TIMEOUT'},
+            'sink': {'env': 'ETL_SINK'},
+            'sink_dir': {'env': 'ETL_SINK_DIR'},
+            'sink_compress': {'env': 'ETL_SINK_COMPRESS'},
+            'sink_max_bytes': {'env': 'ETL_SINK_MAX_BYTES'},
+        }
+
+
 class Settings(BaseSettings):
     postgres_dsl: PostgresDSL = PostgresDSL()
     redis_dsl: RedisDSL = RedisDSL()
     elastic_dsl: ElasticDSL = ElasticDSL()
+    etl: EtlSettings = EtlSettings()
 
     class Config(BaseConfig):
         env_file = ENV_PATH.as_posix()
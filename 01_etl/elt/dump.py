@@ -0,0 +1,55 @@
+from redis import Redis
+
+from config import Settings
+from elt_payplan.elasticsearch_loader import ElasticsearchLoader
+from elt_payplan.postgres_extractor import PostgresExtractor
+from elt_payplan.sinks import ElasticsearchSink, NdjsonFileSink, NullSink
+from elt_payplan.snapshot import dump_documents
+from elt_payplan.transformers import TRANSFORMERS
+from utils.dead_letter import RedisDeadLetterStorage
+from utils.logger import get_logger
+
+
+def create_sink(settings: dict):
+    etl_settings = settings['etl']
+    if etl_settings['sink'] == 'elasticsearch':
+        return ElasticsearchSink(ElasticsearchLoader(
+            settings['elastic_dsl'],
+            thread_count=etl_settings['reindex_threads'],
+            chunk_size=etl_settings['bulk_chunk_size'],
+            max_chunk_bytes=etl_settings['bulk_max_chunk_bytes'],
+            max_retries=etl_settings['bulk_max_retries'],
+            dead_letter=RedisDeadLetterStorage(Redis(**settings['redis_dsl'])),
+        ))
+    if etl_settings['sink'] == 'null':
+        return NullSink()
+    return NdjsonFileSink(
+        etl_settings['sink_dir'],
+        compress=etl_settings['sink_compress'],
+        max_bytes=etl_settings['sink_max_bytes'],
+    )
+
+
+if __name__ == '__main__':
+    logging = get_logger(__name__)
+    settings = Settings().dict()
+    etl_settings = settings['etl']
+    pg_conn = PostgresExtractor(
+        settings['postgres_dsl'],
+        itersize=etl_settings['itersize'],
+        aggregate_films=etl_settings['aggregate_films'],
+    )
+    transformer = TRANSFORMERS[etl_settings['transform']](
+        aggregate_films=etl_settings['aggregate_films'],
+    )
+    with create_sink(settings) as sink, pg_conn:
+        counts = dump_documents(
+            pg_conn,
+            transformer,
+            sink,
+            limit=etl_settings['reindex_batch_size'],
+            use_copy=etl_settings['use_copy'],
+        )
+    logging.info('Выгрузка в {sink} завершена: {counts}'.format(
+        sink=etl_settings['sink'], counts=counts,
+    ))
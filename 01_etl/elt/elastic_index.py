@@ -1,3 +1,6 @@
+KEYWORD = {'type': 'keyword'}
+RU_EN_TEXT = {'type': 'text', 'analyzer': 'ru_en'}
+
 INDEX = {
   'settings': {
     'refresh_interval': '1s',
@@ -42,64 +45,54 @@ INDEX = {
   'mappings': {
     'dynamic': 'strict',
     'properties': {
-      'id': {
-        'type': 'keyword',
-      },
+      'id': KEYWORD,
       'imdb_rating': {
         'type': 'float',
       },
-      'genre': {
-        'type': 'keyword',
-      },
+      'genre': KEYWORD,
       'title': {
         'type': 'text',
         'analyzer': 'ru_en',
         'fields': {
-          'raw': {
-            'type':  'keyword',
-          },
+          'raw': KEYWORD,
         },
       },
-      'description': {
-        'type': 'text',
-        'analyzer': 'ru_en',
-      },
-      'director': {
-        'type': 'text',
-        'analyzer': 'ru_en',
-      },
-      'actors_names': {
-        'type': 'text',
-        'analyzer': 'ru_en',
-      },
-      'writers_names': {
-        'type': 'text',
-        'analyzer': 'ru_en',
-      },
+      'description': RU_EN_TEXT,
+      'director': RU_EN_TEXT,
+      'actors_names': RU_EN_TEXT,
+      'writers_names': RU_EN_TEXT,
       'actors': {
         'type': 'nested',
         'dynamic': 'strict',
         'properties': {
-          'id': {
-            'type': 'keyword',
-          },
-          'name': {
-            'type': 'text',
-            'analyzer': 'ru_en',
-          },
+          'id': KEYWORD,
+          'name': RU_EN_TEXT,
         },
       },
       'writers': {
         'type': 'nested',
         'dynamic': 'strict',
         'properties': {
-          'id': {
-            'type': 'keyword',
-          },
-          'name': {
-            'type': 'text',
-            'analyzer': 'ru_en',
-          },
+          'id': KEYWORD,
+          'name': RU_EN_TEXT,
+        },
+      },
+      'directors_names': RU_EN_TEXT,
+      'directors': {
+        'type': 'nested',
+        'dynamic': 'strict',
+        'properties': {
+          'id': KEYWORD,
+          'name': RU_EN_TEXT,
+        },
+      },
+      'genres_names': KEYWORD,
+      'genres': {
+        'type': 'nested',
+        'dynamic': 'strict',
+        'properties': {
+          'id': KEYWORD,
+          'name': KEYWORD,
         },
       },
     },
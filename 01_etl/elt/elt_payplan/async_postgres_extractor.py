@@ -0,0 +1,132 @@
+import datetime
+import json
+
+import asyncpg
+
+from elt_payplan.queries import (
+    APPLICATION_NAME,
+    FILM_DATA_SQL,
+    FILM_DOCUMENTS_SQL,
+    FILM_ID_IN_TABLE_SQL,
+    GENRE_DATA_SQL,
+    MODIFIED_IDS_SQL,
+    PERSON_DATA_SQL,
+)
+
+
+async def init_connection(connection):
+    # uuid отдаём строками, как psycopg2, чтобы модели pydantic
+    # и состояние ETL работали с одними и теми же значениями.
+    await connection.set_type_codec(
+        'uuid', encoder=str, decoder=str, schema='pg_catalog',
+    )
+    # Составы json_agg приходят списками, как после разбора в psycopg2.
+    await connection.set_type_codec(
+        'json', encoder=json.dumps, decoder=json.loads, schema='pg_catalog',
+    )
+
+
+def checkpoint_moment(modified) -> datetime.datetime:
+    """
+    Момент контрольной точки для параметра timestamptz.
+
+    Наивное время asyncpg переводит в UTC из локального пояса процесса,
+    а для datetime.min восточнее Гринвича это ещё и выход за год 1,
+    поэтому без пояса момент считается временем UTC, как в состоянии.
+    """
+    if isinstance(modified, str):
+        modified = datetime.datetime.fromisoformat(modified)
+    if modified.tzinfo is None:
+        modified = modified.replace(tzinfo=datetime.timezone.utc)
+    return modified
+
+
+class AsyncPostgresConnector(object):
+    def __init__(
+        self,
+        postgres_dsl,
+        max_size=10,
+        checkpoint_lag=0,
+        aggregate_films=False,
+    ):
+        self.postgres_dsl = postgres_dsl
+        self.max_size = max_size
+        self.checkpoint_lag = checkpoint_lag
+        self.aggregate_films = aggregate_films
+        self.pool = None
+
+    async def __aenter__(self):
+        self.pool = await asyncpg.create_pool(
+            database=self.postgres_dsl['dbname'],
+            user=self.postgres_dsl['user'],
+            password=self.postgres_dsl['password'],
+            host=self.postgres_dsl['host'],
+            port=self.postgres_dsl['port'],
+            min_size=1,
+            max_size=self.max_size,
+            init=init_connection,
+            server_settings={'application_name': APPLICATION_NAME},
+        )
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.pool.close()
+
+    async def query(self, sql, *args):
+        async with self.pool.acquire() as connection:
+            return await connection.fetch(sql, *args)
+
+
+class AsyncPostgresExtractor(AsyncPostgresConnector):
+    async def get_ids_modified_table(self, table, checkpoint, limit):
+        """
+        Асинхронный аналог PostgresExtractor.get_ids_modified_table.
+
+        Yields:
+            list: строки с полями id и modified
+        """
+        sql = MODIFIED_IDS_SQL.format(
+            table=table,
+            modified='$1',
+            id='$2',
+            limit='$3',
+            lag='$4',
+            application_name=APPLICATION_NAME,
+            shard_filter='',
+        )
+        modified, last_id = checkpoint
+        modified = checkpoint_moment(modified)
+        while True:
+            loaded_data = await self.query(
+                sql, modified, last_id, limit, float(self.checkpoint_lag),
+            )
+            if not loaded_data:
+                break
+            yield loaded_data
+            if len(loaded_data) < limit:
+                break
+            modified = loaded_data[-1]['modified']
+            last_id = loaded_data[-1]['id']
+
+    async def get_person_data(self, persons_ids):
+        return await self.query(
+            PERSON_DATA_SQL.format(ids='$1'), list(persons_ids),
+        )
+
+    async def get_genre_data(self, genre_ids):
+        return await self.query(
+            GENRE_DATA_SQL.format(ids='$1'), list(genre_ids),
+        )
+
+    async def get_film_data(self, film_ids):
+        if self.aggregate_films:
+            return await self.query(
+                FILM_DOCUMENTS_SQL.format(ids='$1'), list(film_ids),
+            )
+        return await self.query(FILM_DATA_SQL.format(ids='$1'), list(film_ids))
+
+    async def get_film_id_in_table(self, table, table_ids):
+        return await self.query(
+            FILM_ID_IN_TABLE_SQL.format(table=table, ids='$1'),
+            list(table_ids),
+        )
@@ -0,0 +1,61 @@
+import asyncio
+from functools import partial
+from typing import List
+
+from elt_payplan.async_postgres_extractor import AsyncPostgresExtractor
+from elt_payplan.elasticsearch_loader import ElasticsearchLoader
+from elt_payplan.stages import extract_settled_ids
+
+
+async def run_sync(func, *args, **kwargs):
+    """
+    Выполнить блокирующий вызов в пуле потоков цикла событий.
+
+    Так Redis и загрузка в Elasticsearch идут тем же синхронным кодом,
+    что и в main.py, но не останавливают задачи других таблиц.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, partial(func, *args, **kwargs))
+
+
+async def async_resolve_film_ids(
+    pg_conn: AsyncPostgresExtractor,
+    table: dict,
+    table_ids: List[str],
+    settled_ids: frozenset,
+) -> List[str]:
+    """Асинхронный аналог stages.resolve_film_ids."""
+    if not table.get('func_film_id'):
+        return list(table_ids)
+    table_ids = [
+        table_id for table_id in table_ids if table_id not in settled_ids
+    ]
+    if not table_ids:
+        return []
+    film_rows = await pg_conn.get_film_id_in_table(table['name'], table_ids)
+    return [row['id'] for row in film_rows]
+
+
+async def async_extract_batch(
+    pg_conn: AsyncPostgresExtractor,
+    table: dict,
+    table_ids: List[str],
+    es_conn: ElasticsearchLoader = None,
+) -> dict:
+    """Асинхронный аналог stages.extract_batch."""
+    extracted = {'index': None, 'films': []}
+    transform_index = table.get('transform_index')
+    if transform_index:
+        extracted['index'] = await getattr(
+            pg_conn, transform_index['get_data'],
+        )(table_ids)
+
+    settled_ids = await run_sync(
+        extract_settled_ids, es_conn, table, extracted['index'],
+    )
+    film_ids = await async_resolve_film_ids(
+        pg_conn, table, table_ids, settled_ids,
+    )
+    if film_ids:
+        extracted['films'] = await pg_conn.get_film_data(film_ids)
+    return extracted
@@ -0,0 +1,196 @@
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from elasticsearch import ApiError, Elasticsearch, TransportError
+
+from utils.logger import get_logger
+
+# Доля заполнения очереди write, после которой нагрузка снижается.
+QUEUE_HIGH_RATIO = 0.5
+DEFAULT_WRITE_QUEUE_SIZE = 10000
+# Ответ Elasticsearch, когда у ETL нет прав на статистику узлов.
+FORBIDDEN_STATUS = 403
+LATENCY_SMOOTHING = 0.3
+PRESSURE_CHANGED = (
+    'Backpressure: одновременных bulk {old} -> {new} ({reason})'
+)
+PRESSURE_PAUSED = 'Backpressure: пауза {interval} с ({reason})'
+PRESSURE_SAMPLE_FAILED = (
+    'Backpressure: не удалось получить статистику: {error}'
+)
+REASON_RED = 'кластер в статусе red'
+REASON_REJECTED = 'пул write отклонил {count} запросов'
+REASON_QUEUE = 'очередь write заполнена на {ratio:.0%}'
+REASON_LATENCY = 'bulk отвечает за {latency:.2f} с'
+REASON_HEALTHY = 'кластер справляется'
+
+
+class BackpressureMonitor(object):  # noqa: WPS214, WPS230
+    """
+    Ограничение числа одновременных bulk-запросов по состоянию кластера.
+
+    Раз в interval секунд читаются _cluster/health и счётчики пула
+    write из _nodes/stats, а после каждого запроса учитывается время
+    ответа bulk. Рост отклонений, заполнение очереди write, статус red
+    или долгие ответы вдвое уменьшают допустимое число запросов
+    в полёте, спокойный кластер увеличивает его на один. Когда уже
+    разрешён один запрос, а давление сохраняется, отправка ставится
+    на паузу до следующего замера. Так ETL замедляется раньше, чем
+    кластер начинает отвечать 429.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 1,
+        interval: float = 5.0,
+        latency_target: float = 2.0,
+    ):
+        self.max_in_flight = max(max_in_flight, 1)
+        self.limit = self.max_in_flight
+        self.interval = interval
+        self.latency_target = latency_target
+        self.client = None
+        self.in_flight = 0
+        self.latency = 0
+        self.rejected = None
+        self.queue_sizes = {}
+        self.node_stats = True
+        self.paused_until = 0
+        self.sampled_at = 0
+        self.condition = threading.Condition()
+        self.logging = get_logger(__name__)
+
+    def bind(self, client: Elasticsearch) -> None:
+        self.client = client
+        self.rejected = None
+        self.sampled_at = 0
+
+    def acquire(self) -> None:
+        """Дождаться разрешения отправить очередной bulk-запрос."""
+        self.sample()
+        with self.condition:
+            while True:
+                pause = self.paused_until - time.monotonic()
+                if pause <= 0 and self.in_flight < self.limit:
+                    break
+                self.condition.wait(pause if pause > 0 else None)
+            self.in_flight += 1
+
+    @contextmanager
+    def slot(self):
+        """
+        Занять место bulk-запроса в полёте на время блока.
+
+        Yields:
+            None: тело блока - один bulk-запрос
+        """
+        self.acquire()
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start)
+
+    def release(self, latency: float) -> None:
+        with self.condition:
+            self.in_flight -= 1
+            if self.latency:
+                self.latency += LATENCY_SMOOTHING * (latency - self.latency)
+            else:
+                self.latency = latency
+            self.condition.notify_all()
+
+    def sample(self) -> None:
+        """Раз в interval секунд оценить нагрузку и пересчитать лимит."""
+        with self.condition:
+            now = time.monotonic()
+            if self.client is None or now - self.sampled_at < self.interval:
+                return
+            self.sampled_at = now
+        try:
+            reason = self.pressure()
+        except (ApiError, TransportError) as exception:
+            self.logging.warning(PRESSURE_SAMPLE_FAILED.format(
+                error=exception,
+            ))
+            return
+        with self.condition:
+            if reason is None:
+                self.set_limit(self.limit + 1, REASON_HEALTHY)
+            elif self.limit > 1:
+                self.set_limit(self.limit // 2, reason)
+            else:
+                self.paused_until = time.monotonic() + self.interval
+                self.logging.warning(PRESSURE_PAUSED.format(
+                    interval=self.interval, reason=reason,
+                ))
+            self.condition.notify_all()
+
+    def pressure(self):
+        """Причина снизить нагрузку или None, если кластер справляется."""
+        health = self.client.cluster.health()
+        if health['status'] == 'red':
+            return REASON_RED
+        if self.node_stats:
+            reason = self.thread_pool_pressure()
+            if reason is not None:
+                return reason
+        if self.latency > self.latency_target:
+            return REASON_LATENCY.format(latency=self.latency)
+        return None
+
+    def thread_pool_pressure(self):
+        try:
+            stats = self.client.nodes.stats(metric='thread_pool')
+        except ApiError as exception:
+            if exception.meta.status != FORBIDDEN_STATUS:
+                raise
+            # Нет прав cluster:monitor/nodes/stats - остаются health
+            # и время ответов bulk.
+            self.node_stats = False
+            return None
+        rejected = 0
+        ratio = 0
+        for node_id, node in stats['nodes'].items():
+            write_pool = node['thread_pool']['write']
+            rejected += write_pool['rejected']
+            ratio = max(
+                ratio, write_pool['queue'] / self.queue_size(node_id),
+            )
+        previous = self.rejected
+        self.rejected = rejected
+        if previous is not None and rejected > previous:
+            return REASON_REJECTED.format(count=rejected - previous)
+        if ratio > QUEUE_HIGH_RATIO:
+            return REASON_QUEUE.format(ratio=ratio)
+        return None
+
+    def queue_size(self, node_id: str) -> int:
+        """Размер очереди пула write узла, читается один раз."""
+        if node_id not in self.queue_sizes:
+            info = self.client.nodes.info(
+                node_id=node_id, metric='thread_pool',
+            )
+            write_pool = info['nodes'][node_id]['thread_pool']['write']
+            queue_size = write_pool.get('queue_size', -1)
+            self.queue_sizes[node_id] = (
+                queue_size if queue_size > 0 else DEFAULT_WRITE_QUEUE_SIZE
+            )
+        return self.queue_sizes[node_id]
+
+    def set_limit(self, limit: int, reason: str) -> None:
+        limit = min(max(limit, 1), self.max_in_flight)
+        if limit == self.limit:
+            return
+        self.logging.info(PRESSURE_CHANGED.format(
+            old=self.limit, new=limit, reason=reason,
+        ))
+        self.limit = limit
+
+
+def backpressure_slot(monitor: BackpressureMonitor = None):
+    """Место bulk-запроса у monitor или пустой контекст без него."""
+    if monitor is None:
+        return nullcontext()
+    return monitor.slot()
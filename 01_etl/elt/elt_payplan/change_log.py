@@ -0,0 +1,173 @@
+from typing import List
+
+from elt_payplan.change_set import ChangeSet, rebuild_films
+from elt_payplan.data_transformer import DataTransform
+from elt_payplan.elasticsearch_loader import ElasticsearchLoader
+from elt_payplan.film_links import propagate_film_links
+from elt_payplan.postgres_extractor import PostgresExtractor
+from elt_payplan.stages import (
+    extract_index_data,
+    extract_settled_ids,
+    load_batch,
+    resolve_film_ids,
+    stream_batch,
+)
+from elt_payplan.tables import TABLES_PG
+from utils.logger import get_logger
+
+CHANGE_LOG_STATS = ''.join((
+    'Журнал изменений: записей {entries}, пересобрано фильмов {films}, ',
+    'удалено документов {deleted}',
+))
+DELETE = 'DELETE'
+UPSERT = 'UPSERT'
+# Таблица связи -> таблица, на которую указывает related_id.
+LINK_TABLES = {
+    'person_film_work': 'person',
+    'genre_film_work': 'genre',
+}
+# Индекс, из которого удаляется документ удалённой строки.
+DELETE_INDEX = {
+    'film_work': 'movies',
+    'person': 'persons',
+    'genre': 'genres',
+}
+
+
+class ChangeLogBatch(object):
+    """
+    Пачка записей журнала, сведённая к итоговым операциям.
+
+    Для каждой записи genre, person и film_work остаётся последняя
+    операция: несколько UPDATE одной персоны дают одну переиндексацию,
+    а DELETE отменяет предшествующие изменения. Строка связи затрагивает
+    только свой фильм и документ персоны или жанра, но не остальные
+    фильмы этой персоны.
+    """
+
+    def __init__(self, entries: List[dict]):
+        self.operations = {table_name: {} for table_name in DELETE_INDEX}
+        self.related_ids = {table_name: set() for table_name in DELETE_INDEX}
+        self.film_ids = set()
+        for entry in entries:
+            self.add(entry)
+
+    def add(self, entry) -> None:
+        entity_type = entry['entity_type']
+        related_table = LINK_TABLES.get(entity_type)
+        if related_table:
+            self.film_ids.add(entry['film_work_id'])
+            self.related_ids[related_table].add(entry['related_id'])
+            return
+        operation = DELETE if entry['operation'] == DELETE else UPSERT
+        self.operations[entity_type][entry['entity_id']] = operation
+
+    def ids(self, table_name: str, operation: str) -> List[str]:
+        operations = self.operations[table_name]
+        return [
+            entity_id
+            for entity_id in operations
+            if operations[entity_id] == operation
+        ]
+
+    def index_ids(self, table_name: str) -> List[str]:
+        """Записи, документы которых нужно переиндексировать."""
+        operations = self.operations[table_name]
+        related_ids = [
+            entity_id
+            for entity_id in self.related_ids[table_name]
+            if entity_id not in operations
+        ]
+        return self.ids(table_name, UPSERT) + related_ids
+
+
+def apply_change_log_batch(
+    pg_conn: PostgresExtractor,
+    es_conn: ElasticsearchLoader,
+    transformer: DataTransform,
+    entries: List[dict],
+    limit: int,
+) -> tuple:
+    """
+    Перенести в Elasticsearch одну пачку записей журнала.
+
+    Персоны и жанры переиндексируются в своих индексах, затронутые
+    фильмы собираются в ChangeSet и пересобираются по одному разу,
+    удалённые строки удаляются из индексов действиями delete.
+    Возвращает число пересобранных фильмов и удалённых документов.
+    """
+    batch = ChangeLogBatch(entries)
+    films = ChangeSet()
+    films.add(batch.film_ids)
+    for table in TABLES_PG:
+        index_ids = batch.index_ids(table['name'])
+        settled_ids = frozenset()
+        if index_ids:
+            index_data = extract_index_data(pg_conn, table, index_ids)
+            if index_data is not None:
+                index_data = list(index_data)
+                settled_ids = extract_settled_ids(es_conn, table, index_data)
+                load_batch(es_conn, stream_batch(
+                    transformer, table, {'index': index_data, 'films': []},
+                ))
+        table_ids = batch.ids(table['name'], UPSERT)
+        if table_ids:
+            films.add(
+                resolve_film_ids(pg_conn, table, table_ids, settled_ids),
+            )
+
+    films.discard(batch.ids('film_work', DELETE))
+    films_count = len(films)
+    rebuild_films(pg_conn, es_conn, transformer, films, limit)
+
+    propagate_film_links(
+        es_conn, deleted_ids=batch.ids('film_work', DELETE),
+    )
+    deleted = 0
+    for table_name, index_name in DELETE_INDEX.items():
+        deleted_ids = batch.ids(table_name, DELETE)
+        if deleted_ids:
+            es_conn.delete_from_elastic(index_name, deleted_ids)
+            deleted += len(deleted_ids)
+    return films_count, deleted
+
+
+def sync_change_log(
+    pg_conn: PostgresExtractor,
+    es_conn: ElasticsearchLoader,
+    transformer: DataTransform,
+    limit: int = 100,
+) -> None:
+    """
+    Цикл синхронизации по журналу content.change_log.
+
+    Вместо сканирования таблиц по modified читается журнал, одним
+    запросом по первичному ключу. Журнал видит изменения таблиц связей
+    и удаления, которых нет в сканировании по modified.
+
+    Журнал работает как очередь: каждая пачка читается с начала
+    таблицы, а после переноса удаляются ровно её записи. Номер
+    последней записи не запоминается: id выдаётся при вставке, и
+    запись транзакции, зафиксированной позже соседней с большим id,
+    иначе осталась бы позади курсора и пропала при очистке.
+    """
+    logging = get_logger(__name__)
+    entries_count, films_count, deleted = 0, 0, 0
+    while True:
+        entries = pg_conn.get_change_log(limit)
+        if not entries:
+            break
+        batch_films, batch_deleted = apply_change_log_batch(
+            pg_conn, es_conn, transformer, entries, limit,
+        )
+        pg_conn.prune_change_log([entry['id'] for entry in entries])
+        entries_count += len(entries)
+        films_count += batch_films
+        deleted += batch_deleted
+        if len(entries) < limit:
+            break
+    if not entries_count:
+        return
+    logging.info(CHANGE_LOG_STATS.format(
+        entries=entries_count, films=films_count, deleted=deleted,
+    ))
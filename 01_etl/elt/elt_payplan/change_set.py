@@ -0,0 +1,194 @@
+from itertools import islice
+from typing import Iterable, List
+
+from redis import Redis
+
+from elt_payplan.checkpoint import MIN_ID, get_checkpoint, set_checkpoint
+from elt_payplan.data_transformer import DataTransform
+from elt_payplan.elasticsearch_loader import ElasticsearchLoader
+from elt_payplan.postgres_extractor import PostgresExtractor
+from elt_payplan.stages import (
+    extract_index_data,
+    extract_settled_ids,
+    load_batch,
+    resolve_film_ids,
+    stream_batch,
+)
+from utils.logger import get_logger
+from utils.state import State
+
+CHANGE_SET_STATS = ''.join((
+    'Цикл синхронизации: затронуто фильмов {touched}, ',
+    'уникальных {unique}, пересборок сэкономлено {saved}',
+))
+
+
+class ChangeSet(object):
+    """
+    Множество фильмов, затронутых за цикл синхронизации.
+
+    Фильм, изменённый через персону, жанр и напрямую, попадает сюда
+    трижды, но пересобирается один раз.
+    """
+
+    durable = False
+
+    def __init__(self):
+        self.film_ids = set()
+        self.touched = 0
+
+    def add(self, film_ids: Iterable[str]) -> None:
+        film_ids = list(film_ids)
+        self.touched += len(film_ids)
+        self.film_ids.update(film_ids)
+
+    def peek(self, limit: int) -> List[str]:
+        return list(islice(self.film_ids, limit))
+
+    def discard(self, film_ids: List[str]) -> None:
+        self.film_ids.difference_update(film_ids)
+
+    def __len__(self) -> int:
+        return len(self.film_ids)
+
+
+class RedisChangeSet(ChangeSet):
+    """
+    Множество затронутых фильмов в Redis.
+
+    Переживает перезапуск ETL, поэтому контрольные точки таблиц можно
+    сдвигать сразу после сбора идентификаторов, не дожидаясь пересборки.
+    """
+
+    durable = True
+
+    def __init__(self, redis_conn: Redis, key: str = 'etl:change_set'):
+        super().__init__()
+        self.redis_conn = redis_conn
+        self.key = key
+
+    def add(self, film_ids: Iterable[str]) -> None:
+        film_ids = list(film_ids)
+        self.touched += len(film_ids)
+        if film_ids:
+            self.redis_conn.sadd(self.key, *film_ids)
+
+    def peek(self, limit: int) -> List[str]:
+        return [
+            film_id.decode('utf8')
+            for film_id in self.redis_conn.srandmember(self.key, limit)
+        ]
+
+    def discard(self, film_ids: List[str]) -> None:
+        if film_ids:
+            self.redis_conn.srem(self.key, *film_ids)
+
+    def __len__(self) -> int:
+        return self.redis_conn.scard(self.key)
+
+
+def collect_table_changes(  # noqa: WPS211
+    state: State,
+    pg_conn: PostgresExtractor,
+    table: dict,
+    es_conn: ElasticsearchLoader,
+    transformer: DataTransform,
+    change_set: ChangeSet,
+    limit: int,
+):
+    """
+    Собрать фильмы, затронутые изменениями таблицы, в change_set.
+
+    Собственный индекс таблицы (persons, genres) обновляется сразу.
+    Возвращает последнюю просмотренную строку, если контрольную точку
+    нужно сдвинуть только после пересборки фильмов.
+    """
+    table_name = table['name']
+    last_row = None
+    generator_modified_ids = pg_conn.get_ids_modified_table(
+        table_name, get_checkpoint(state, table_name), limit,
+    )
+    for modified_ids in generator_modified_ids:
+        table_ids = [item['id'] for item in modified_ids]
+        index_data = extract_index_data(pg_conn, table, table_ids)
+        settled_ids = frozenset()
+        if index_data is not None:
+            index_data = list(index_data)
+            settled_ids = extract_settled_ids(es_conn, table, index_data)
+            load_batch(es_conn, stream_batch(
+                transformer, table, {'index': index_data, 'films': []},
+            ))
+        change_set.add(
+            resolve_film_ids(pg_conn, table, table_ids, settled_ids),
+        )
+        last_row = modified_ids[-1]
+        if change_set.durable:
+            set_checkpoint(state, table_name, last_row)
+    return None if change_set.durable else last_row
+
+
+def collect_changes_since(
+    pg_conn: PostgresExtractor,
+    tables: list,
+    since: str,
+    change_set: ChangeSet,
+    limit: int,
+) -> None:
+    """Собрать в change_set фильмы, затронутые строками после since."""
+    for table in tables:
+        generator_modified_ids = pg_conn.get_ids_modified_table(
+            table['name'], (since, MIN_ID), limit,
+        )
+        for modified_ids in generator_modified_ids:
+            change_set.add(resolve_film_ids(
+                pg_conn, table, [row['id'] for row in modified_ids],
+            ))
+
+
+def rebuild_films(
+    pg_conn: PostgresExtractor,
+    es_conn: ElasticsearchLoader,
+    transformer: DataTransform,
+    change_set: ChangeSet,
+    limit: int,
+) -> None:
+    """Пересобрать каждый фильм из change_set ровно один раз."""
+    while True:
+        film_ids = change_set.peek(limit)
+        if not film_ids:
+            break
+        films = pg_conn.get_film_data(film_ids)
+        load_batch(es_conn, stream_batch(
+            transformer, {}, {'index': None, 'films': films},
+        ))
+        change_set.discard(film_ids)
+
+
+def sync_change_set(  # noqa: WPS211
+    state: State,
+    pg_conn: PostgresExtractor,
+    es_conn: ElasticsearchLoader,
+    transformer: DataTransform,
+    tables: list,
+    change_set: ChangeSet,
+    limit: int = 100,
+) -> None:
+    logging = get_logger(__name__)
+    change_set.touched = 0
+    pending_checkpoints = {}
+    for table in tables:
+        last_row = collect_table_changes(
+            state, pg_conn, table, es_conn, transformer, change_set, limit,
+        )
+        if last_row is not None:
+            pending_checkpoints[table['name']] = last_row
+
+    unique = len(change_set)
+    rebuild_films(pg_conn, es_conn, transformer, change_set, limit)
+    for table_name, row in pending_checkpoints.items():
+        set_checkpoint(state, table_name, row)
+    logging.info(CHANGE_SET_STATS.format(
+        touched=change_set.touched,
+        unique=unique,
+        saved=max(change_set.touched - unique, 0),
+    ))
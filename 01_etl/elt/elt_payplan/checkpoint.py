@@ -0,0 +1,50 @@
+import datetime
+import json
+
+from utils.state import State
+
+MIN_MODIFIED = datetime.datetime.min.replace(
+    tzinfo=datetime.timezone.utc,
+).isoformat()
+MIN_ID = '00000000-0000-0000-0000-000000000000'
+
+
+def checkpoint_name(table_name: str, shard: tuple = None) -> str:
+    """Ключ состояния таблицы или её шарда (номер, число шардов)."""
+    if shard is None:
+        return table_name
+    return '{table}:shard:{shard}/{count}'.format(
+        table=table_name, shard=shard[0], count=shard[1],
+    )
+
+
+def get_checkpoint(state: State, table_name: str) -> tuple:
+    """Прочитать контрольную точку (modified, id) таблицы из состояния."""
+    state_value = state.get_state(table_name)
+    state_table = json.loads(state_value) if state_value else {}
+    return (
+        state_table.get('modified', state_table.get('date', MIN_MODIFIED)),
+        state_table.get('id', MIN_ID),
+    )
+
+
+def checkpoint_value(row) -> str:
+    """Контрольная точка по последней проиндексированной строке."""
+    return json.dumps({
+        'modified': row['modified'].isoformat(),
+        'id': str(row['id']),
+    })
+
+
+def set_checkpoint(state: State, table_name: str, row) -> None:
+    """Сохранить последнюю обработанную строку как контрольную точку."""
+    state.set_state(table_name, checkpoint_value(row))
+
+
+def get_sequence(state: State, name: str) -> int:
+    """Прочитать последний обработанный номер записи журнала."""
+    return int(state.get_state(name) or 0)
+
+
+def set_sequence(state: State, name: str, seq: int) -> None:
+    state.set_state(name, str(seq))
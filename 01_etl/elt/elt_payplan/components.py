@@ -0,0 +1,73 @@
+from redis import Redis
+
+from elt_payplan.backpressure import BackpressureMonitor
+from elt_payplan.data_transformer import DataTransform
+from elt_payplan.elasticsearch_loader import ElasticsearchLoader
+from elt_payplan.film_links import ensure_movie_mapping
+from elt_payplan.tables import TABLES_PG
+from elt_payplan.transformers import TRANSFORMERS
+from utils.batch_size import AdaptiveBatchSize
+from utils.dead_letter import RedisDeadLetterStorage
+from utils.fingerprint import FingerprintCache
+from utils.state import RedisStorage, State
+
+
+def create_storage(settings: dict) -> tuple:
+    """Состояние ETL и соединение Redis для служебных ключей."""
+    state = State(
+        RedisStorage(redis_adapter=Redis, redis_dsl=settings['redis_dsl']),
+    )
+    return state, Redis(**settings['redis_dsl'])
+
+
+def create_loader(settings: dict, redis_conn: Redis) -> ElasticsearchLoader:
+    """
+    Загрузчик Elasticsearch по настройкам ETL.
+
+    До первой записи проверяется, что в маппинге movies есть вложенные
+    поля персон и жанров (ensure_movie_mapping).
+    """
+    etl_settings = settings['etl']
+    fingerprints = None
+    if etl_settings['fingerprints']:
+        fingerprints = FingerprintCache(redis_conn)
+    backpressure = None
+    if etl_settings['backpressure']:
+        backpressure = BackpressureMonitor(
+            max_in_flight=etl_settings['bulk_threads'],
+            interval=etl_settings['backpressure_interval'],
+            latency_target=etl_settings['backpressure_latency'],
+        )
+    es_conn = ElasticsearchLoader(
+        settings['elastic_dsl'],
+        thread_count=etl_settings['bulk_threads'],
+        chunk_size=etl_settings['bulk_chunk_size'],
+        max_chunk_bytes=etl_settings['bulk_max_chunk_bytes'],
+        max_retries=etl_settings['bulk_max_retries'],
+        dead_letter=RedisDeadLetterStorage(redis_conn),
+        backpressure=backpressure,
+        fingerprints=fingerprints,
+    )
+    with es_conn:
+        ensure_movie_mapping(es_conn)
+    return es_conn
+
+
+def create_transformer(etl_settings: dict) -> DataTransform:
+    """Преобразователь по ETL_TRANSFORM и ETL_AGGREGATE_FILMS."""
+    transformer_class = TRANSFORMERS[etl_settings['transform']]
+    return transformer_class(aggregate_films=etl_settings['aggregate_films'])
+
+
+def create_batch_sizes(etl_settings: dict) -> dict:
+    """Адаптивный размер пачки для каждой таблицы."""
+    return {
+        table['name']: AdaptiveBatchSize(
+            table['name'],
+            initial=etl_settings['batch_size'],
+            min_size=etl_settings['batch_min_size'],
+            max_size=etl_settings['batch_max_size'],
+            max_seconds=etl_settings['batch_max_seconds'],
+        )
+        for table in TABLES_PG
+    }
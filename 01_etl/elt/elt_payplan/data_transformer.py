@@ -1,5 +1,7 @@
 from collections import defaultdict
 from enum import Enum
+from itertools import groupby
+from operator import itemgetter
 
 from pydantic_models import (  # isort: skip
     FilmElastick,
@@ -12,6 +14,8 @@ from pydantic_models import (  # isort: skip
     RawMovies,
 )
 
+UNSORTED_ROWS = 'Строки не упорядочены по {key}: {value} после {previous}'
+
 
 class PersonRole(Enum):
     ACTOR = 'actor'
@@ -19,7 +23,10 @@ class PersonRole(Enum):
     DIRECTOR = 'director'
 
 
-class DataTransform(object):
+class DataTransform(object):  # noqa: WPS214
+    def __init__(self, aggregate_films=False):
+        self.aggregate_films = aggregate_films
+
     def add_role_person(self, role, data, film):
         mapping_person = {
             PersonRole.ACTOR.value: {
@@ -43,6 +50,8 @@ class DataTransform(object):
                 data_mapping['obj'].append(person)
 
     def transform_film(self, films_raw):
+        if self.aggregate_films:
+            return self.transform_film_documents(films_raw)
         result = defaultdict(dict)
         for film in films_raw:
             mv = RawMovies(**film)
@@ -63,6 +72,18 @@ class DataTransform(object):
             result[id] = data
         return result
 
+    def transform_film_documents(self, films):
+        """Собрать FilmElastick из строк, где составы уже агрегированы SQL."""
+        result = {}
+        for film in films:
+            data = FilmElastick(**film)
+            data.actors_names = {person.name for person in data.actors}
+            data.writers_names = {person.name for person in data.writers}
+            data.directors_names = {person.name for person in data.directors}
+            data.genres_names = [genre.name for genre in data.genres]
+            result[data.id] = data
+        return result
+
     def transform_persons(self, get_data):
         result = defaultdict(dict)
         for person in get_data:
@@ -71,8 +92,10 @@ class DataTransform(object):
             data = result[id]
             if not data:
                 data = PersonElastic(**p_raw.dict())
-            data.role.add(p_raw.role_raw)
-            data.film_ids.add(p_raw.film_work_id)
+            if p_raw.role_raw:
+                data.role.add(p_raw.role_raw)
+            if p_raw.film_work_id:
+                data.film_ids.add(p_raw.film_work_id)
             result[id] = data
         return result
 
@@ -85,6 +108,61 @@ class DataTransform(object):
             if not data:
                 data = GenreElastic(**genre_raw.dict())
             data.description = genre_raw.description
-            data.film_ids.add(genre_raw.film_work_id)
+            if genre_raw.film_work_id:
+                data.film_ids.add(genre_raw.film_work_id)
             result[id] = data
         return result
+
+    def stream_groups(self, rows, key, transform):
+        """
+        Отдавать документы по одному, пока строки ещё читаются.
+
+        Строки должны идти подряд по key (запросы данных сортируют
+        их), поэтому в работе всегда только одна сущность: документ
+        собирается тем же transform и отдаётся, как только key сменился.
+        Порядок проверяется сравнением с предыдущим key: сущность,
+        разорванная другими строками, дала бы два неполных документа.
+
+        Yields:
+            BaseModel: документ очередной сущности
+
+        Raises:
+            ValueError: строки не упорядочены по key
+        """
+        previous = None
+        for group_key, group_rows in groupby(rows, key=itemgetter(key)):
+            if previous is not None and group_key < previous:
+                raise ValueError(UNSORTED_ROWS.format(
+                    key=key, value=group_key, previous=previous,
+                ))
+            previous = group_key
+            yield from transform(group_rows).values()
+
+    def stream_film(self, films_raw):
+        return self.stream_groups(films_raw, 'fw_id', self.transform_film)
+
+    def stream_persons(self, get_data):
+        return self.stream_groups(get_data, 'id', self.transform_persons)
+
+    def stream_genres(self, get_data):
+        return self.stream_groups(get_data, 'id', self.transform_genres)
+
+    def transform_pages(self, rows, key, transform, page_size):
+        """
+        Документы упорядоченного по key потока строк, страницами.
+
+        Страница набирается примерно из page_size строк и режется только
+        на смене key, поэтому сущность не делится между страницами,
+        а transform получает готовую пачку.
+
+        Yields:
+            list: документы одной страницы
+        """
+        page = []
+        for row in rows:
+            if len(page) >= page_size and row[key] != page[-1][key]:
+                yield list(transform(page).values())
+                page = []
+            page.append(row)
+        if page:
+            yield list(transform(page).values())
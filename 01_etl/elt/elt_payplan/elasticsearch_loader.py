@@ -1,9 +1,69 @@
-from typing import Generator, List
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Generator, Iterable, List
 
-from elasticsearch import Elasticsearch, helpers
+import orjson
+from elasticsearch import ApiError, Elasticsearch, TransportError
 
-from pydantic_models import Film
-from utils.backoff import backoff
+from elt_payplan.backpressure import BackpressureMonitor, backpressure_slot
+from pydantic_models import FilmElastick
+from utils.backoff import backoff, jittered_sleep_time
+from utils.dead_letter import BaseDeadLetterStorage
+from utils.fingerprint import FingerprintCache
+from utils.logger import get_logger
+
+# Оценка строки действия {"index": {"_index": ..., "_id": ...}} в _bulk.
+ACTION_LINE_BYTES = 100
+# Ответы, после которых документ имеет смысл отправить повторно.
+RETRY_STATUSES = frozenset((429, 502, 503, 504))
+# Частичное обновление документа, которого ещё нет в индексе, не ошибка:
+# документ целиком запишется, когда ETL дойдёт до его строки.
+IGNORED_UPDATE_ERRORS = frozenset(('document_missing_exception',))
+# Запись с версией (снимок Postgres) не старее той, что уже в индексе;
+# отказ по версии значит, что более свежий снимок уже записан.
+VERSION_TYPE = 'external_gte'
+IGNORED_VERSION_ERRORS = frozenset(('version_conflict_engine_exception',))
+RETRY_ITEMS = 'Bulk {index}: повтор {count} док. через {sleep:.2f} с'
+DEAD_LETTER_ITEMS = 'Bulk {index}: {count} док. отправлено в dead letter'
+FINGERPRINT_STATS = (
+    'Bulk {index}: без изменений пропущено {hits}, отправлено {misses}'
+)
+UPDATE_BY_QUERY_TIMEOUT = 600
+MIN_ELAPSED = 1e-6
+MAX_CHUNK_BYTES = 10 * 1024 * 1024
+UPDATE_BY_QUERY_STATS = ''.join((
+    'Update by query {index}: изменено {updated}, без изменений {noops}, ',
+    'конфликтов {conflicts}',
+))
+UPDATE_BY_QUERY_CONFLICTS = (
+    'Update by query {index}: конфликты остались после {retries} повторов'
+)
+CHUNK_STATS = ''.join((
+    'Bulk {index}: {docs} док., {size} байт за {elapsed:.3f} с ',
+    '({docs_rate:.0f} док./с, {bytes_rate:.0f} байт/с)',
+))
+
+
+def encode_default(value):
+    """
+    Типы, которые orjson не сериализует сам (множества в моделях).
+
+    Raises:
+        TypeError: тип не поддерживается
+    """
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError
+
+
+def encode_source(source) -> bytes:
+    return orjson.dumps(source, default=encode_default)
+
+
+def action_size(action: dict) -> int:
+    """Размер действия в теле _bulk: строка действия и _source."""
+    return len(action.get('_source', b'')) + ACTION_LINE_BYTES
 
 
 class ElasticConnector(object):
@@ -11,7 +71,7 @@ class ElasticConnector(object):
         self.elastic_dsl = elastic_dsl
         self.client = None
 
-    @backoff
+    @backoff()
     def __enter__(self):
         self.client = Elasticsearch(**self.elastic_dsl)
         if not self.client.ping():
@@ -22,18 +82,366 @@ class ElasticConnector(object):
         self.client.close()
 
 
-class ElasticsearchLoader(ElasticConnector):
+class ElasticsearchLoader(ElasticConnector):  # noqa: WPS214, WPS230
+    def __init__(  # noqa: WPS211
+        self,
+        elastic_dsl,
+        thread_count=1,
+        chunk_size=500,
+        max_chunk_bytes=MAX_CHUNK_BYTES,
+        max_retries=5,
+        dead_letter: BaseDeadLetterStorage = None,
+        fingerprints: FingerprintCache = None,
+        backpressure: BackpressureMonitor = None,
+    ):
+        super().__init__(elastic_dsl)
+        self.thread_count = thread_count
+        self.chunk_size = chunk_size
+        self.max_chunk_bytes = max_chunk_bytes
+        self.max_retries = max_retries
+        self.dead_letter = dead_letter
+        self.fingerprints = fingerprints
+        self.backpressure = backpressure
+        self.rejections = 0
+        self.stats_lock = threading.Lock()
+        self.logging = get_logger(__name__)
 
-    def generate_elastic_data(self, index, data: List[Film]) -> Generator:
-        yield from (
-            {
-                'index': index,
+    def __enter__(self):
+        super().__enter__()
+        if self.backpressure is not None:
+            self.backpressure.bind(self.client)
+        return self
+
+    def generate_elastic_data(
+        self, index, data: List[FilmElastick], version: int = None,
+    ) -> Generator:
+        for item in data:
+            action = {
+                '_index': index,
                 '_id': item.id,
-                '_source': item.json(),
+                '_source': encode_source(item.dict()),
+            }
+            if version is not None:
+                action['_version'] = version
+            yield action
+
+    def chunk_actions(self, actions: Iterable[dict]) -> Generator:
+        """
+        Разбить действия на пачки, ограниченные числом документов и байтами.
+
+        Размер считается по сериализованному _source и строке действия,
+        как они уйдут в тело _bulk, поэтому фильмы с большим составом
+        не дают пачке превысить http.max_content_length.
+
+        Yields:
+            tuple: пачка действий и её размер в байтах
+        """
+        chunk = []
+        chunk_bytes = 0
+        for action in actions:
+            action_bytes = action_size(action)
+            full = len(chunk) >= self.chunk_size
+            oversized = chunk_bytes + action_bytes > self.max_chunk_bytes
+            if chunk and (full or oversized):
+                yield chunk, chunk_bytes
+                chunk = []
+                chunk_bytes = 0
+            chunk.append(action)
+            chunk_bytes += action_bytes
+        if chunk:
+            yield chunk, chunk_bytes
+
+    def encode_bulk_body(self, actions: List[dict]) -> bytes:
+        """
+        Собрать тело _bulk в один буфер байт.
+
+        _source уже закодирован orjson, поэтому клиент Elasticsearch
+        отправляет тело как есть, без повторной сериализации строк.
+        """
+        lines = []
+        for action in actions:
+            op_type = action.get('_op_type', 'index')
+            meta = {'_index': action['_index'], '_id': action['_id']}
+            version = action.get('_version')
+            if version is not None:
+                meta['version'] = version
+                meta['version_type'] = VERSION_TYPE
+            lines.append(orjson.dumps({op_type: meta}))
+            if op_type != 'delete':
+                lines.append(action['_source'])
+        lines.append(b'')
+        return b'\n'.join(lines)
+
+    def send_actions(self, index, actions: List[dict]) -> List[str]:
+        """
+        Отправить действия в _bulk, повторяя только неуспешные документы.
+
+        Ответ разбирается по элементам: отклонённые кластером (429, 5xx)
+        документы отправляются повторно с экспоненциальной задержкой
+        и джиттером, остальные ошибки и документы, исчерпавшие попытки,
+        уходят в dead letter. Возвращает _id документов из dead letter.
+
+        Raises:
+            ApiError: ошибка запроса, после которой повтор бесполезен
+        """
+        pending, retries, dead_ids = actions, 0, []
+        while pending:
+            try:
+                response = self.client.bulk(
+                    operations=self.encode_bulk_body(pending),
+                )
+            except ApiError as exception:
+                if exception.meta.status not in RETRY_STATUSES:
+                    raise
+                retry, failed = pending, []
+            except TransportError:
+                retry, failed = pending, []
+            else:
+                retry, failed = self.split_failed_items(pending, response)
+
+            if retry:
+                with self.stats_lock:
+                    self.rejections += len(retry)
+            if retry and retries >= self.max_retries:
+                failed.extend(
+                    (action, {'status': None, 'error': 'max retries'})
+                    for action in retry
+                )
+                retry = []
+            self.save_dead_letter(index, failed)
+            dead_ids.extend(action['_id'] for action, _ in failed)
+            if retry:
+                sleep_time = jittered_sleep_time(retries)
+                self.logging.warning(RETRY_ITEMS.format(
+                    index=index, count=len(retry), sleep=sleep_time,
+                ))
+                time.sleep(sleep_time)
+                retries += 1
+            pending = retry
+        return dead_ids
+
+    def split_failed_items(self, actions: List[dict], response) -> tuple:
+        """Разделить неуспешные элементы ответа _bulk на повторяемые и нет."""
+        retry, failed = [], []
+        if not response['errors']:
+            return retry, failed
+        for action, item in zip(actions, response['items']):
+            item_result = next(iter(item.values()))
+            if 'error' not in item_result:
+                continue
+            if self.is_ignored_error(action, item_result):
+                continue
+            if item_result['status'] in RETRY_STATUSES:
+                retry.append(action)
+            else:
+                failed.append((action, item_result))
+        return retry, failed
+
+    def is_ignored_error(self, action: dict, item_result: dict) -> bool:
+        error = item_result['error']
+        error_type = error.get('type') if isinstance(error, dict) else None
+        if action.get('_op_type') == 'update':
+            return error_type in IGNORED_UPDATE_ERRORS
+        return '_version' in action and error_type in IGNORED_VERSION_ERRORS
+
+    def save_dead_letter(self, index, failed: list) -> None:
+        if not failed:
+            return
+        self.logging.error(DEAD_LETTER_ITEMS.format(
+            index=index, count=len(failed),
+        ))
+        if self.dead_letter is not None:
+            self.dead_letter.save([
+                {
+                    'index': action['_index'],
+                    'id': action['_id'],
+                    'op_type': action.get('_op_type', 'index'),
+                    'status': item_result.get('status'),
+                    'error': item_result.get('error'),
+                    'source': action.get('_source', b'').decode('utf8'),
+                }
+                for action, item_result in failed
+            ])
+
+    def send_chunk(self, index, chunk: List[dict], chunk_bytes: int) -> None:
+        """Отправить одну пачку и записать метрики."""
+        fingerprints = {}
+        if self.fingerprints is not None:
+            chunk, fingerprints = self.fingerprints.changed(index, chunk)
+            self.logging.info(FINGERPRINT_STATS.format(
+                index=index,
+                hits=self.fingerprints.hits,
+                misses=self.fingerprints.misses,
+            ))
+            if not chunk:
+                return
+            chunk_bytes = sum(action_size(action) for action in chunk)
+        start = time.monotonic()
+        with backpressure_slot(self.backpressure):
+            dead_ids = self.send_actions(index, chunk)
+        if fingerprints:
+            for dead_id in dead_ids:
+                fingerprints.pop(dead_id, None)
+            self.fingerprints.save(index, fingerprints)
+        elapsed = max(time.monotonic() - start, MIN_ELAPSED)
+        self.logging.info(CHUNK_STATS.format(
+            index=index,
+            docs=len(chunk),
+            size=chunk_bytes,
+            elapsed=elapsed,
+            docs_rate=len(chunk) / elapsed,
+            bytes_rate=chunk_bytes / elapsed,
+        ))
+
+    def parallel_send_actions(self, index, actions: Iterable[dict]) -> None:
+        """
+        Отправить действия пачками в thread_count параллельных запросов.
+
+        В полёте держится не больше 2 * thread_count пачек, чтобы генератор
+        документов не вычитывался в память целиком.
+        """
+        in_flight = set()
+        with ThreadPoolExecutor(max_workers=self.thread_count) as executor:
+            for chunk, chunk_bytes in self.chunk_actions(actions):
+                if len(in_flight) >= self.thread_count * 2:
+                    done, in_flight = wait(
+                        in_flight, return_when=FIRST_COMPLETED,
+                    )
+                    for finished in done:
+                        finished.result()
+                in_flight.add(executor.submit(
+                    self.send_chunk, index, chunk, chunk_bytes,
+                ))
+            for future in in_flight:
+                future.result()
+
+    def send_bulk_actions(self, index, actions: Iterable[dict]) -> None:
+        """
+        Отправить готовые действия _bulk (_source уже в байтах).
+
+        index - подпись для логов и отпечатков, сами действия могут
+        относиться к разным индексам.
+        """
+        if self.thread_count > 1:
+            self.parallel_send_actions(index, actions)
+            return
+        for chunk, chunk_bytes in self.chunk_actions(actions):
+            self.send_chunk(index, chunk, chunk_bytes)
+
+    def bulk_data_to_elastic(
+        self, index, data: List[FilmElastick], version: int = None,
+    ) -> None:
+        """
+        Записать документы; с version - только если в индексе не новее.
+
+        version - момент снимка Postgres, из которого собраны документы:
+        запись более старого снимка Elasticsearch отклонит сам.
+        """
+        self.send_bulk_actions(
+            index, self.generate_elastic_data(index, data, version),
+        )
+
+    def delete_from_elastic(self, index, ids: List[str]) -> None:
+        """
+        Удалить документы из индекса действиями delete в _bulk.
+
+        Ответ 404 на delete не считается ошибкой, поэтому повторное
+        удаление уже удалённого документа безопасно. Отпечатки удалённых
+        документов забываются, чтобы их можно было создать заново.
+        """
+        actions = (
+            {'_op_type': 'delete', '_index': index, '_id': document_id}
+            for document_id in ids
+        )
+        for chunk, chunk_bytes in self.chunk_actions(actions):
+            self.send_chunk(index, chunk, chunk_bytes)
+        if self.fingerprints is not None:
+            self.fingerprints.forget(index, list(ids))
+
+    def get_sources(self, index, ids: List[str], fields) -> dict:
+        """Прочитать поля fields документов одним mget: _id -> _source."""
+        response = self.client.mget(
+            index=index, ids=list(ids), source_includes=list(fields),
+        )
+        return {
+            document['_id']: document['_source']
+            for document in response['docs']
+            if document.get('found')
+        }
+
+    def get_versions(self, index, ids: List[str]) -> dict:
+        """Версии существующих документов одним mget: _id -> _version."""
+        response = self.client.mget(index=index, ids=list(ids), source=False)
+        return {
+            document['_id']: document['_version']
+            for document in response['docs']
+            if document.get('found')
+        }
+
+    def update_documents(self, index, updates: dict) -> None:
+        """
+        Частично обновить документы действиями update в _bulk.
+
+        updates - тела update (doc или script) по _id. Отпечатки
+        обновлённых документов забываются: тело в индексе уже
+        не совпадает с сохранённым.
+        """
+        if not updates:
+            return
+        actions = (
+            {
+                '_op_type': 'update',
+                '_index': index,
+                '_id': document_id,
+                '_source': encode_source(body),
             }
-            for item in data
+            for document_id, body in updates.items()
         )
+        for chunk, chunk_bytes in self.chunk_actions(actions):
+            self.send_chunk(index, chunk, chunk_bytes)
+        if self.fingerprints is not None:
+            self.fingerprints.forget(index, list(updates))
+
+    def update_by_query(
+        self, index, query: dict, script: dict, document_ids=(),
+    ) -> None:
+        """
+        Изменить скриптом все документы индекса, подходящие под запрос.
+
+        Документ, который параллельно переписали, даёт конфликт версии
+        и остаётся без изменений: его новая версия могла быть собрана
+        до изменения в Postgres. Поэтому при конфликтах запрос
+        повторяется (скрипт идемпотентен, уже исправленные документы
+        дают noop), а после max_retries повторов поднимается ошибка,
+        чтобы пачка не была отмечена обработанной. document_ids -
+        известные затронутые документы, их отпечатки забываются.
 
-    @backoff
-    def bulk_data_to_elastic(self, index, data: List[Film]) -> None:
-        helpers.bulk(self.client, self.generate_elastic_data(index, data))
+        Raises:
+            RuntimeError: конфликты остались после всех повторов
+        """
+        if self.fingerprints is not None:
+            self.fingerprints.forget(index, list(document_ids))
+        for retries in range(self.max_retries + 1):
+            if retries:
+                time.sleep(jittered_sleep_time(retries))
+            response = self.client.options(
+                request_timeout=UPDATE_BY_QUERY_TIMEOUT,
+            ).update_by_query(
+                index=index,
+                query=query,
+                script=script,
+                conflicts='proceed',
+                slices='auto',
+            )
+            conflicts = response.get('version_conflicts', 0)
+            self.logging.info(UPDATE_BY_QUERY_STATS.format(
+                index=index,
+                updated=response.get('updated', 0),
+                noops=response.get('noops', 0),
+                conflicts=conflicts,
+            ))
+            if not conflicts:
+                return
+        raise RuntimeError(UPDATE_BY_QUERY_CONFLICTS.format(
+            index=index, retries=self.max_retries,
+        ))
@@ -0,0 +1,261 @@
+from collections import defaultdict
+from typing import Iterable, List
+
+from elastic_index import INDEX
+from elt_payplan.elasticsearch_loader import ElasticsearchLoader
+from elt_payplan.tables import TRANSFORM_INDEX
+from pydantic_models import FilmElastick
+from utils.logger import get_logger
+
+MOVIES_INDEX = 'movies'
+PERSON_FIELDS = ('actors', 'writers', 'directors')
+GENRE_FIELDS = ('genres',)
+# Индекс персон или жанров -> поля документа фильма, где они перечислены.
+MOVIE_FIELDS = {
+    TRANSFORM_INDEX['persons']['index_name']: PERSON_FIELDS,
+    TRANSFORM_INDEX['genres']['index_name']: GENRE_FIELDS,
+}
+MAPPING_MISMATCH = ''.join((
+    'Поле {field} индекса {index} имеет тип {type}, ожидается nested: ',
+    'нужна переиндексация (reindex.py)',
+))
+MAPPING_MIGRATED = ''.join((
+    'В индекс {index} добавлены поля {fields}; документы, записанные ',
+    'раньше, получат их при переиндексации (reindex.py)',
+))
+LINK_FIELDS = tuple(
+    '{field}.id'.format(field=field) for field in PERSON_FIELDS + GENRE_FIELDS
+)
+# Меняет только film_ids; если состав не изменился, документ не
+# переписывается (noop).
+FILM_IDS_SCRIPT = """
+if (ctx._source.film_ids == null) {
+    ctx._source.film_ids = new ArrayList();
+}
+def film_ids = ctx._source.film_ids;
+def before = new HashSet(film_ids);
+film_ids.removeAll(params.remove);
+for (film_id in params.add) {
+    if (!film_ids.contains(film_id)) {
+        film_ids.add(film_id);
+    }
+}
+if (new HashSet(film_ids).equals(before)) {
+    ctx.op = 'noop';
+}
+"""
+
+# Переименование в документах фильмов: правит name у вложенных объектов
+# и пересобирает поле *_names без повторов, как DataTransform.
+RENAME_SCRIPT = """
+boolean changed = false;
+for (field in params.fields) {
+    def items = ctx._source[field];
+    if (items == null) {
+        continue;
+    }
+    def names = new ArrayList();
+    for (item in items) {
+        def name = params.names[item['id']];
+        if (name != null && item['name'] != name) {
+            item['name'] = name;
+            changed = true;
+        }
+        if (!names.contains(item['name'])) {
+            names.add(item['name']);
+        }
+    }
+    ctx._source[field + '_names'] = names;
+}
+if (!changed) {
+    ctx.op = 'noop';
+}
+"""
+
+
+def ensure_movie_mapping(es_conn: ElasticsearchLoader) -> None:
+    """
+    Проверить, что в movies есть вложенные поля персон и жанров.
+
+    По ним propagate_renames находит фильмы и правит имена; без них
+    _update_by_query ничего бы не находил. Недостающие поля (и поля
+    имён при них) добавляются в маппинг из elastic_index.INDEX, поле
+    другого типа поменять на месте нельзя - тогда ETL не запускается.
+    Индекса ещё нет - проверять нечего, его создаст reindex.py.
+
+    Raises:
+        ValueError: поле есть, но не nested
+    """
+    client = es_conn.client
+    if not client.indices.exists(index=MOVIES_INDEX):
+        return
+    mappings = client.indices.get_mapping(index=MOVIES_INDEX)
+    expected = INDEX['mappings']['properties']
+    missing = {}
+    for index_mapping in mappings.values():
+        properties = index_mapping['mappings'].get('properties', {})
+        for field in PERSON_FIELDS + GENRE_FIELDS:
+            field_type = properties.get(field, {}).get('type')
+            if field_type is None:
+                names_field = '{field}_names'.format(field=field)
+                missing[field] = expected[field]
+                missing[names_field] = expected[names_field]
+            elif field_type != 'nested':
+                raise ValueError(MAPPING_MISMATCH.format(
+                    field=field, index=MOVIES_INDEX, type=field_type,
+                ))
+    if missing:
+        client.indices.put_mapping(index=MOVIES_INDEX, properties=missing)
+        get_logger(__name__).warning(MAPPING_MIGRATED.format(
+            index=MOVIES_INDEX, fields=', '.join(sorted(missing)),
+        ))
+
+
+def linked_ids(source: dict, fields: tuple) -> set:
+    """Идентификаторы персон или жанров из документа фильма."""
+    return {
+        item['id']
+        for field in fields
+        for item in source.get(field) or []
+    }
+
+
+def add_changes(changes: dict, doc_ids: set, film_id: str, key: str):
+    for doc_id in doc_ids:
+        doc_changes = changes.setdefault(doc_id, {'add': [], 'remove': []})
+        doc_changes[key].append(film_id)
+
+
+def film_link_changes(old_sources: dict, new_sources: dict) -> dict:
+    """
+    Какие фильмы добавить в film_ids персон и жанров, а какие убрать.
+
+    Сравниваются составы фильма в индексе movies до записи и после:
+    персона, появившаяся в фильме, получает его id, пропавшая - теряет.
+    Фильмы без нового документа (удалённые) убираются отовсюду.
+    """
+    changes = {
+        TRANSFORM_INDEX['persons']['index_name']: {},
+        TRANSFORM_INDEX['genres']['index_name']: {},
+    }
+    film_ids = set(old_sources) | set(new_sources)
+    for film_id in film_ids:
+        old_source = old_sources.get(film_id, {})
+        new_source = new_sources.get(film_id, {})
+        for index_name, fields in zip(changes, (PERSON_FIELDS, GENRE_FIELDS)):
+            old_ids = linked_ids(old_source, fields)
+            new_ids = linked_ids(new_source, fields)
+            add_changes(changes[index_name], new_ids - old_ids, film_id, 'add')
+            add_changes(
+                changes[index_name], old_ids - new_ids, film_id, 'remove',
+            )
+    return changes
+
+
+def propagate_film_links(
+    es_conn: ElasticsearchLoader,
+    films: Iterable[FilmElastick] = (),
+    deleted_ids: List[str] = (),
+) -> None:
+    """
+    Обновить film_ids персон и жанров по изменениям фильмов.
+
+    Вызывается до записи фильмов в movies: старые составы читаются
+    одним mget, а в индексы persons и genres уходят точечные scripted
+    update, без повторного извлечения всех фильмов персоны.
+    """
+    new_sources = {film.id: film.dict() for film in films}
+    film_ids = list(new_sources) + list(deleted_ids)
+    if not film_ids:
+        return
+    old_sources = es_conn.get_sources(MOVIES_INDEX, film_ids, LINK_FIELDS)
+    changes = film_link_changes(old_sources, new_sources)
+    for index_name, index_changes in changes.items():
+        es_conn.update_documents(index_name, {
+            doc_id: {'script': {
+                'source': FILM_IDS_SCRIPT,
+                'lang': 'painless',
+                'params': doc_changes,
+            }}
+            for doc_id, doc_changes in index_changes.items()
+        })
+
+
+def settled_link_ids(
+    es_conn: ElasticsearchLoader, table: dict, index_rows: list,
+) -> set:
+    """
+    Записи, у которых изменились только собственные атрибуты.
+
+    Если набор фильмов персоны или жанра в Postgres совпадает с film_ids
+    уже проиндексированного документа, её фильмы пересобирать не нужно:
+    имя в них поправит propagate_renames.
+    """
+    film_ids = defaultdict(set)
+    for row in index_rows:
+        row_film_ids = film_ids[str(row['id'])]
+        if row['film_work_id']:
+            row_film_ids.add(str(row['film_work_id']))
+    if not film_ids:
+        return set()
+    old_sources = es_conn.get_sources(
+        table['transform_index']['index_name'],
+        list(film_ids),
+        fields=('film_ids',),
+    )
+    return {
+        doc_id
+        for doc_id, doc_film_ids in film_ids.items()
+        if doc_id in old_sources
+        and set(old_sources[doc_id].get('film_ids') or []) == doc_film_ids
+    }
+
+
+def propagate_renames(
+    es_conn: ElasticsearchLoader, index_name: str, documents: list,
+) -> None:
+    """
+    Поправить имена персон или жанров прямо в документах фильмов.
+
+    Вызывается до записи документов index_name: изменённые имена
+    находятся сравнением со старыми документами, и один
+    _update_by_query по вложенным id меняет только эти поля.
+    """
+    new_names = {document.id: document.name for document in documents}
+    if not new_names:
+        return
+    old_sources = es_conn.get_sources(
+        index_name,
+        list(new_names),
+        fields=('name', 'film_ids'),
+    )
+    renames = {
+        doc_id: name
+        for doc_id, name in new_names.items()
+        if doc_id in old_sources and old_sources[doc_id].get('name') != name
+    }
+    if not renames:
+        return
+    fields = MOVIE_FIELDS[index_name]
+    es_conn.update_by_query(
+        MOVIES_INDEX,
+        query={'bool': {'should': [
+            {'nested': {
+                'path': field,
+                'query': {'terms': {
+                    '{field}.id'.format(field=field): list(renames),
+                }},
+            }}
+            for field in fields
+        ]}},
+        script={
+            'source': RENAME_SCRIPT,
+            'lang': 'painless',
+            'params': {'fields': list(fields), 'names': renames},
+        },
+        document_ids=[
+            film_id
+            for doc_id in renames
+            for film_id in old_sources[doc_id].get('film_ids') or []
+        ],
+    )
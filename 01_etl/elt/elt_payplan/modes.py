@@ -0,0 +1,217 @@
+import time
+
+from elt_payplan.change_log import sync_change_log
+from elt_payplan.change_set import ChangeSet, rebuild_films, sync_change_set
+from elt_payplan.checkpoint import (
+    checkpoint_name,
+    checkpoint_value,
+    get_checkpoint,
+    set_checkpoint,
+)
+from elt_payplan.data_transformer import DataTransform
+from elt_payplan.elasticsearch_loader import ElasticsearchLoader
+from elt_payplan.postgres_extractor import PostgresExtractor
+from elt_payplan.replication import sync_replication
+from elt_payplan.stages import extract_batch, load_batch, stream_batch
+from utils.batch_size import AdaptiveBatchSize
+from utils.lease import ShardLeases
+from utils.state import State
+
+NOTIFY_FILMS_LIMIT = 100
+STAGE_EXTRACT = 'выборка'
+STAGE_LOAD = 'преобразование и загрузка'
+
+
+def loader_es(  # noqa: WPS211
+    state: State,
+    pg_conn: PostgresExtractor,
+    table: dict,
+    es_conn: ElasticsearchLoader,
+    transformer: DataTransform,
+    batch_size: AdaptiveBatchSize,
+    shard: tuple = None,
+    leases: ShardLeases = None,
+):
+    """
+    Перенести изменённые строки таблицы или её шарда пачками.
+
+    С leases шард обрабатывается, только пока его аренда у воркера:
+    она проверяется перед каждой пачкой, а контрольная точка пишется
+    атомарно вместе с проверкой владельца.
+    """
+    table_name = table['name']
+    state_name = checkpoint_name(table_name, shard)
+    checkpoint = get_checkpoint(state, state_name)
+    while leases is None or leases.owns(shard[0]):
+        limit = batch_size.size
+        rejections = es_conn.rejections
+        with batch_size.measure():
+            with batch_size.stage(STAGE_EXTRACT):
+                modified_ids = pg_conn.get_modified_page(
+                    table_name, checkpoint, limit, shard=shard,
+                )
+                if not modified_ids:
+                    break
+                extracted = extract_batch(
+                    pg_conn,
+                    table,
+                    [item['id'] for item in modified_ids],
+                    es_conn=es_conn,
+                )
+            with batch_size.stage(STAGE_LOAD):
+                docs = load_batch(
+                    es_conn, stream_batch(transformer, table, extracted),
+                )
+        if leases is None:
+            set_checkpoint(state, state_name, modified_ids[-1])
+        else:
+            value = checkpoint_value(modified_ids[-1])
+            if not leases.set_if_owner(shard[0], state_name, value):
+                break
+        batch_size.record(
+            len(modified_ids), docs, es_conn.rejections - rejections,
+        )
+        if len(modified_ids) < limit:
+            break
+        checkpoint = (modified_ids[-1]['modified'], modified_ids[-1]['id'])
+
+
+def proccess(  # noqa: WPS211
+    logging, state, pg_conn, es_conn, tables_pg, transformer, batch_sizes,
+):
+    try:
+        with pg_conn, es_conn:
+            for table in tables_pg:
+                loader_es(
+                    state,
+                    pg_conn,
+                    table,
+                    es_conn,
+                    transformer,
+                    batch_sizes[table['name']],
+                )
+    except Exception as exception:
+        logging.error(exception)
+
+
+def proccess_shards(  # noqa: WPS211
+    logging,
+    state,
+    pg_conn,
+    es_conn,
+    tables_pg,
+    transformer,
+    batch_sizes,
+    leases,
+):
+    """Обработать шарды, аренду которых удалось взять или продлить."""
+    try:
+        with pg_conn, es_conn:
+            for shard in leases.rebalance():
+                for table in tables_pg:
+                    loader_es(
+                        state,
+                        pg_conn,
+                        table,
+                        es_conn,
+                        transformer,
+                        batch_sizes[table['name']],
+                        shard=(shard, leases.shards),
+                        leases=leases,
+                    )
+    except Exception as exception:
+        logging.error(exception)
+
+
+def proccess_change_set(  # noqa: WPS211
+    logging, state, pg_conn, es_conn, tables_pg, transformer, change_set,
+):
+    try:
+        with pg_conn, es_conn:
+            sync_change_set(
+                state, pg_conn, es_conn, transformer, tables_pg, change_set,
+            )
+    except Exception as exception:
+        logging.error(exception)
+
+
+def proccess_change_log(logging, pg_conn, es_conn, transformer):
+    try:
+        with pg_conn, es_conn:
+            sync_change_log(pg_conn, es_conn, transformer)
+    except Exception as exception:
+        logging.error(exception)
+
+
+def proccess_replication(  # noqa: WPS211
+    logging, state, reader, pg_conn, es_conn, transformer, duration, timeout,
+):
+    try:
+        with pg_conn, es_conn:
+            sync_replication(
+                state,
+                reader,
+                pg_conn,
+                es_conn,
+                transformer,
+                duration,
+                timeout=timeout,
+            )
+    except Exception as exception:
+        logging.error(exception)
+
+
+def proccess_pipeline(logging, es_conn, pipeline):
+    try:
+        with es_conn:
+            pipeline.run()
+    except Exception as exception:
+        logging.error(exception)
+
+
+def proccess_notifications(logging, pg_conn, es_conn, transformer, changes):
+    """
+    Пересобрать фильмы, изменённые через таблицы связей.
+
+    Изменения genre, person и film_work подхватит следующий цикл по
+    modified, а строки person_film_work и genre_film_work в нём не видны,
+    поэтому фильмы из их уведомлений пересобираются сразу.
+    """
+    notified_films = ChangeSet()
+    notified_films.add({
+        change['film_work_id']
+        for change in changes
+        if change.get('film_work_id')
+    })
+    if not notified_films:
+        return
+    try:
+        with pg_conn, es_conn:
+            rebuild_films(
+                pg_conn,
+                es_conn,
+                transformer,
+                notified_films,
+                NOTIFY_FILMS_LIMIT,
+            )
+    except Exception as exception:
+        logging.error(exception)
+
+
+def wait_for_changes(logging, listener, poll_interval: float) -> list:
+    """
+    Дождаться следующего цикла синхронизации.
+
+    Без listener это пауза poll_interval. С ним цикл начинается по
+    уведомлению Postgres, но не позже чем через poll_interval;
+    возвращаются полученные уведомления.
+    """
+    if listener is None:
+        time.sleep(poll_interval)
+        return []
+    changes = listener.wait(poll_interval)
+    if changes:
+        logging.info('Получено уведомлений об изменениях: {count}'.format(
+            count=len(changes),
+        ))
+    return changes
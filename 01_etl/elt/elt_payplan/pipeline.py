@@ -0,0 +1,210 @@
+import queue
+import threading
+import time
+
+from elt_payplan.checkpoint import checkpoint_value, get_checkpoint
+from elt_payplan.data_transformer import DataTransform
+from elt_payplan.elasticsearch_loader import ElasticsearchLoader
+from elt_payplan.postgres_extractor import PostgresExtractor
+from elt_payplan.stages import extract_batch, load_batch, transform_batch
+from utils.logger import get_logger
+from utils.state import State
+
+STOP = object()
+QUEUE_TIMEOUT = 0.5
+
+
+class CheckpointTracker(object):
+    """
+    Продвижение контрольных точек при параллельной обработке пачек.
+
+    Пачки завершаются в произвольном порядке, поэтому контрольная точка
+    таблицы сдвигается только по непрерывному префиксу завершённых пачек.
+    """
+
+    def __init__(self, state: State):
+        self.state = state
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.done = set()
+        self.next_seq = 0
+
+    def register(self, seq: int, table_name: str, row) -> None:
+        with self.lock:
+            self.pending[seq] = (table_name, row)
+
+    def complete(self, seq: int) -> None:
+        with self.lock:
+            self.done.add(seq)
+            checkpoints = {}
+            while self.next_seq in self.done:
+                self.done.remove(self.next_seq)
+                table_name, row = self.pending.pop(self.next_seq)
+                checkpoints[table_name] = checkpoint_value(row)
+                self.next_seq += 1
+            if checkpoints:
+                self.state.set_states(checkpoints)
+
+
+class PipelineRunner(object):  # noqa: WPS214, WPS230
+    """
+    Конвейер extract -> transform -> load на потоках.
+
+    Стадии связаны ограниченными очередями: пока пачка N загружается
+    в Elasticsearch, пачка N+1 уже извлекается из Postgres, а размер
+    очередей ограничивает число пачек в памяти (backpressure).
+
+    Пачки с одним фильмом извлекаются параллельно и могут прийти
+    в load в любом порядке, поэтому каждая помечается моментом снимка
+    Postgres и пишется с этой версией: устаревший снимок не затирает
+    более свежий документ. Загрузка идёт в один поток, чтобы чтение
+    старых составов и пересчёт film_ids не пересекались; параллельны
+    только bulk-запросы внутри неё (bulk_threads).
+    """
+
+    def __init__(  # noqa: WPS211
+        self,
+        postgres_dsl: dict,
+        es_conn: ElasticsearchLoader,
+        state: State,
+        tables: list,
+        queue_size: int = 4,
+        extract_workers: int = 1,
+        transform_workers: int = 1,
+        limit: int = 100,
+        aggregate_films: bool = False,
+        checkpoint_lag: float = 0,
+        transformer: DataTransform = None,
+    ):
+        self.postgres_dsl = postgres_dsl
+        self.es_conn = es_conn
+        self.state = state
+        self.tables = tables
+        self.queue_size = queue_size
+        self.extract_workers = extract_workers
+        self.transform_workers = transform_workers
+        self.limit = limit
+        self.aggregate_films = aggregate_films
+        self.checkpoint_lag = checkpoint_lag
+        self.transformer = transformer or DataTransform(
+            aggregate_films=aggregate_films,
+        )
+        self.logging = get_logger(__name__)
+        self.failed = threading.Event()
+        self.errors = []
+
+    def run(self) -> None:
+        self.failed.clear()
+        self.errors = []
+        tracker = CheckpointTracker(self.state)
+        extract_queue = queue.Queue(maxsize=self.queue_size)
+        transform_queue = queue.Queue(maxsize=self.queue_size)
+        load_queue = queue.Queue(maxsize=self.queue_size)
+        extract_args = (extract_queue, transform_queue)
+        transform_args = (transform_queue, load_queue)
+        load_args = (load_queue, tracker)
+        stages = [
+            (self.extract_workers, self._extract_worker, extract_args),
+            (self.transform_workers, self._transform_worker, transform_args),
+            (1, self._load_worker, load_args),
+        ]
+        workers = [
+            [
+                self._start(target, *args)
+                for _ in range(workers_count)
+            ]
+            for workers_count, target, args in stages
+        ]
+
+        self._guard(self._scan, extract_queue, tracker)
+        for (workers_count, _, args), stage_workers in zip(stages, workers):
+            for _ in range(workers_count):
+                self._put(args[0], STOP)
+            for worker in stage_workers:
+                worker.join()
+
+        if self.errors:
+            raise self.errors[0]
+
+    def _start(self, target, *args) -> threading.Thread:
+        worker = threading.Thread(
+            target=self._guard, args=(target, *args), daemon=True,
+        )
+        worker.start()
+        return worker
+
+    def _guard(self, target, *args) -> None:
+        try:
+            target(*args)
+        except Exception as exception:
+            self.logging.error(exception)
+            self.errors.append(exception)
+            self.failed.set()
+
+    def _put(self, out_queue: queue.Queue, item) -> None:
+        while not self.failed.is_set():
+            try:
+                out_queue.put(item, timeout=QUEUE_TIMEOUT)
+            except queue.Full:
+                continue
+            return
+
+    def _consume(self, in_queue: queue.Queue):
+        while not self.failed.is_set():
+            try:
+                item = in_queue.get(timeout=QUEUE_TIMEOUT)
+            except queue.Empty:
+                continue
+            if item is STOP:
+                return
+            yield item
+
+    def _scan(self, out_queue: queue.Queue, tracker: CheckpointTracker):
+        seq = 0
+        scan_conn = PostgresExtractor(
+            self.postgres_dsl, checkpoint_lag=self.checkpoint_lag,
+        )
+        with scan_conn as pg_conn:
+            for table in self.tables:
+                table_name = table['name']
+                generator_modified_ids = pg_conn.get_ids_modified_table(
+                    table_name,
+                    get_checkpoint(self.state, table_name),
+                    self.limit,
+                )
+                for modified_ids in generator_modified_ids:
+                    if self.failed.is_set():
+                        return
+                    tracker.register(seq, table_name, modified_ids[-1])
+                    self._put(
+                        out_queue,
+                        (seq, table, [item['id'] for item in modified_ids]),
+                    )
+                    seq += 1
+
+    def _extract_worker(self, in_queue, out_queue) -> None:
+        pg_conn = PostgresExtractor(
+            self.postgres_dsl, aggregate_films=self.aggregate_films,
+        )
+        with pg_conn:
+            for seq, table, table_ids in self._consume(in_queue):
+                # Запросы пачки начинаются не раньше этого момента
+                # и видят все транзакции, зафиксированные до него.
+                version = time.time_ns() // 1000
+                extracted = extract_batch(
+                    pg_conn, table, table_ids, es_conn=self.es_conn,
+                )
+                self._put(out_queue, (seq, table, version, {
+                    key: rows if rows is None else list(rows)
+                    for key, rows in extracted.items()
+                }))
+
+    def _transform_worker(self, in_queue, out_queue) -> None:
+        for seq, table, version, extracted in self._consume(in_queue):
+            documents = transform_batch(self.transformer, table, extracted)
+            self._put(out_queue, (seq, version, documents))
+
+    def _load_worker(self, in_queue, tracker: CheckpointTracker) -> None:
+        for seq, version, documents in self._consume(in_queue):
+            load_batch(self.es_conn, documents, version)
+            tracker.complete(seq)
@@ -1,111 +1,370 @@
+import queue
+import re
+import threading
+from contextlib import ExitStack
+from typing import Generator
+from uuid import uuid4
+
+import orjson
 import psycopg2
 from psycopg2.extras import DictCursor
 
+from elt_payplan import queries
+from elt_payplan.checkpoint import MIN_ID
 from utils.backoff import backoff
 
+COPY_NULL = r'\N'
+COPY_DELIMITER = '\t'
+COPY_ESCAPE = re.compile(r'\\(.)')
+# Экранирование текстового формата COPY; прочие символы после обратной
+# косой черты означают сами себя (в том числе сама черта).
+COPY_ESCAPES = {
+    'b': '\b',
+    'f': '\f',
+    'n': '\n',
+    'r': '\r',
+    't': '\t',
+    'v': '\v',
+}
+COPY_QUEUE_SIZE = 1024
+COPY_PUT_TIMEOUT = 0.5
+COPY_DONE = object()
+# Колонки FILM_DOCUMENTS_SQL, которые COPY отдаёт текстом json.
+FILM_DOCUMENT_JSON_COLUMNS = ('actors', 'writers', 'directors', 'genres')
+
+
+class CopyQueueWriter(object):
+    """
+    Файлоподобный приёмник для copy_expert: куски COPY идут в очередь.
+
+    Очередь ограничена, поэтому COPY ждёт, пока разбор догонит его.
+    После stopped куски отбрасываются, чтобы COPY дочитался до конца
+    и освободил соединение.
+    """
+
+    def __init__(self, chunks: queue.Queue, stopped: threading.Event):
+        self.chunks = chunks
+        self.stopped = stopped
+
+    def write(self, chunk) -> None:
+        while not self.stopped.is_set():
+            try:
+                self.chunks.put(chunk, timeout=COPY_PUT_TIMEOUT)
+            except queue.Full:
+                continue
+            return
+
+
+def copy_lines(chunks: queue.Queue) -> Generator:
+    """
+    Строки COPY из кусков очереди.
+
+    Кусок не обязан кончаться строкой и даже целым символом, поэтому
+    строки режутся по байтам и декодируются целиком.
+
+    Yields:
+        str: одна запись без перевода строки
+
+    Raises:
+        chunk: ошибка COPY, переданная потоком copy_to_queue
+    """
+    tail = b''
+    while True:
+        chunk = chunks.get()
+        if chunk is COPY_DONE:
+            break
+        if isinstance(chunk, Exception):
+            raise chunk
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf8')
+        lines = b''.join((tail, chunk)).split(b'\n')
+        tail = lines.pop()
+        yield from (line.decode('utf8') for line in lines)
+    if tail:
+        yield tail.decode('utf8')
+
+
+def copy_unescape(match) -> str:
+    return COPY_ESCAPES.get(match.group(1), match.group(1))
+
+
+def copy_values(line: str) -> list:
+    """
+    Значения одной записи текстового COPY.
+
+    NULL - это только поле, целиком равное маркеру COPY_NULL: строка
+    с теми же символами приходит экранированной и остаётся значением.
+    """
+    return [
+        None if field == COPY_NULL else COPY_ESCAPE.sub(copy_unescape, field)
+        for field in line.split(COPY_DELIMITER)
+    ]
+
 
 class PostgresConnector(object):
-    def __init__(self, postgres_dsl):
+    def __init__(
+        self,
+        postgres_dsl,
+        itersize=None,
+        aggregate_films=False,
+        checkpoint_lag=0,
+    ):
         self.postgres_dsl = postgres_dsl
+        self.itersize = itersize
+        self.aggregate_films = aggregate_films
+        self.checkpoint_lag = checkpoint_lag
         self.connection = None
         self.cursor = None
 
-    @backoff
+    @backoff()
     def __enter__(self):
         self.connection = psycopg2.connect(
-            **self.postgres_dsl, cursor_factory=DictCursor,
+            **self.postgres_dsl,
+            cursor_factory=DictCursor,
+            application_name=queries.APPLICATION_NAME,
         )
         self.cursor = self.connection.cursor()
         return self
 
-    def query(self, sql):
-        self.cursor.execute(sql)
+    def query(self, sql, params=None):
+        self.cursor.execute(sql, params)
         return self.cursor
 
+    def stream(self, sql, params=None):
+        """
+        Выполнить запрос на именованном (серверном) курсоре.
+
+        Строки забираются с сервера порциями по itersize, поэтому в памяти
+        ETL одновременно находится только одна порция результата.
+
+        Yields:
+            DictRow: строка результата
+        """
+        cursor_name = 'etl_{0}'.format(uuid4().hex)
+        with self.connection.cursor(name=cursor_name) as cursor:
+            cursor.itersize = self.itersize
+            cursor.execute(sql, params)
+            yield from cursor
+
+    def fetch(self, sql, params=None):
+        """Выполнить запрос потоково, если задан itersize, иначе целиком."""
+        if self.itersize:
+            return self.stream(sql, params)
+        return self.query(sql, params).fetchall()
+
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.connection.commit()
         self.connection.close()
 
 
-class PostgresExtractor(PostgresConnector):
-    def get_ids_modified_table(self, table, state_date, limit):
-        sql_template = """
-            SELECT id modified
-            FROM content.{table} WHERE modified >= '{state_date}'
-            ORDER BY modified;
+class PostgresExtractor(PostgresConnector):  # noqa: WPS214
+    def get_ids_modified_table(self, table, checkpoint, limit):
+        """
+        Выгрузить изменённые записи таблицы пачками по ключу (modified, id).
+
+        Каждая следующая пачка продолжается строго после последней строки
+        предыдущей, поэтому запрос читает только limit строк по индексу,
+        а не пересортировывает таблицу от контрольной точки. Строки
+        новее горизонта (начала самой старой открытой транзакции,
+        но не ближе checkpoint_lag секунд к текущему моменту) остаются
+        до следующего цикла.
+
+        Args:
+            table (str): имя таблицы в схеме content
+            checkpoint (tuple): последняя обработанная пара (modified, id)
+            limit (int): размер пачки
+
+        Yields:
+            list: строки с полями id и modified
+        """
+        while True:
+            loaded_data = self.get_modified_page(table, checkpoint, limit)
+            if not loaded_data:
+                break
+            yield loaded_data
+            if len(loaded_data) < limit:
+                break
+            checkpoint = (loaded_data[-1]['modified'], loaded_data[-1]['id'])
+
+    def get_modified_page(self, table, checkpoint, limit, shard=None):
+        """
+        Одна пачка из limit строк после контрольной точки (modified, id).
+
+        shard - пара (номер, число шардов): читаются только строки,
+        id которых попадает в этот шард.
         """
-        sql = self.cursor.mogrify(
-            sql_template.format(table=table, state_date=state_date),
+        shard_filter = ''
+        if shard is not None:
+            shard_filter = queries.SHARD_FILTER_SQL.format(
+                shard='%(shard)s', count='%(shard_count)s',
+            )
+        sql = queries.MODIFIED_IDS_SQL.format(
+            table=table,
+            modified='%(modified)s',
+            id='%(id)s',
+            limit='%(limit)s',
+            lag='%(lag)s',
+            application_name=queries.APPLICATION_NAME,
+            shard_filter=shard_filter,
         )
+        modified, last_id = checkpoint
+        shard_number, shard_count = shard or (None, None)
+        self.cursor.execute(sql, {
+            'modified': modified,
+            'id': last_id,
+            'limit': limit,
+            'lag': self.checkpoint_lag,
+            'shard': shard_number,
+            'shard_count': shard_count,
+        })
+        return self.cursor.fetchall()
+
+    def get_all_ids(self, table, limit):
+        """
+        Все id таблицы пачками по limit в порядке первичного ключа.
+
+        Yields:
+            list: строки с полем id
+        """
+        sql = queries.ALL_IDS_SQL.format(
+            table=table, id='%(id)s', limit='%(limit)s',
+        )
+        last_id = MIN_ID
         while True:
-            loaded_data = self.query(sql).fetchmany(limit)
+            self.cursor.execute(sql, {'id': last_id, 'limit': limit})
+            loaded_data = self.cursor.fetchall()
             if not loaded_data:
                 break
-            yield from (row for row in loaded_data)
+            yield loaded_data
+            if len(loaded_data) < limit:
+                break
+            last_id = loaded_data[-1]['id']
+
+    def get_server_time(self):
+        """Время начала текущей транзакции по часам Postgres."""
+        return self.query(queries.SERVER_TIME_SQL).fetchone()['now']
 
     def get_person_data(self, persons_ids):
-        sql_template = """
-            SELECT
-                p.id,
-                full_name,
-                pfw.role,
-                pfw.film_work_id
-            FROM content.person p
-            LEFT JOIN content.person_film_work pfw ON pp.id = pfw.person_id
-            WHERE p.id IN ({ids})
-        """
-        sql = self.cursor.mogrify(sql_template.format(ids=tuple(persons_ids)))
-        return self.query(sql).fetchall()
+        return self.fetch(
+            queries.PERSON_DATA_SQL.format(ids='%(ids)s'),
+            {'ids': list(persons_ids)},
+        )
 
     def get_genre_data(self, genre_ids):
-        sql_template = """
-            SELECT
-                g.id,
-                g.name,
-                g.description,
-                gfw.film_work_id
-            FROM content.genre g
-            LEFT JOIN content.genre_film_work gfw ON gg.id = gfw.genre_id
-            WHERE g.id IN ({ids});
+        return self.fetch(
+            queries.GENRE_DATA_SQL.format(ids='%(ids)s'),
+            {'ids': list(genre_ids)},
+        )
+
+    def get_film_data(self, film_ids):
+        if self.aggregate_films:
+            return self.get_film_documents(film_ids)
+        return self.fetch(
+            queries.FILM_DATA_SQL.format(ids='%(ids)s'),
+            {'ids': list(film_ids)},
+        )
+
+    def get_film_documents(self, film_ids):
+        """Фильмы по одной строке с уже собранными json_agg составами."""
+        return self.fetch(
+            queries.FILM_DOCUMENTS_SQL.format(ids='%(ids)s'),
+            {'ids': list(film_ids)},
+        )
+
+    def copy_to_queue(self, sql, writer: CopyQueueWriter) -> None:
+        """Выполнить COPY и положить в очередь COPY_DONE или ошибку."""
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.copy_expert(queries.COPY_SQL.format(query=sql), writer)
+        except Exception as exception:
+            writer.write(exception)
+        else:
+            writer.write(COPY_DONE)
+
+    def copy_columns(self, sql) -> list:
+        """Имена колонок выборки sql."""
+        with self.connection.cursor() as cursor:
+            cursor.execute(queries.COPY_COLUMNS_SQL.format(query=sql))
+            return [column.name for column in cursor.description]
+
+    def copy_rows(self, sql, json_columns=()) -> Generator:
         """
-        sql = self.cursor.mogrify(sql_template.format(ids=tuple(genre_ids)))
-        return self.query(sql).fetchall()
-
-    def get_data_from_elastic_movies(self, film_ids):
-        sql_template = """
-        SELECT
-            fw.id as fw_id,
-            fw.title,
-            fw.description,
-            fw.rating,
-            fw.type,
-            fw.created,
-            fw.modified,
-            pfw.role,
-            pfw.id as pfw_id,
-            p.id,
-            p.full_name,
-            g.name
-        FROM content.film_work fw
-        LEFT JOIN content.person_film_work pfw ON pfw.film_work_id = fw.id
-        LEFT JOIN content.person p ON p.id = pfw.person_id
-        LEFT JOIN content.genre_film_work gfw ON gfw.film_work_id = fw.id
-        LEFT JOIN content.genre g ON g.id = gfw.genre_id
-        WHERE fw.id IN ({ids});
+        Выгрузить всю выборку одним COPY ... TO STDOUT.
+
+        copy_expert работает в отдельном потоке и складывает куски
+        в ограниченную очередь, а записи разбираются по мере
+        поступления. Значения приходят строками (NULL - None),
+        json_columns разбираются orjson. Пока генератор не исчерпан
+        или не закрыт, соединение занято COPY.
+
+        Yields:
+            dict: запись выборки по именам колонок
         """
-        sql = self.cursor.mogrify(sql_template.format(ids=tuple(film_ids)))
-        return self.query(sql).fetchall()
+        columns = self.copy_columns(sql)
+        chunks = queue.Queue(maxsize=COPY_QUEUE_SIZE)
+        stopped = threading.Event()
+        copy_thread = threading.Thread(
+            target=self.copy_to_queue,
+            args=(sql, CopyQueueWriter(chunks, stopped)),
+            daemon=True,
+        )
+        copy_thread.start()
+        with ExitStack() as stack:
+            stack.callback(copy_thread.join)
+            stack.callback(stopped.set)
+            for line in copy_lines(chunks):
+                row = dict(zip(columns, copy_values(line)))
+                for column in json_columns:
+                    if row[column] is not None:
+                        row[column] = orjson.loads(row[column])
+                yield row
+
+    def copy_person_rows(self):
+        return self.copy_rows(queries.PERSON_COPY_SQL)
+
+    def copy_genre_rows(self):
+        return self.copy_rows(queries.GENRE_COPY_SQL)
+
+    def copy_film_rows(self):
+        """Все фильмы по порядку fw_id, как у get_film_data."""
+        if self.aggregate_films:
+            return self.copy_rows(
+                queries.FILM_DOCUMENTS_COPY_SQL, FILM_DOCUMENT_JSON_COLUMNS,
+            )
+        return self.copy_rows(queries.FILM_COPY_SQL)
 
     def get_film_id_in_table(self, table, table_ids):
-        sql_template = """
-            SELECT
-                fw.id
-            FROM content.film_work fw
-            LEFT JOIN content.{table}_film_work pfw ON pfw.film_work_id = fw.id
-            WHERE pfw.{table}_id IN ({ids})
-            ORDER BY fw.modified;
-        """
-        sql = self.cursor.mogrify(
-            sql_template.format(table=table, ids=tuple(table_ids)),
+        return self.fetch(
+            queries.FILM_ID_IN_TABLE_SQL.format(table=table, ids='%(ids)s'),
+            {'ids': list(table_ids)},
         )
-        return self.query(sql).fetchall()
+
+    def get_change_log(self, limit):
+        """Первые limit записей журнала изменений по возрастанию id."""
+        return self.query(
+            queries.CHANGE_LOG_SQL.format(limit='%(limit)s'), {'limit': limit},
+        ).fetchall()
+
+    def prune_change_log(self, ids):
+        """Удалить из журнала обработанные записи и зафиксировать это."""
+        self.cursor.execute(
+            queries.PRUNE_CHANGE_LOG_SQL.format(ids='%(ids)s'),
+            {'ids': list(ids)},
+        )
+        self.connection.commit()
+
+    def set_change_log(self, enabled):
+        """
+        Включить или выключить триггеры журнала изменений.
+
+        Выключенный журнал очищается: его больше никто не читает, а
+        изменения переносит сканирование по modified.
+        """
+        action = 'ENABLE' if enabled else 'DISABLE'
+        for table in queries.CHANGE_LOG_TABLES:
+            self.cursor.execute(queries.SET_CHANGE_LOG_TRIGGER_SQL.format(
+                table=table, action=action,
+            ))
+        if not enabled:
+            self.cursor.execute(queries.CLEAR_CHANGE_LOG_SQL)
+        self.connection.commit()
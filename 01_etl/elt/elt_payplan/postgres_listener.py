@@ -0,0 +1,72 @@
+import json
+import select
+import time
+
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+from utils.backoff import backoff
+from utils.logger import get_logger
+
+
+class PostgresListener(object):
+    """
+    Ожидание уведомлений NOTIFY об изменениях в схеме content.
+
+    Триггеры на таблицах контента шлют в канал JSON с таблицей, операцией,
+    id строки и film_work_id для таблиц связей.
+    """
+
+    def __init__(
+        self, postgres_dsl, channel='content_changes', debounce=1.0,
+    ):
+        self.postgres_dsl = postgres_dsl
+        self.channel = channel
+        self.debounce = debounce
+        self.connection = None
+        self.logging = get_logger(__name__)
+
+    @backoff()
+    def listen(self) -> None:
+        self.connection = psycopg2.connect(**self.postgres_dsl)
+        self.connection.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        with self.connection.cursor() as cursor:
+            cursor.execute('LISTEN {channel};'.format(channel=self.channel))
+
+    def poll(self, timeout: float) -> list:
+        if not select.select([self.connection], [], [], timeout)[0]:
+            return []
+        self.connection.poll()
+        notifies = self.connection.notifies
+        self.connection.notifies = []
+        return [json.loads(notify.payload) for notify in notifies]
+
+    def wait(self, timeout: float) -> list:
+        """
+        Дождаться изменений, но не дольше timeout секунд.
+
+        После первого уведомления изменения собираются, пока в течение
+        debounce секунд приходят новые, чтобы серия правок из админки
+        обрабатывалась одним циклом. Пустой список означает, что
+        изменений не было и нужно выполнить обычный страховочный опрос.
+        """
+        if self.connection is None or self.connection.closed:
+            self.listen()
+        try:
+            changes = self.poll(timeout)
+            deadline = time.monotonic() + timeout
+            while changes and time.monotonic() < deadline:
+                new_changes = self.poll(self.debounce)
+                if not new_changes:
+                    break
+                changes.extend(new_changes)
+        except (psycopg2.Error, OSError) as exception:
+            self.logging.error(exception)
+            self.close()
+            return []
+        return changes
+
+    def close(self) -> None:
+        if self.connection is not None and not self.connection.closed:
+            self.connection.close()
+        self.connection = None
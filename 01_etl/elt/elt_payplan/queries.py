@@ -0,0 +1,217 @@
+# Запросы общие для синхронного (psycopg2) и асинхронного (asyncpg)
+# извлечения. Плейсхолдеры параметров подставляются через format():
+# для psycopg2 это %(name)s, для asyncpg - $n.
+
+# Под этим именем ETL подключается к Postgres, чтобы его собственные
+# транзакции не сдерживали горизонт MODIFIED_IDS_SQL.
+APPLICATION_NAME = 'etl'
+
+# modified выставляется до фиксации транзакции, и строка, закоммиченная
+# позже уже прочитанных более новых, иначе оказалась бы позади
+# контрольной точки. Поэтому строки читаются только до горизонта:
+# начала самой старой из открытых сейчас транзакций других клиентов
+# (её строки не старше этого момента) и не ближе {lag} секунд к now(),
+# что покрывает расхождение часов приложения и базы. Горизонт
+# вычисляется по pg_stat_activity: роли ETL нужно видеть xact_start
+# чужих сессий (та же роль, что у приложения, или pg_read_all_stats).
+MODIFIED_IDS_SQL = """
+    SELECT id, modified
+    FROM content.{table}
+    WHERE (modified, id) > ({modified}, {id})
+        AND modified < LEAST(
+            now() - make_interval(secs => {lag}),
+            (
+                SELECT min(xact_start)
+                FROM pg_stat_activity
+                WHERE datname = current_database()
+                    AND backend_type = 'client backend'
+                    AND pid <> pg_backend_pid()
+                    AND application_name <> '{application_name}'
+            )
+        )
+        {shard_filter}
+    ORDER BY modified, id
+    LIMIT {limit};
+"""
+
+# Все id таблицы страницами по первичному ключу, без горизонта
+# MODIFIED_IDS_SQL: полное чтение (reindex, выгрузка) не должно
+# пропускать строки, изменённые во время открытых транзакций.
+ALL_IDS_SQL = """
+    SELECT id
+    FROM content.{table}
+    WHERE id > {id}
+    ORDER BY id
+    LIMIT {limit};
+"""
+
+# Шард строки - последний байт uuid по модулю числа шардов.
+SHARD_FILTER_SQL = """
+        AND get_byte(uuid_send(id), 15) % {count} = {shard}
+"""
+
+# Выборки *_ROWS_SQL с подстановкой {filter}: с фильтром по id - пачка,
+# без него - вся таблица для COPY (*_COPY_SQL). Строки упорядочены по
+# сущности.
+PERSON_ROWS_SQL = """
+    SELECT
+        p.id,
+        full_name,
+        pfw.role,
+        pfw.film_work_id
+    FROM content.person p
+    LEFT JOIN content.person_film_work pfw ON p.id = pfw.person_id
+    {filter}
+    ORDER BY p.id
+"""
+PERSON_DATA_SQL = PERSON_ROWS_SQL.format(
+    filter='WHERE p.id = ANY({ids}::uuid[])',
+)
+PERSON_COPY_SQL = PERSON_ROWS_SQL.format(filter='')
+
+GENRE_ROWS_SQL = """
+    SELECT
+        g.id,
+        g.name,
+        g.description,
+        gfw.film_work_id
+    FROM content.genre g
+    LEFT JOIN content.genre_film_work gfw ON g.id = gfw.genre_id
+    {filter}
+    ORDER BY g.id
+"""
+GENRE_DATA_SQL = GENRE_ROWS_SQL.format(
+    filter='WHERE g.id = ANY({ids}::uuid[])',
+)
+GENRE_COPY_SQL = GENRE_ROWS_SQL.format(filter='')
+
+FILM_ROWS_SQL = """
+    SELECT
+        fw.id as fw_id,
+        fw.title,
+        fw.description,
+        fw.rating,
+        fw.type,
+        fw.created,
+        fw.modified,
+        pfw.role,
+        pfw.id as pfw_id,
+        p.id,
+        p.full_name,
+        g.id as genre_id,
+        g.name
+    FROM content.film_work fw
+    LEFT JOIN content.person_film_work pfw ON pfw.film_work_id = fw.id
+    LEFT JOIN content.person p ON p.id = pfw.person_id
+    LEFT JOIN content.genre_film_work gfw ON gfw.film_work_id = fw.id
+    LEFT JOIN content.genre g ON g.id = gfw.genre_id
+    {filter}
+    ORDER BY fw.id
+"""
+FILM_DATA_SQL = FILM_ROWS_SQL.format(
+    filter='WHERE fw.id = ANY({ids}::uuid[])',
+)
+FILM_COPY_SQL = FILM_ROWS_SQL.format(filter='')
+
+FILM_ID_IN_TABLE_SQL = """
+    SELECT
+        fw.id
+    FROM content.film_work fw
+    LEFT JOIN content.{table}_film_work pfw ON pfw.film_work_id = fw.id
+    WHERE pfw.{table}_id = ANY({ids}::uuid[])
+    ORDER BY fw.modified;
+"""
+
+# Один готовый документ на фильм: составы по ролям и жанры собираются
+# json_agg в подзапросах, без декартова произведения персон и жанров.
+# Роли совпадают со значениями PersonRole.
+FILM_DOCUMENT_ROWS_SQL = """
+    SELECT
+        fw.id as fw_id,
+        fw.title,
+        fw.description,
+        fw.rating,
+        COALESCE(persons.actors, '[]') as actors,
+        COALESCE(persons.writers, '[]') as writers,
+        COALESCE(persons.directors, '[]') as directors,
+        COALESCE(genres.genres, '[]') as genres
+    FROM content.film_work fw
+    LEFT JOIN LATERAL (
+        SELECT
+            json_agg(DISTINCT jsonb_build_object(
+                'id', p.id, 'full_name', p.full_name
+            )) FILTER (WHERE pfw.role = 'actor') as actors,
+            json_agg(DISTINCT jsonb_build_object(
+                'id', p.id, 'full_name', p.full_name
+            )) FILTER (WHERE pfw.role = 'producer') as writers,
+            json_agg(DISTINCT jsonb_build_object(
+                'id', p.id, 'full_name', p.full_name
+            )) FILTER (WHERE pfw.role = 'director') as directors
+        FROM content.person_film_work pfw
+        JOIN content.person p ON p.id = pfw.person_id
+        WHERE pfw.film_work_id = fw.id
+    ) persons ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT
+            json_agg(DISTINCT jsonb_build_object(
+                'id', g.id, 'name', g.name
+            )) as genres
+        FROM content.genre_film_work gfw
+        JOIN content.genre g ON g.id = gfw.genre_id
+        WHERE gfw.film_work_id = fw.id
+    ) genres ON TRUE
+    {filter}
+    ORDER BY fw.id
+"""
+FILM_DOCUMENTS_SQL = FILM_DOCUMENT_ROWS_SQL.format(
+    filter='WHERE fw.id = ANY({ids}::uuid[])',
+)
+FILM_DOCUMENTS_COPY_SQL = FILM_DOCUMENT_ROWS_SQL.format(filter='')
+
+# Выгрузка всей выборки одним потоком в текстовом формате COPY: строка
+# на запись, поля через табуляцию, NULL - неэкранированный \N, а перевод
+# строки, табуляция и обратная косая черта в значениях экранируются.
+COPY_SQL = """
+    COPY ({query}) TO STDOUT
+"""
+
+# Имена колонок выборки без чтения строк: текстовый COPY их не отдаёт.
+COPY_COLUMNS_SQL = """
+    SELECT * FROM ({query}) AS copy_query LIMIT 0
+"""
+
+# Журнал изменений, который ведут триггеры content.log_content_change().
+# Читается всегда с начала: id выдаётся при вставке, а не при фиксации,
+# и запись долгой транзакции может появиться позже записей с большим id.
+CHANGE_LOG_SQL = """
+    SELECT id, entity_type, entity_id, operation, film_work_id, related_id
+    FROM content.change_log
+    ORDER BY id
+    LIMIT {limit};
+"""
+
+PRUNE_CHANGE_LOG_SQL = """
+    DELETE FROM content.change_log
+    WHERE id = ANY({ids});
+"""
+
+# Триггеры журнала выключены по умолчанию (0011_change_log_opt_in):
+# ETL включает их только в режиме change_log.
+CHANGE_LOG_TABLES = (
+    'film_work',
+    'genre',
+    'person',
+    'genre_film_work',
+    'person_film_work',
+)
+SET_CHANGE_LOG_TRIGGER_SQL = """
+    ALTER TABLE content.{table} {action} TRIGGER {table}_log_content_change;
+"""
+
+CLEAR_CHANGE_LOG_SQL = """
+    TRUNCATE content.change_log;
+"""
+
+SERVER_TIME_SQL = """
+    SELECT now() as now;
+"""
@@ -0,0 +1,229 @@
+import copy
+import datetime
+import re
+from typing import List
+
+from elt_payplan.change_set import (
+    ChangeSet,
+    collect_changes_since,
+    rebuild_films,
+)
+from elt_payplan.data_transformer import DataTransform
+from elt_payplan.elasticsearch_loader import ElasticsearchLoader
+from elt_payplan.postgres_extractor import PostgresExtractor
+from elt_payplan.snapshot import table_documents
+from elt_payplan.tables import TABLES_PG
+from utils.fingerprint import FingerprintCache
+from utils.logger import get_logger
+
+# На время загрузки индекс не обновляется и не реплицируется.
+BULK_SETTINGS = {'refresh_interval': '-1', 'number_of_replicas': 0}
+DEFAULT_REPLICAS = 1
+FILM_TABLE = {'name': 'film_work'}
+FORCEMERGE_TIMEOUT = 3600
+REINDEX_STARTED = 'Переиндексация {alias}: создан индекс {index}'
+REINDEX_LOADED = 'Переиндексация {alias}: загружено фильмов {count}'
+REINDEX_CAUGHT_UP = (
+    'Переиндексация {alias}: догружено изменённых за время загрузки {count}'
+)
+REINDEX_SWAPPED = 'Переиндексация {alias}: псевдоним переключён на {index}'
+REINDEX_DROPPED = 'Переиндексация {alias}: удалён старый индекс {index}'
+
+
+class BlueGreenReindex(object):  # noqa: WPS214, WPS230
+    """
+    Полная переиндексация фильмов в новую версию индекса.
+
+    Фильмы загружаются в movies_v{n} без refresh и реплик, после чего
+    настройки восстанавливаются, индекс сливается в один сегмент,
+    а псевдоним movies одним запросом переключается на новую версию.
+    Поиск всё это время работает по старому индексу. С use_copy фильмы
+    читаются одним COPY вместо запроса на каждую пачку id.
+    """
+
+    def __init__(  # noqa: WPS211
+        self,
+        pg_conn: PostgresExtractor,
+        es_conn: ElasticsearchLoader,
+        transformer: DataTransform,
+        index: dict,
+        alias: str = 'movies',
+        tables: list = None,
+        limit: int = 1000,
+        keep_versions: int = 1,
+        fingerprints: FingerprintCache = None,
+        use_copy: bool = False,
+    ):
+        self.pg_conn = pg_conn
+        self.es_conn = es_conn
+        self.transformer = transformer
+        self.index = index
+        self.alias = alias
+        self.tables = TABLES_PG if tables is None else tables
+        self.limit = limit
+        self.keep_versions = keep_versions
+        self.fingerprints = fingerprints
+        self.use_copy = use_copy
+        self.version_pattern = re.compile(
+            r'^{alias}_v(\d+)$'.format(alias=re.escape(alias)),
+        )
+        self.logging = get_logger(__name__)
+
+    @property
+    def client(self):
+        return self.es_conn.client
+
+    def versions(self) -> List[str]:
+        """Существующие версии индекса по возрастанию номера."""
+        indices = self.client.indices.get(
+            index='{alias}_v*'.format(alias=self.alias),
+        )
+        versions = [
+            index_name
+            for index_name in indices
+            if self.version_pattern.match(index_name)
+        ]
+        return sorted(versions, key=self.version_number)
+
+    def version_number(self, index_name: str) -> int:
+        return int(self.version_pattern.match(index_name).group(1))
+
+    def next_index_name(self) -> str:
+        versions = self.versions()
+        number = self.version_number(versions[-1]) + 1 if versions else 1
+        return '{alias}_v{number}'.format(alias=self.alias, number=number)
+
+    def alias_indices(self) -> List[str]:
+        if not self.client.indices.exists_alias(name=self.alias):
+            return []
+        return list(self.client.indices.get_alias(name=self.alias))
+
+    def is_concrete_index(self) -> bool:
+        """Старый индекс movies создан без версии и псевдонима."""
+        return bool(
+            self.client.indices.exists(index=self.alias)
+            and not self.client.indices.exists_alias(name=self.alias),
+        )
+
+    def replicas(self, indices: List[str]) -> int:
+        """Число реплик текущего индекса, чтобы вернуть его новой версии."""
+        if not indices:
+            return DEFAULT_REPLICAS
+        settings = self.client.indices.get_settings(
+            index=indices[0], name='index.number_of_replicas',
+        )
+        index_settings = settings[indices[0]]['settings']['index']
+        return int(index_settings['number_of_replicas'])
+
+    def create_index(self, index_name: str) -> None:
+        body = copy.deepcopy(self.index)
+        body['settings'].update(BULK_SETTINGS)
+        self.client.indices.create(
+            index=index_name,
+            settings=body['settings'],
+            mappings=body['mappings'],
+        )
+
+    def load_films(self, index_name: str) -> int:
+        """Загрузить все фильмы пачками по limit в индекс index_name."""
+        count = 0
+        film_pages = table_documents(
+            self.pg_conn,
+            self.transformer,
+            FILM_TABLE,
+            self.limit,
+            self.use_copy,
+        )
+        for films in film_pages:
+            films = list(films)
+            self.es_conn.bulk_data_to_elastic(index_name, films)
+            count += len(films)
+        return count
+
+    def restore_settings(self, index_name: str, replicas: int) -> None:
+        self.client.indices.put_settings(
+            index=index_name,
+            settings={'index': {
+                'refresh_interval': self.index['settings']['refresh_interval'],
+                'number_of_replicas': replicas,
+            }},
+        )
+        self.client.indices.refresh(index=index_name)
+        self.client.options(
+            request_timeout=FORCEMERGE_TIMEOUT,
+        ).indices.forcemerge(index=index_name, max_num_segments=1)
+
+    def swap_alias(self, index_name: str, old_indices: List[str]) -> None:
+        """Переключить псевдоним на index_name одним атомарным запросом."""
+        actions = [
+            {'remove': {'index': old_index, 'alias': self.alias}}
+            for old_index in old_indices
+        ]
+        if self.is_concrete_index():
+            actions.append({'remove_index': {'index': self.alias}})
+        actions.append({'add': {'index': index_name, 'alias': self.alias}})
+        self.client.indices.update_aliases(actions=actions)
+        if self.fingerprints is not None:
+            self.fingerprints.clear(self.alias)
+
+    def catch_up(self, started: datetime.datetime) -> int:
+        """
+        Догрузить фильмы, изменённые после начала полной загрузки.
+
+        Пока шла загрузка, ETL писал изменения в старый индекс, поэтому
+        после переключения они пересобираются уже через псевдоним.
+        """
+        since = started - datetime.timedelta(
+            seconds=self.pg_conn.checkpoint_lag,
+        )
+        films = ChangeSet()
+        collect_changes_since(
+            self.pg_conn, self.tables, since.isoformat(), films, self.limit,
+        )
+        count = len(films)
+        rebuild_films(
+            self.pg_conn, self.es_conn, self.transformer, films, self.limit,
+        )
+        return count
+
+    def drop_old_versions(self, index_name: str) -> None:
+        old_versions = [
+            version for version in self.versions() if version != index_name
+        ]
+        if self.keep_versions:
+            old_versions = old_versions[:-self.keep_versions]
+        for old_version in old_versions:
+            self.client.indices.delete(index=old_version)
+            self.logging.info(REINDEX_DROPPED.format(
+                alias=self.alias, index=old_version,
+            ))
+
+    def run(self) -> str:
+        """Пересобрать индекс и вернуть имя новой версии."""
+        index_name = self.next_index_name()
+        old_indices = self.alias_indices()
+        replica_source = old_indices
+        if not replica_source and self.is_concrete_index():
+            replica_source = [self.alias]
+        replicas = self.replicas(replica_source)
+        self.create_index(index_name)
+        self.logging.info(REINDEX_STARTED.format(
+            alias=self.alias, index=index_name,
+        ))
+        with self.pg_conn:
+            started = self.pg_conn.get_server_time()
+            count = self.load_films(index_name)
+        self.logging.info(REINDEX_LOADED.format(alias=self.alias, count=count))
+
+        self.restore_settings(index_name, replicas)
+        self.swap_alias(index_name, old_indices)
+        self.logging.info(REINDEX_SWAPPED.format(
+            alias=self.alias, index=index_name,
+        ))
+        with self.pg_conn:
+            count = self.catch_up(started)
+        self.logging.info(REINDEX_CAUGHT_UP.format(
+            alias=self.alias, count=count,
+        ))
+        self.drop_old_versions(index_name)
+        return index_name
@@ -0,0 +1,75 @@
+import gzip
+import itertools
+import time
+from pathlib import Path
+from typing import Generator, List
+
+import orjson
+
+from elt_payplan.elasticsearch_loader import ElasticsearchLoader
+from elt_payplan.sinks import BULK_FILE_SUFFIX, GZIP_SUFFIX
+from utils.logger import get_logger
+
+MIN_ELAPSED = 1e-6
+REPLAY_STATS = (
+    'Replay {path}: {count} действий за {elapsed:.1f} с ({rate:.0f} в с)'
+)
+
+
+def bulk_files(directory: str) -> List[Path]:
+    """Готовые файлы NdjsonFileSink в порядке записи."""
+    suffixes = (BULK_FILE_SUFFIX, BULK_FILE_SUFFIX + GZIP_SUFFIX)
+    return sorted(
+        path
+        for path in Path(directory).iterdir()
+        if path.name.endswith(suffixes)
+    )
+
+
+def read_bulk_file(path: Path) -> Generator:
+    """
+    Действия _bulk из файла без разбора документов.
+
+    Разбирается только строка действия, _source передаётся байтами
+    и уходит в тело _bulk как есть.
+
+    Yields:
+        dict: действие для send_bulk_actions
+    """
+    opener = gzip.open if path.name.endswith(GZIP_SUFFIX) else open
+    with opener(path, 'rb') as bulk_file:
+        for line in bulk_file:
+            op_type, meta = next(iter(orjson.loads(line).items()))
+            action = {
+                '_op_type': op_type,
+                '_index': meta['_index'],
+                '_id': meta['_id'],
+            }
+            if op_type != 'delete':
+                action['_source'] = next(bulk_file).rstrip(b'\n')
+            yield action
+
+
+def replay_file(es_conn: ElasticsearchLoader, path: Path) -> int:
+    """Отправить один файл в _bulk и вернуть число действий."""
+    # zip берёт следующий номер только после очередного действия,
+    # поэтому после отправки счётчик равен числу действий.
+    counter = itertools.count()
+    actions = (action for action, _ in zip(read_bulk_file(path), counter))
+    es_conn.send_bulk_actions(path.name, actions)
+    return next(counter)
+
+
+def replay_files(es_conn: ElasticsearchLoader, paths: List[Path]) -> int:
+    """Отправить файлы в _bulk по порядку и вернуть число действий."""
+    logging = get_logger(__name__)
+    total = 0
+    for path in paths:
+        start = time.monotonic()
+        count = replay_file(es_conn, path)
+        elapsed = max(time.monotonic() - start, MIN_ELAPSED)
+        logging.info(REPLAY_STATS.format(
+            path=path, count=count, elapsed=elapsed, rate=count / elapsed,
+        ))
+        total += count
+    return total
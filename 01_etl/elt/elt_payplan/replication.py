@@ -0,0 +1,61 @@
+import time
+
+from elt_payplan.change_log import apply_change_log_batch
+from elt_payplan.checkpoint import get_sequence, set_sequence
+from elt_payplan.data_transformer import DataTransform
+from elt_payplan.elasticsearch_loader import ElasticsearchLoader
+from elt_payplan.postgres_extractor import PostgresExtractor
+from elt_payplan.wal2json import ReplicationReader
+from utils.logger import get_logger
+from utils.state import State
+
+REPLICATION_STATE = 'replication_lsn'
+REPLICATION_STATS = ''.join((
+    'Логическая репликация: изменений {entries}, пересобрано фильмов ',
+    '{films}, удалено документов {deleted}, LSN {lsn}',
+))
+
+
+def sync_replication(  # noqa: WPS211
+    state: State,
+    reader: ReplicationReader,
+    pg_conn: PostgresExtractor,
+    es_conn: ElasticsearchLoader,
+    transformer: DataTransform,
+    duration: float,
+    timeout: float = 1.0,
+    limit: int = 100,
+) -> None:
+    """
+    Переносить изменения из слота репликации в течение duration секунд.
+
+    Записи применяются тем же кодом, что и журнал content.change_log.
+    Postgres запрашивается только за содержимым изменённых документов
+    по первичным ключам. LSN сохраняется в состоянии до подтверждения
+    серверу, поэтому повтор после сбоя только переиндексирует пачку.
+
+    Raises:
+        Exception: ошибка чтения или загрузки, слот при этом отключается
+    """
+    logging = get_logger(__name__)
+    if not reader.connected:
+        reader.connect(get_sequence(state, REPLICATION_STATE))
+    deadline = time.monotonic() + duration
+    try:
+        while time.monotonic() < deadline:
+            entries, lsn = reader.read_batch(timeout)
+            if lsn is None:
+                continue
+            films, deleted = apply_change_log_batch(
+                pg_conn, es_conn, transformer, entries, limit,
+            )
+            set_sequence(state, REPLICATION_STATE, lsn)
+            reader.confirm(lsn)
+            logging.info(REPLICATION_STATS.format(
+                entries=len(entries), films=films, deleted=deleted, lsn=lsn,
+            ))
+    except Exception:
+        # Прочитанные, но не подтверждённые изменения сервер отдаст
+        # заново только после переподключения к слоту.
+        reader.close()
+        raise
@@ -0,0 +1,226 @@
+import abc
+import gzip
+import os
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Iterable, List
+
+import orjson
+
+from elt_payplan.elasticsearch_loader import ElasticsearchLoader, encode_source
+from pydantic_models import FilmElastick
+from utils.logger import get_logger
+
+BULK_FILE_SUFFIX = '.ndjson'
+GZIP_SUFFIX = '.gz'
+PART_SUFFIX = '.part'
+BULK_FILE_MAX_BYTES = 268435456
+BULK_FILE_CLOSED = 'Файл {path}: {docs} док., {size} байт'
+SNAPSHOT_ABORTED = 'Выгрузка {prefix} прервана, файлы удалены'
+SNAPSHOT_EXISTS = 'В {directory} уже есть файлы {prefix}-*, выгрузка не начата'
+
+
+class BaseSink(object):
+    """Куда ETL отдаёт готовые документы."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    @abc.abstractmethod
+    def write(self, index, documents: Iterable[FilmElastick]) -> int:
+        """Записать документы в индекс index и вернуть их число."""
+
+    @abc.abstractmethod
+    def delete(self, index, ids: List[str]) -> None:
+        """Удалить документы индекса index."""
+
+    def close(self) -> None:
+        """Дописать и освободить всё, что держит приёмник."""
+
+    def abort(self) -> None:
+        """Освободить приёмник после ошибки, не выдавая запись за полную."""
+        self.close()
+
+
+class ElasticsearchSink(BaseSink):
+    def __init__(self, es_conn: ElasticsearchLoader):
+        self.es_conn = es_conn
+        self.stack = ExitStack()
+
+    def __enter__(self):
+        self.stack.enter_context(self.es_conn)
+        return self
+
+    def write(self, index, documents: Iterable[FilmElastick]) -> int:
+        documents = list(documents)
+        self.es_conn.bulk_data_to_elastic(index, documents)
+        return len(documents)
+
+    def delete(self, index, ids: List[str]) -> None:
+        self.es_conn.delete_from_elastic(index, ids)
+
+    def close(self) -> None:
+        self.stack.close()
+
+
+class NullSink(BaseSink):
+    """Только считает документы: замер extract и transform без записи."""
+
+    def __init__(self):
+        self.count = 0
+
+    def write(self, index, documents: Iterable[FilmElastick]) -> int:
+        count = sum(1 for _ in documents)
+        self.count += count
+        return count
+
+    def delete(self, index, ids: List[str]) -> None:
+        """Удалять нечего."""
+
+
+class BulkFile(object):
+    """
+    Один файл выгрузки.
+
+    Файл пишется под временным именем и переименовывается при закрытии,
+    чтобы replay не прочитал недописанный файл.
+    """
+
+    def __init__(self, path: Path, compress: bool):
+        self.path = path
+        opener = gzip.open if compress else open
+        self.stream = opener(self.part_path, 'wb')
+        self.size = 0
+        self.docs = 0
+
+    @property
+    def part_path(self) -> str:
+        return '{path}{suffix}'.format(path=self.path, suffix=PART_SUFFIX)
+
+    def write(self, lines: bytes) -> None:
+        self.stream.write(lines)
+        self.size += len(lines)
+        self.docs += 1
+
+    def abort(self) -> None:
+        """Закрыть и удалить недописанный файл."""
+        self.stream.close()
+        os.remove(self.part_path)
+
+    def close(self) -> None:
+        self.stream.close()
+        os.replace(self.part_path, self.path)
+        get_logger(__name__).info(BULK_FILE_CLOSED.format(
+            path=self.path, docs=self.docs, size=self.size,
+        ))
+
+
+class NdjsonFileSink(BaseSink):  # noqa: WPS214
+    """
+    Файлы в формате тела _bulk: строка действия, затем строка _source.
+
+    Такой файл можно отправить в _bulk как есть, поэтому replay не
+    разбирает документы. Файлы сжимаются gzip и переключаются на
+    следующий номер, когда несжатый объём превысил max_bytes; пара
+    строк одного документа всегда остаётся в одном файле.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        prefix: str = 'bulk',
+        compress: bool = True,
+        max_bytes: int = BULK_FILE_MAX_BYTES,
+    ):
+        self.directory = Path(directory)
+        self.prefix = prefix
+        self.compress = compress
+        self.max_bytes = max_bytes
+        self.bulk_file = None
+        self.paths = []
+
+    def __enter__(self):
+        """
+        Проверить, что каталог пуст для этого префикса.
+
+        Старые файлы не перезаписываются: replay прочитал бы их смесь.
+
+        Raises:
+            FileExistsError: в каталоге уже есть файлы с этим префиксом
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if any(self.directory.glob('{prefix}-*'.format(prefix=self.prefix))):
+            raise FileExistsError(SNAPSHOT_EXISTS.format(
+                directory=self.directory, prefix=self.prefix,
+            ))
+        return self
+
+    def next_path(self) -> Path:
+        suffix = BULK_FILE_SUFFIX
+        if self.compress:
+            suffix = '{suffix}{gzip}'.format(suffix=suffix, gzip=GZIP_SUFFIX)
+        return self.directory.joinpath('{prefix}-{number:05d}{suffix}'.format(
+            prefix=self.prefix, number=len(self.paths) + 1, suffix=suffix,
+        ))
+
+    def write_action(self, action: dict, source: bytes = None) -> None:
+        lines = [orjson.dumps(action)]
+        if source is not None:
+            lines.append(source)
+        lines.append(b'')
+        lines = b'\n'.join(lines)
+        overflow = self.bulk_file is not None and (
+            self.bulk_file.size + len(lines) > self.max_bytes
+        )
+        if overflow:
+            self.close()
+        if self.bulk_file is None:
+            self.bulk_file = BulkFile(self.next_path(), self.compress)
+        self.bulk_file.write(lines)
+
+    def write(self, index, documents: Iterable[FilmElastick]) -> int:
+        count = 0
+        for document in documents:
+            self.write_action(
+                {'index': {'_index': index, '_id': document.id}},
+                encode_source(document.dict()),
+            )
+            count += 1
+        return count
+
+    def delete(self, index, ids: List[str]) -> None:
+        for document_id in ids:
+            self.write_action(
+                {'delete': {'_index': index, '_id': document_id}},
+            )
+
+    def close(self) -> None:
+        """Закрыть текущий файл; следующая запись откроет новый."""
+        if self.bulk_file is None:
+            return
+        self.bulk_file.close()
+        self.paths.append(self.bulk_file.path)
+        self.bulk_file = None
+
+    def abort(self) -> None:
+        """
+        Удалить все файлы этой выгрузки.
+
+        Уже переименованные файлы тоже удаляются: без остальных replay
+        восстановил бы индекс частично.
+        """
+        if self.bulk_file is not None:
+            self.bulk_file.abort()
+            self.bulk_file = None
+        for path in self.paths:
+            path.unlink()
+        self.paths = []
+        get_logger(__name__).warning(SNAPSHOT_ABORTED.format(
+            prefix=self.prefix,
+        ))
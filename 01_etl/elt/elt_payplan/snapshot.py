@@ -0,0 +1,107 @@
+import time
+from typing import Generator
+
+from elt_payplan.data_transformer import DataTransform
+from elt_payplan.film_links import MOVIES_INDEX
+from elt_payplan.postgres_extractor import PostgresExtractor
+from elt_payplan.sinks import BaseSink
+from elt_payplan.tables import TABLES_PG
+from utils.logger import get_logger
+
+MIN_ELAPSED = 1e-6
+DUMP_STATS = (
+    'Выгрузка {index}: {count} док. за {elapsed:.1f} с ({rate:.0f} док./с)'
+)
+
+
+def table_source(
+    pg_conn: PostgresExtractor, transformer: DataTransform, table: dict,
+) -> dict:
+    """Индекс таблицы и функции извлечения и преобразования её строк."""
+    transform_index = table.get('transform_index')
+    if transform_index:
+        return {
+            'index_name': transform_index['index_name'],
+            'key': 'id',
+            'get_data': getattr(pg_conn, transform_index['get_data']),
+            'copy_data': getattr(pg_conn, transform_index['copy_data']),
+            'transform': getattr(
+                transformer, transform_index['func_transform'],
+            ),
+            'stream': getattr(transformer, transform_index['func_stream']),
+        }
+    return {
+        'index_name': MOVIES_INDEX,
+        'key': 'fw_id',
+        'get_data': pg_conn.get_film_data,
+        'copy_data': pg_conn.copy_film_rows,
+        'transform': transformer.transform_film,
+        'stream': transformer.stream_film,
+    }
+
+
+def table_documents(
+    pg_conn: PostgresExtractor,
+    transformer: DataTransform,
+    table: dict,
+    limit: int,
+    use_copy: bool = False,
+) -> Generator:
+    """
+    Все документы таблицы пачками.
+
+    Без use_copy id читаются страницами по limit в порядке первичного
+    ключа, без горизонта инкрементального ETL, и строки добираются
+    запросом на каждую страницу. С use_copy вся таблица приходит одним
+    COPY, а пачки по limit строк режутся на границе сущности.
+
+    Yields:
+        Iterable: документы одной пачки
+    """
+    source = table_source(pg_conn, transformer, table)
+    if use_copy:
+        yield from transformer.transform_pages(
+            source['copy_data'](), source['key'], source['transform'], limit,
+        )
+        return
+    generator_ids = pg_conn.get_all_ids(table['name'], limit)
+    yield from (
+        source['stream'](source['get_data']([row['id'] for row in table_ids]))
+        for table_ids in generator_ids
+    )
+
+
+def dump_documents(
+    pg_conn: PostgresExtractor,
+    transformer: DataTransform,
+    sink: BaseSink,
+    limit: int = 1000,
+    use_copy: bool = False,
+) -> dict:
+    """
+    Собрать все документы индексов и отдать их в sink.
+
+    Таблицы читаются целиком, без checkpoint в State, поэтому выгрузка
+    не сдвигает инкрементальный ETL. Возвращает число документов
+    по индексам.
+    """
+    logging = get_logger(__name__)
+    counts = {}
+    for table in TABLES_PG:
+        index_name = table_source(pg_conn, transformer, table)['index_name']
+        start = time.monotonic()
+        batches = table_documents(
+            pg_conn, transformer, table, limit, use_copy,
+        )
+        count = sum(
+            sink.write(index_name, documents) for documents in batches
+        )
+        elapsed = max(time.monotonic() - start, MIN_ELAPSED)
+        logging.info(DUMP_STATS.format(
+            index=index_name,
+            count=count,
+            elapsed=elapsed,
+            rate=count / elapsed,
+        ))
+        counts[index_name] = count
+    return counts
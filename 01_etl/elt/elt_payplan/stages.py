@@ -0,0 +1,180 @@
+from itertools import islice
+from typing import List
+
+from elt_payplan.data_transformer import DataTransform
+from elt_payplan.elasticsearch_loader import ElasticsearchLoader
+from elt_payplan.film_links import (
+    MOVIE_FIELDS,
+    MOVIES_INDEX,
+    propagate_film_links,
+    propagate_renames,
+    settled_link_ids,
+)
+from elt_payplan.postgres_extractor import PostgresExtractor
+
+
+def extract_index_data(
+    pg_conn: PostgresExtractor, table: dict, table_ids: List[str],
+):
+    """Строки для собственного индекса таблицы (persons, genres)."""
+    transform_index = table.get('transform_index')
+    if not transform_index:
+        return None
+    return getattr(pg_conn, transform_index['get_data'])(table_ids)
+
+
+def resolve_film_ids(
+    pg_conn: PostgresExtractor,
+    table: dict,
+    table_ids: List[str],
+    settled_ids: frozenset = None,
+) -> List[str]:
+    """
+    Идентификаторы фильмов, которые затрагивают изменённые записи.
+
+    Фильмы записей из settled_ids (изменились только их атрибуты)
+    не пересобираются.
+    """
+    if not table.get('func_film_id'):
+        return list(table_ids)
+    settled_ids = settled_ids or frozenset()
+    table_ids = [
+        table_id for table_id in table_ids if table_id not in settled_ids
+    ]
+    if not table_ids:
+        return []
+    return [
+        row['id']
+        for row in pg_conn.get_film_id_in_table(table['name'], table_ids)
+    ]
+
+
+def extract_settled_ids(
+    es_conn: ElasticsearchLoader, table: dict, index_rows: list,
+) -> frozenset:
+    """Записи без изменения связей с фильмами, если es_conn известен."""
+    if es_conn is None or index_rows is None:
+        return frozenset()
+    return frozenset(settled_link_ids(es_conn, table, index_rows))
+
+
+def extract_batch(
+    pg_conn: PostgresExtractor,
+    table: dict,
+    table_ids: List[str],
+    es_conn: ElasticsearchLoader = None,
+) -> dict:
+    """
+    Извлечь из Postgres всё, что нужно для пачки изменённых записей.
+
+    Возвращаемые строки могут быть ленивыми (серверный курсор),
+    поэтому их нужно прочитать до следующего запроса в соединение.
+    С es_conn фильмы персон и жанров, у которых поменялись только
+    атрибуты, не извлекаются: имена в них поправит load_batch.
+    """
+    index_rows = extract_index_data(pg_conn, table, table_ids)
+    if es_conn is not None and index_rows is not None:
+        index_rows = list(index_rows)
+    extracted = {
+        'index': index_rows,
+        'films': [],
+    }
+    film_ids = resolve_film_ids(
+        pg_conn,
+        table,
+        table_ids,
+        extract_settled_ids(es_conn, table, index_rows),
+    )
+    if film_ids:
+        extracted['films'] = pg_conn.get_film_data(film_ids)
+    return extracted
+
+
+def transform_batch(
+    transformer: DataTransform, table: dict, extracted: dict,
+) -> list:
+    """Преобразовать извлечённые строки в пары (индекс, документы)."""
+    documents = []
+    transform_index = table.get('transform_index')
+    if extracted['index'] is not None:
+        index_data = getattr(transformer, transform_index['func_transform'])(
+            extracted['index'],
+        )
+        documents.append((transform_index['index_name'], index_data.values()))
+
+    films = transformer.transform_film(extracted['films'])
+    if films:
+        documents.append(('movies', films.values()))
+    return documents
+
+
+def stream_batch(
+    transformer: DataTransform, table: dict, extracted: dict,
+) -> list:
+    """
+    Как transform_batch, но документы отдаются генераторами.
+
+    Документ собирается, когда загрузчик до него дошёл, поэтому
+    в памяти нет всей пачки фильмов, а запись в Elasticsearch
+    начинается с первых готовых документов.
+    """
+    documents = []
+    transform_index = table.get('transform_index')
+    if extracted['index'] is not None:
+        documents.append((
+            transform_index['index_name'],
+            getattr(transformer, transform_index['func_stream'])(
+                extracted['index'],
+            ),
+        ))
+    documents.append((MOVIES_INDEX, transformer.stream_film(
+        extracted['films'],
+    )))
+    return documents
+
+
+def fresh_documents(
+    es_conn: ElasticsearchLoader, index_name: str, portion: list, version,
+) -> list:
+    """Документы, которые не старее уже записанных в индексе."""
+    versions = es_conn.get_versions(
+        index_name, [document.id for document in portion],
+    )
+    return [
+        document
+        for document in portion
+        if versions.get(document.id, 0) <= version
+    ]
+
+
+def load_batch(
+    es_conn: ElasticsearchLoader, documents: list, version: int = None,
+) -> int:
+    """
+    Записать документы в индексы и вернуть их число.
+
+    Документы читаются порциями на один заход bulk (chunk_size
+    на каждый поток), так что генераторы stream_batch не собираются
+    в список целиком. С version (момент снимка Postgres) документы,
+    уже перезаписанные более свежим снимком, пропускаются до
+    пересчёта связей и отклоняются Elasticsearch при записи.
+    """
+    count = 0
+    portion_size = es_conn.chunk_size * max(es_conn.thread_count, 1)
+    for index_name, index_documents in documents:
+        index_documents = iter(index_documents)
+        while True:
+            portion = list(islice(index_documents, portion_size))
+            if not portion:
+                break
+            if version is not None:
+                portion = fresh_documents(
+                    es_conn, index_name, portion, version,
+                )
+            if index_name == MOVIES_INDEX:
+                propagate_film_links(es_conn, portion)
+            elif index_name in MOVIE_FIELDS:
+                propagate_renames(es_conn, index_name, portion)
+            es_conn.bulk_data_to_elastic(index_name, portion, version)
+            count += len(portion)
+    return count
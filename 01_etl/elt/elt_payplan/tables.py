@@ -0,0 +1,32 @@
+TRANSFORM_INDEX = {
+    'persons': {
+        'func_transform': 'transform_persons',
+        'func_stream': 'stream_persons',
+        'get_data': 'get_person_data',
+        'copy_data': 'copy_person_rows',
+        'index_name': 'persons',
+    },
+    'genres': {
+        'func_transform': 'transform_genres',
+        'func_stream': 'stream_genres',
+        'get_data': 'get_genre_data',
+        'copy_data': 'copy_genre_rows',
+        'index_name': 'genres',
+    },
+}
+
+TABLES_PG = [
+    {
+        'name': 'genre',
+        'func_film_id': True,
+        'transform_index': TRANSFORM_INDEX.get('genres', None),
+    },
+    {
+        'name': 'person',
+        'func_film_id': True,
+        'transform_index': TRANSFORM_INDEX.get('persons', None),
+    },
+    {
+        'name': 'film_work',
+    },
+]
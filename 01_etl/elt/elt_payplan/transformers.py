@@ -0,0 +1,12 @@
+from elt_payplan.data_transformer import DataTransform
+from elt_payplan.fast_transformer import FastDataTransform
+
+# Реализации преобразования по значению ETL_TRANSFORM. Колоночной
+# (NumPy, pyarrow) нет: строки приходят из psycopg2 объектами Python,
+# и перекладка их в колонки стоит почти столько же, сколько группировка
+# в FastDataTransform, а основное время уходит на сборку pydantic-моделей
+# готовых документов, которую векторизация не ускоряет.
+TRANSFORMERS = {
+    'default': DataTransform,
+    'fast': FastDataTransform,
+}
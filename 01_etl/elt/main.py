@@ -1,117 +1,154 @@
-import datetime
-import json
-import time
-
-from redis import Redis
+import atexit
 
 from config import Settings
-from elt_payplan.data_transformer import DataTransform
-from elt_payplan.elasticsearch_loader import ElasticsearchLoader
+from elt_payplan.change_set import ChangeSet, RedisChangeSet
+from elt_payplan.components import (
+    create_batch_sizes,
+    create_loader,
+    create_storage,
+    create_transformer,
+)
+from elt_payplan.modes import (
+    proccess,
+    proccess_change_log,
+    proccess_change_set,
+    proccess_notifications,
+    proccess_pipeline,
+    proccess_replication,
+    proccess_shards,
+    wait_for_changes,
+)
+from elt_payplan.pipeline import PipelineRunner
 from elt_payplan.postgres_extractor import PostgresExtractor
+from elt_payplan.postgres_listener import PostgresListener
+from elt_payplan.tables import TABLES_PG
+from elt_payplan.wal2json import ReplicationReader
+from utils.lease import ShardLeases
 from utils.logger import get_logger
-from utils.state import RedisStorage, State
-
-
-def loader_es(
-    state: State,
-    pg_conn: PostgresExtractor,
-    table: dict,
-    es_conn: ElasticsearchLoader,
-):
-    table_name = table['name']
-    limit = 100
-    state_table = json.loads(state.get_state(table_name))
-
-    state_date = state_table.get('date', datetime.datetime.min.isoformat())
-    date_end = state_date
 
-    generator_modified_ids = pg_conn.get_ids_modified_table(
-        table_name, state_date, limit,
+if __name__ == '__main__':
+    logging = get_logger(__name__)
+    settings = Settings().dict()
+    state, redis_conn = create_storage(settings)
+    etl_settings = settings['etl']
+    pg_conn = PostgresExtractor(
+        settings['postgres_dsl'],
+        itersize=etl_settings['itersize'],
+        aggregate_films=etl_settings['aggregate_films'],
+        checkpoint_lag=etl_settings['checkpoint_lag'],
     )
-    for modified_ids in generator_modified_ids:
-        date_end = datetime.now().isoformat()
-        if table.get('func_film_id'):
-            film_modified_ids = pg_conn.get_film_id_in_table(
-                table=table_name,
-                table_ids=[item['id'] for item in modified_ids],
-            )
-        else:
-            film_modified_ids = modified_ids
+    es_conn = create_loader(settings, redis_conn)
+    transformer = create_transformer(etl_settings)
+    batch_sizes = create_batch_sizes(etl_settings)
 
-        transform_personal_index = table.get('transform_personal_index', None)
-        if transform_personal_index:
-            get_data = transform_personal_index['get_data'](
-                [item['id'] for item in modified_ids],
-            )
-            serialize_data_index = transform_personal_index['func_transform'](
-                get_data,
-            )
-            es_conn.bulk_data_to_elastic(
-                transform_personal_index['index_name'],
-                serialize_data_index.values(),
-            )
-
-        film_result = pg_conn.get_film_data(
-            [item['id'] for item in film_modified_ids],
+    pipeline = None
+    if etl_settings['mode'] == 'pipeline':
+        pipeline = PipelineRunner(
+            settings['postgres_dsl'],
+            es_conn,
+            state,
+            TABLES_PG,
+            queue_size=etl_settings['queue_size'],
+            extract_workers=etl_settings['extract_workers'],
+            transform_workers=etl_settings['transform_workers'],
+            limit=etl_settings['batch_size'],
+            aggregate_films=etl_settings['aggregate_films'],
+            checkpoint_lag=etl_settings['checkpoint_lag'],
+            transformer=transformer,
         )
-        if film_result:
-            film_serialize = DataTransform.transform_film(film_result)
-            es_conn.bulk_data_to_elastic('movies', film_serialize.values())
-        state.set_state(table['name'], json.dumps({'date': state_date}))
-
-    state.set_state(table['name'], json.dumps({'offset': 0, 'date': date_end}))
 
+    leases = None
+    if etl_settings['mode'] == 'sharded':
+        leases = ShardLeases(
+            redis_conn, etl_settings['shards'], ttl=etl_settings['lease_ttl'],
+        )
+        leases.start()
+        atexit.register(leases.stop)
 
-def proccess(logging, state, pg_conn, es_conn, tables_pg):
-    try:
-        with pg_conn, es_conn:
-            for table in tables_pg:
-                loader_es(state, pg_conn, table, es_conn)
-    except Exception as exception:
-        logging.error(exception)
+    change_set = None
+    if etl_settings['mode'] == 'change_set':
+        change_set = ChangeSet()
+        if etl_settings['change_set_storage'] == 'redis':
+            change_set = RedisChangeSet(redis_conn)
 
+    reader = None
+    if etl_settings['mode'] == 'replication':
+        reader = ReplicationReader(
+            settings['postgres_dsl'],
+            slot_name=etl_settings['replication_slot'],
+        )
 
-if __name__ == '__main__':
-    logging = get_logger(__name__)
-    settings = Settings().dict()
-    state = State(
-        RedisStorage(redis_adapter=Redis(), redis_dsl=settings['redis_dsl'])
-    )
-    pg_conn = PostgresExtractor(settings['postgres_dsl'])
-    es_conn = ElasticsearchLoader(settings['elastic_dsl'])
+    change_log = etl_settings['mode'] == 'change_log'
+    with pg_conn:
+        pg_conn.set_change_log(change_log)
+    if change_log:
+        # Изменений до включения триггеров в журнале нет: их переносит
+        # один проход по modified от контрольных точек.
+        proccess(
+            logging,
+            state,
+            pg_conn,
+            es_conn,
+            TABLES_PG,
+            transformer,
+            batch_sizes,
+        )
 
-    transform_index = {
-        'persons': {
-            'func_transform': DataTransform.transform_persons,
-            'get_data': pg_conn.get_person_data,
-            'index_name': 'persons',
-        },
-        'genres': {
-            'func_transform': DataTransform.transform_genres,
-            'get_data': pg_conn.get_genre_data,
-            'index_name': 'genres',
-        },
-    }
-    tables_pg = [
-        {
-            'name': 'genre',
-            'func_film_id': True,
-            'transform_genre_index': transform_index.get(
-                'genres', None,
-            ),
-        },
-        {
-            'name': 'person',
-            'func_film_id': True,
-            'transform_personal_index': transform_index.get(
-                'persons', None,
-            ),
-        },
-        {
-            'name': 'film_work',
-        },
-    ]
+    listener = None
+    if etl_settings['notify']:
+        listener = PostgresListener(
+            settings['postgres_dsl'], debounce=etl_settings['notify_debounce'],
+        )
 
     while True:
-        proccess(logging, state, pg_conn, es_conn, tables_pg)
-        time.sleep(60)
+        if reader is not None:
+            proccess_replication(
+                logging,
+                state,
+                reader,
+                pg_conn,
+                es_conn,
+                transformer,
+                etl_settings['poll_interval'],
+                etl_settings['replication_timeout'],
+            )
+            continue
+        if pipeline:
+            proccess_pipeline(logging, es_conn, pipeline)
+        elif leases is not None:
+            proccess_shards(
+                logging,
+                state,
+                pg_conn,
+                es_conn,
+                TABLES_PG,
+                transformer,
+                batch_sizes,
+                leases,
+            )
+        elif change_log:
+            proccess_change_log(logging, pg_conn, es_conn, transformer)
+        elif change_set is not None:
+            proccess_change_set(
+                logging,
+                state,
+                pg_conn,
+                es_conn,
+                TABLES_PG,
+                transformer,
+                change_set,
+            )
+        else:
+            proccess(
+                logging,
+                state,
+                pg_conn,
+                es_conn,
+                TABLES_PG,
+                transformer,
+                batch_sizes,
+            )
+        changes = wait_for_changes(
+            logging, listener, etl_settings['poll_interval'],
+        )
+        proccess_notifications(logging, pg_conn, es_conn, transformer, changes)
@@ -0,0 +1,108 @@
+import asyncio
+
+from config import Settings
+from elt_payplan.async_postgres_extractor import AsyncPostgresExtractor
+from elt_payplan.async_stages import async_extract_batch, run_sync
+from elt_payplan.checkpoint import get_checkpoint, set_checkpoint
+from elt_payplan.components import (
+    create_loader,
+    create_storage,
+    create_transformer,
+)
+from elt_payplan.data_transformer import DataTransform
+from elt_payplan.elasticsearch_loader import ElasticsearchLoader
+from elt_payplan.stages import load_batch, stream_batch
+from elt_payplan.tables import TABLES_PG
+from utils.logger import get_logger
+from utils.state import State
+
+
+async def loader_es(  # noqa: WPS211
+    state: State,
+    pg_conn: AsyncPostgresExtractor,
+    table: dict,
+    es_conn: ElasticsearchLoader,
+    transformer: DataTransform,
+    limit: int,
+):
+    """
+    Перенести изменённые строки таблицы пачками по limit.
+
+    Извлечение идёт через asyncpg, а состояние в Redis и загрузка
+    (повторы, dead letter, пересчёт связей фильмов) - тем же синхронным
+    кодом, что и в main.py, в пуле потоков.
+    """
+    table_name = table['name']
+    checkpoint = await run_sync(get_checkpoint, state, table_name)
+
+    generator_modified_ids = pg_conn.get_ids_modified_table(
+        table_name, checkpoint, limit,
+    )
+    async for modified_ids in generator_modified_ids:
+        extracted = await async_extract_batch(
+            pg_conn,
+            table,
+            [item['id'] for item in modified_ids],
+            es_conn=es_conn,
+        )
+        await run_sync(
+            load_batch, es_conn, stream_batch(transformer, table, extracted),
+        )
+        await run_sync(set_checkpoint, state, table_name, modified_ids[-1])
+
+
+async def proccess(  # noqa: WPS211
+    logging, state, pg_conn, es_conn, tables_pg, transformer, limit,
+):
+    """Синхронизировать каждую таблицу отдельной конкурентной задачей."""
+    try:
+        async with pg_conn:
+            with es_conn:
+                results = await asyncio.gather(
+                    *(
+                        loader_es(
+                            state, pg_conn, table, es_conn, transformer, limit,
+                        )
+                        for table in tables_pg
+                    ),
+                    return_exceptions=True,
+                )
+    except Exception as exception:
+        logging.error(exception)
+        return
+    for table, result in zip(tables_pg, results):
+        if isinstance(result, Exception):
+            logging.error('{table}: {error}'.format(
+                table=table['name'], error=result,
+            ))
+
+
+async def main():
+    logging = get_logger(__name__)
+    settings = Settings().dict()
+    state, redis_conn = create_storage(settings)
+    etl_settings = settings['etl']
+    pg_conn = AsyncPostgresExtractor(
+        settings['postgres_dsl'],
+        max_size=len(TABLES_PG),
+        checkpoint_lag=etl_settings['checkpoint_lag'],
+        aggregate_films=etl_settings['aggregate_films'],
+    )
+    es_conn = create_loader(settings, redis_conn)
+    transformer = create_transformer(etl_settings)
+
+    while True:
+        await proccess(
+            logging,
+            state,
+            pg_conn,
+            es_conn,
+            TABLES_PG,
+            transformer,
+            etl_settings['batch_size'],
+        )
+        await asyncio.sleep(etl_settings['poll_interval'])
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
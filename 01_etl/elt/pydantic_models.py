@@ -28,7 +28,7 @@ class Genre(BaseModel):
 
 class GenreRaw(Genre):
     description: Optional[str]
-    film_work_id: str
+    film_work_id: Optional[str]
 
 
 class GenreElastic(Genre):
@@ -0,0 +1,57 @@
+from redis import Redis
+
+from config import Settings
+from elastic_index import INDEX
+from elt_payplan.backpressure import BackpressureMonitor
+from elt_payplan.elasticsearch_loader import ElasticsearchLoader
+from elt_payplan.postgres_extractor import PostgresExtractor
+from elt_payplan.reindex import BlueGreenReindex
+from elt_payplan.transformers import TRANSFORMERS
+from utils.dead_letter import RedisDeadLetterStorage
+from utils.fingerprint import FingerprintCache
+from utils.logger import get_logger
+
+if __name__ == '__main__':
+    logging = get_logger(__name__)
+    settings = Settings().dict()
+    etl_settings = settings['etl']
+    redis_conn = Redis(**settings['redis_dsl'])
+    fingerprints = None
+    if etl_settings['fingerprints']:
+        fingerprints = FingerprintCache(redis_conn)
+    backpressure = None
+    if etl_settings['backpressure']:
+        backpressure = BackpressureMonitor(
+            max_in_flight=etl_settings['reindex_threads'],
+            interval=etl_settings['backpressure_interval'],
+            latency_target=etl_settings['backpressure_latency'],
+        )
+    pg_conn = PostgresExtractor(
+        settings['postgres_dsl'],
+        itersize=etl_settings['itersize'],
+        aggregate_films=etl_settings['aggregate_films'],
+        checkpoint_lag=etl_settings['checkpoint_lag'],
+    )
+    es_conn = ElasticsearchLoader(
+        settings['elastic_dsl'],
+        thread_count=etl_settings['reindex_threads'],
+        chunk_size=etl_settings['bulk_chunk_size'],
+        max_chunk_bytes=etl_settings['bulk_max_chunk_bytes'],
+        max_retries=etl_settings['bulk_max_retries'],
+        dead_letter=RedisDeadLetterStorage(redis_conn),
+        backpressure=backpressure,
+    )
+    reindex = BlueGreenReindex(
+        pg_conn,
+        es_conn,
+        TRANSFORMERS[etl_settings['transform']](
+            aggregate_films=etl_settings['aggregate_films'],
+        ),
+        INDEX,
+        limit=etl_settings['reindex_batch_size'],
+        fingerprints=fingerprints,
+        use_copy=etl_settings['use_copy'],
+    )
+    with es_conn:
+        index_name = reindex.run()
+    logging.info('Переиндексация завершена: {index}'.format(index=index_name))
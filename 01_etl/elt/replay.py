@@ -0,0 +1,35 @@
+from redis import Redis
+
+from config import Settings
+from elt_payplan.backpressure import BackpressureMonitor
+from elt_payplan.elasticsearch_loader import ElasticsearchLoader
+from elt_payplan.replay import bulk_files, replay_files
+from utils.dead_letter import RedisDeadLetterStorage
+from utils.logger import get_logger
+
+if __name__ == '__main__':
+    logging = get_logger(__name__)
+    settings = Settings().dict()
+    etl_settings = settings['etl']
+    backpressure = None
+    if etl_settings['backpressure']:
+        backpressure = BackpressureMonitor(
+            max_in_flight=etl_settings['reindex_threads'],
+            interval=etl_settings['backpressure_interval'],
+            latency_target=etl_settings['backpressure_latency'],
+        )
+    es_conn = ElasticsearchLoader(
+        settings['elastic_dsl'],
+        thread_count=etl_settings['reindex_threads'],
+        chunk_size=etl_settings['bulk_chunk_size'],
+        max_chunk_bytes=etl_settings['bulk_max_chunk_bytes'],
+        max_retries=etl_settings['bulk_max_retries'],
+        dead_letter=RedisDeadLetterStorage(Redis(**settings['redis_dsl'])),
+        backpressure=backpressure,
+    )
+    paths = bulk_files(etl_settings['sink_dir'])
+    with es_conn:
+        count = replay_files(es_conn, paths)
+    logging.info('Replay завершён: файлов {files}, действий {count}'.format(
+        files=len(paths), count=count,
+    ))
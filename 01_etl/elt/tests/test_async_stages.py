@@ -0,0 +1,135 @@
+import asyncio
+
+import pytest
+
+from elt_payplan.async_postgres_extractor import (
+    AsyncPostgresExtractor,
+    checkpoint_moment,
+)
+from elt_payplan.async_stages import async_extract_batch, run_sync
+from elt_payplan.checkpoint import MIN_ID, MIN_MODIFIED
+from elt_payplan.queries import FILM_DATA_SQL, FILM_DOCUMENTS_SQL
+from elt_payplan.tables import TABLES_PG
+
+GENRE_TABLE = TABLES_PG[0]
+FILM_TABLE = TABLES_PG[2]
+
+
+class FakeAsyncExtractor(object):
+    def __init__(self, genre_rows, film_ids):
+        self.genre_rows = genre_rows
+        self.film_ids = film_ids
+        self.film_queries = []
+
+    async def get_genre_data(self, genre_ids):
+        return [row for row in self.genre_rows if row['id'] in genre_ids]
+
+    async def get_film_id_in_table(self, table, table_ids):
+        self.film_queries.append(list(table_ids))
+        return [
+            {'id': film_id}
+            for table_id in table_ids
+            for film_id in self.film_ids.get(table_id, [])
+        ]
+
+    async def get_film_data(self, film_ids):
+        return [{'fw_id': film_id} for film_id in film_ids]
+
+
+class FakeLoader(object):
+    def __init__(self, sources):
+        self.sources = sources
+
+    def get_sources(self, index, ids, fields):
+        return {
+            doc_id: source
+            for doc_id, source in self.sources.items()
+            if doc_id in ids
+        }
+
+
+def genre_row(genre_id, film_id):
+    return {'id': genre_id, 'name': genre_id, 'film_work_id': film_id}
+
+
+def test_run_sync_returns_result():
+    assert asyncio.run(run_sync(sorted, [3, 1], reverse=True)) == [3, 1]
+
+
+def test_extract_batch_skips_films_of_settled_rows():
+    pg_conn = FakeAsyncExtractor(
+        [genre_row('drama', 'f1'), genre_row('comedy', 'f2')],
+        {'drama': ['f1'], 'comedy': ['f2', 'f3']},
+    )
+    es_conn = FakeLoader({'drama': {'film_ids': ['f1']}})
+
+    extracted = asyncio.run(async_extract_batch(
+        pg_conn, GENRE_TABLE, ['drama', 'comedy'], es_conn=es_conn,
+    ))
+
+    assert len(extracted['index']) == 2
+    assert pg_conn.film_queries == [['comedy']]
+    assert extracted['films'] == [{'fw_id': 'f2'}, {'fw_id': 'f3'}]
+
+
+def test_extract_batch_without_loader_rebuilds_all_films():
+    pg_conn = FakeAsyncExtractor(
+        [genre_row('drama', 'f1')], {'drama': ['f1']},
+    )
+
+    extracted = asyncio.run(async_extract_batch(
+        pg_conn, GENRE_TABLE, ['drama'],
+    ))
+
+    assert pg_conn.film_queries == [['drama']]
+    assert extracted['films'] == [{'fw_id': 'f1'}]
+
+
+def test_extract_batch_of_films_uses_ids_as_is():
+    pg_conn = FakeAsyncExtractor([], {})
+
+    extracted = asyncio.run(async_extract_batch(
+        pg_conn, FILM_TABLE, ['f1'],
+    ))
+
+    assert extracted['index'] is None
+    assert pg_conn.film_queries == []
+    assert extracted['films'] == [{'fw_id': 'f1'}]
+
+
+
+class RecordingExtractor(AsyncPostgresExtractor):
+    def __init__(self, **kwargs):
+        super().__init__({}, **kwargs)
+        self.queries = []
+
+    async def query(self, sql, *args):
+        self.queries.append((sql, args))
+        return []
+
+
+async def collect(pages):
+    return [page async for page in pages]
+
+
+def test_modified_scan_passes_aware_moments():
+    pg_conn = RecordingExtractor()
+
+    asyncio.run(collect(pg_conn.get_ids_modified_table(
+        'genre', (MIN_MODIFIED, MIN_ID), 10,
+    )))
+
+    assert pg_conn.queries[0][1][0].tzinfo is not None
+    assert checkpoint_moment('2022-05-08T12:00:00').tzinfo is not None
+
+
+@pytest.mark.parametrize('aggregate_films, sql', [
+    (False, FILM_DATA_SQL),
+    (True, FILM_DOCUMENTS_SQL),
+])
+def test_film_query_follows_aggregate_films(aggregate_films, sql):
+    pg_conn = RecordingExtractor(aggregate_films=aggregate_films)
+
+    asyncio.run(pg_conn.get_film_data(['f1']))
+
+    assert pg_conn.queries == [(sql.format(ids='$1'), (['f1'],))]
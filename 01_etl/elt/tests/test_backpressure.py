@@ -0,0 +1,98 @@
+from types import SimpleNamespace
+
+import pytest
+
+from elt_payplan import backpressure
+from elt_payplan.backpressure import BackpressureMonitor
+
+
+class FakeCluster(object):
+    def __init__(self):
+        self.status = 'green'
+        self.rejected = 0
+        self.queue = 0
+
+    def health(self):
+        return {'status': self.status}
+
+    def stats(self, metric):
+        return {'nodes': {'n1': {'thread_pool': {'write': {
+            'rejected': self.rejected, 'queue': self.queue,
+        }}}}}
+
+    def info(self, node_id, metric):
+        return {'nodes': {node_id: {'thread_pool': {'write': {
+            'queue_size': 100,
+        }}}}}
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 100
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake_clock = Clock()
+    monkeypatch.setattr(backpressure.time, 'monotonic', fake_clock)
+    return fake_clock
+
+
+@pytest.fixture
+def cluster():
+    return FakeCluster()
+
+
+@pytest.fixture
+def monitor(cluster):
+    monitor = BackpressureMonitor(max_in_flight=8, interval=5)
+    monitor.bind(SimpleNamespace(cluster=cluster, nodes=cluster))
+    return monitor
+
+
+def sample(monitor, clock):
+    clock.now += monitor.interval
+    monitor.sample()
+
+
+def test_pressure_halves_limit_then_pauses(monitor, cluster, clock):
+    cluster.status = 'red'
+
+    limits = []
+    for _ in range(3):
+        sample(monitor, clock)
+        limits.append(monitor.limit)
+    sample(monitor, clock)
+
+    assert limits == [4, 2, 1]
+    assert monitor.paused_until == clock.now + monitor.interval
+
+
+def test_healthy_cluster_grows_limit_by_one(monitor, cluster, clock):
+    cluster.status = 'red'
+    sample(monitor, clock)
+    cluster.status = 'green'
+    sample(monitor, clock)
+
+    assert monitor.limit == 5
+
+
+def test_new_rejections_and_full_queue_are_pressure(monitor, cluster, clock):
+    sample(monitor, clock)
+    cluster.rejected = 3
+    sample(monitor, clock)
+    cluster.queue = 60
+    sample(monitor, clock)
+
+    assert monitor.limit == 2
+
+
+def test_samples_not_more_often_than_interval(monitor, cluster, clock):
+    cluster.status = 'red'
+    sample(monitor, clock)
+    monitor.sample()
+
+    assert monitor.limit == 4
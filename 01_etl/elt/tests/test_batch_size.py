@@ -0,0 +1,112 @@
+import pytest
+
+from utils import batch_size as batch_size_module
+from utils.batch_size import AdaptiveBatchSize
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake_clock = Clock()
+    monkeypatch.setattr(batch_size_module.time, 'monotonic', fake_clock)
+    return fake_clock
+
+
+def run_batch(batch_size, clock, seconds, rows=None, docs=None, **kwargs):
+    rows = batch_size.size if rows is None else rows
+    with batch_size.measure():
+        clock.now += seconds
+    return batch_size.record(rows, rows if docs is None else docs, **kwargs)
+
+
+def test_size_grows_while_rate_holds(clock):
+    batch_size = AdaptiveBatchSize('film_work', initial=100, min_size=10)
+
+    assert run_batch(batch_size, clock, 1) == 110
+    assert run_batch(batch_size, clock, 1) == 120
+
+
+def test_partial_batch_keeps_size(clock):
+    batch_size = AdaptiveBatchSize('film_work', initial=100)
+
+    assert run_batch(batch_size, clock, 1, rows=30) == 100
+
+
+def test_rejections_halve_size(clock):
+    batch_size = AdaptiveBatchSize('film_work', initial=100)
+
+    assert run_batch(batch_size, clock, 1, rejections=3) == 50
+
+
+def test_slow_batch_halves_size(clock):
+    batch_size = AdaptiveBatchSize('film_work', initial=100, max_seconds=2)
+
+    assert run_batch(batch_size, clock, 3) == 50
+
+
+def test_rate_drop_halves_size(clock):
+    batch_size = AdaptiveBatchSize('film_work', initial=100, min_size=10)
+    run_batch(batch_size, clock, 1)
+
+    assert run_batch(batch_size, clock, 2) == 55
+
+
+def test_size_is_clamped(clock):
+    batch_size = AdaptiveBatchSize(
+        'film_work', initial=100, min_size=80, max_size=120,
+    )
+
+    assert run_batch(batch_size, clock, 1, rejections=1) == 80
+    assert run_batch(batch_size, clock, 1, rejections=1) == 80
+    assert run_batch(batch_size, clock, 0.1) == 120
+    assert run_batch(batch_size, clock, 0.1) == 120
+
+
+def test_initial_size_is_clamped():
+    assert AdaptiveBatchSize('genre', initial=1, min_size=10).size == 10
+    assert AdaptiveBatchSize('genre', initial=10 ** 6, max_size=500).size == 500
+
+
+def test_whole_batch_is_timed(clock):
+    batch_size = AdaptiveBatchSize('film_work', initial=100, max_seconds=2)
+
+    with batch_size.measure():
+        clock.now += 1
+        clock.now += 1.5
+
+    assert batch_size.elapsed == 2.5
+    assert batch_size.record(100, 100) == 50
+
+
+class RecordingLogger(object):
+    def __init__(self):
+        self.messages = []
+
+    def info(self, message):
+        self.messages.append(message)
+
+
+def test_batch_log_reports_stages_and_stats(clock):
+    batch_size = AdaptiveBatchSize('film_work', initial=100)
+    batch_size.logging = RecordingLogger()
+
+    with batch_size.measure():
+        with batch_size.stage('выборка'):
+            clock.now += 0.5
+        with batch_size.stage('загрузка'):
+            clock.now += 1.5
+    batch_size.record(100, 100)
+
+    assert batch_size.stats()['stages'] == {'выборка': 0.5, 'загрузка': 1.5}
+    assert batch_size.logging.messages[0] == ''.join((
+        'Пачка film_work: 100 строк, 100 док. за 2.000 с ',
+        '(выборка 0.500 с, загрузка 1.500 с), размер 100, ',
+        'лучшая скорость 0 док./с',
+    ))
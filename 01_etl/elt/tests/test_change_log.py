@@ -0,0 +1,128 @@
+from elt_payplan import change_log
+from elt_payplan.change_log import ChangeLogBatch, sync_change_log
+from elt_payplan.postgres_extractor import PostgresExtractor
+
+
+class ChangeLogTable(object):
+    """content.change_log, в котором видны только зафиксированные записи."""
+
+    def __init__(self):
+        self.last_id = 0
+        self.committed = {}
+
+    def begin(self, entity_id):
+        """Вставка в открытой транзакции: id выдаётся сразу."""
+        self.last_id += 1
+        return {
+            'id': self.last_id,
+            'entity_type': 'film_work',
+            'entity_id': entity_id,
+            'operation': 'UPDATE',
+            'film_work_id': entity_id,
+            'related_id': None,
+        }
+
+    def commit(self, entry):
+        self.committed[entry['id']] = entry
+
+    def get_change_log(self, limit):
+        return [self.committed[key] for key in sorted(self.committed)][:limit]
+
+    def prune_change_log(self, ids):
+        for entry_id in ids:
+            del self.committed[entry_id]
+
+
+def applied_entries(monkeypatch):
+    applied = []
+
+    def apply_batch(pg_conn, es_conn, transformer, entries, limit):
+        applied.extend(entry['entity_id'] for entry in entries)
+        return 0, 0
+
+    monkeypatch.setattr(change_log, 'apply_change_log_batch', apply_batch)
+    return applied
+
+
+def test_interleaved_transactions_are_not_lost(monkeypatch):
+    applied = applied_entries(monkeypatch)
+    table = ChangeLogTable()
+    long_entry = table.begin('long')
+    short_entry = table.begin('short')
+    table.commit(short_entry)
+
+    sync_change_log(table, None, None)
+    assert applied == ['short']
+
+    table.commit(long_entry)
+    sync_change_log(table, None, None)
+    assert applied == ['short', 'long']
+    assert not table.committed
+
+
+def test_sync_reads_log_in_batches(monkeypatch):
+    applied = applied_entries(monkeypatch)
+    table = ChangeLogTable()
+    for number in range(5):
+        table.commit(table.begin(str(number)))
+
+    sync_change_log(table, None, None, limit=2)
+
+    assert applied == ['0', '1', '2', '3', '4']
+    assert not table.committed
+
+
+def test_batch_keeps_last_operation():
+    batch = ChangeLogBatch([
+        {'entity_type': 'person', 'entity_id': 'p1', 'operation': 'UPDATE'},
+        {'entity_type': 'person', 'entity_id': 'p1', 'operation': 'DELETE'},
+        {'entity_type': 'genre', 'entity_id': 'g1', 'operation': 'DELETE'},
+        {'entity_type': 'genre', 'entity_id': 'g1', 'operation': 'INSERT'},
+    ])
+
+    assert batch.ids('person', 'DELETE') == ['p1']
+    assert batch.index_ids('person') == []
+    assert batch.index_ids('genre') == ['g1']
+
+
+def test_batch_link_rows_touch_only_their_film():
+    batch = ChangeLogBatch([
+        {
+            'entity_type': 'person_film_work',
+            'entity_id': 'pfw1',
+            'operation': 'DELETE',
+            'film_work_id': 'f1',
+            'related_id': 'p1',
+        },
+    ])
+
+    assert batch.film_ids == {'f1'}
+    assert batch.index_ids('person') == ['p1']
+    assert batch.ids('person', 'UPSERT') == []
+
+
+class RecordingConnection(object):
+    def __init__(self):
+        self.queries = []
+        self.commits = 0
+
+    def execute(self, sql, params=None):
+        self.queries.append(' '.join(sql.split()))
+
+    def commit(self):
+        self.commits += 1
+
+
+def test_change_log_triggers_follow_mode():
+    pg_conn = PostgresExtractor({})
+    pg_conn.cursor = pg_conn.connection = RecordingConnection()
+
+    pg_conn.set_change_log(enabled=True)
+    enabled = pg_conn.cursor.queries
+    pg_conn.cursor.queries = []
+    pg_conn.set_change_log(enabled=False)
+
+    assert len(enabled) == 5
+    assert all(' ENABLE TRIGGER ' in sql for sql in enabled)
+    assert pg_conn.cursor.queries[-1] == 'TRUNCATE content.change_log;'
+    assert pg_conn.connection.commits == 2
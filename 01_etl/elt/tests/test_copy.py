@@ -0,0 +1,122 @@
+import queue
+from collections import namedtuple
+
+from elt_payplan.postgres_extractor import (
+    COPY_DONE,
+    PostgresExtractor,
+    copy_lines,
+    copy_values,
+)
+
+Column = namedtuple('Column', ['name'])
+
+
+class FakeCursor(object):
+    def __init__(self, columns, chunks):
+        self.columns = columns
+        self.chunks = chunks
+        self.description = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+    def execute(self, sql):
+        self.description = [Column(name) for name in self.columns]
+
+    def copy_expert(self, sql, writer):
+        for chunk in self.chunks:
+            writer.write(chunk)
+
+
+class FakeConnection(object):
+    def __init__(self, columns, chunks):
+        self.columns = columns
+        self.chunks = chunks
+
+    def cursor(self):
+        return FakeCursor(self.columns, self.chunks)
+
+
+def queued(*chunks):
+    chunk_queue = queue.Queue()
+    for chunk in chunks + (COPY_DONE,):
+        chunk_queue.put(chunk)
+    return chunk_queue
+
+
+def test_null_and_literal_backslash_n():
+    # Так COPY выводит NULL, строку '\N' и пустую строку.
+    assert copy_values('\\N\t\\\\N\t') == [None, '\\N', '']
+
+
+def test_escaped_multiline_and_tabs():
+    line = 'строка 1\\nстрока 2\tколонка\\tс табуляцией\tc:\\\\dir'
+
+    assert copy_values(line) == [
+        'строка 1\nстрока 2',
+        'колонка\tс табуляцией',
+        'c:\\dir',
+    ]
+
+
+def test_lines_split_inside_character():
+    data = 'Фильм\t\\N\nВторой\tописание\n'.encode('utf8')
+
+    lines = list(copy_lines(queued(data[:3], data[3:15], data[15:])))
+
+    assert lines == ['Фильм\t\\N', 'Второй\tописание']
+
+
+def test_copy_rows_by_column_names():
+    extractor = PostgresExtractor({})
+    extractor.connection = FakeConnection(
+        ['id', 'description', 'genres'],
+        [
+            b'1\tfirst\\nsecond\t[{"id": "g1"}]\n',
+            b'2\t\\\\N\t\\N\n',
+        ],
+    )
+
+    rows = list(extractor.copy_rows('SELECT 1', json_columns=('genres',)))
+
+    assert rows == [
+        {
+            'id': '1',
+            'description': 'first\nsecond',
+            'genres': [{'id': 'g1'}],
+        },
+        {'id': '2', 'description': '\\N', 'genres': None},
+    ]
+
+
+class FakeIdCursor(object):
+    """Отдаёт id по возрастанию после переданного, как ALL_IDS_SQL."""
+
+    def __init__(self, ids):
+        self.ids = ids
+        self.queries = []
+        self.page = []
+
+    def execute(self, sql, params):
+        self.queries.append(sql)
+        self.page = [
+            {'id': row_id} for row_id in self.ids if row_id > params['id']
+        ][:params['limit']]
+
+    def fetchall(self):
+        return self.page
+
+
+def test_all_ids_ignore_modified_horizon():
+    extractor = PostgresExtractor({})
+    extractor.cursor = FakeIdCursor(['a', 'b', 'c'])
+
+    pages = list(extractor.get_all_ids('genre', 2))
+
+    assert [[row['id'] for row in page] for page in pages] == [
+        ['a', 'b'], ['c'],
+    ]
+    assert not any('modified' in sql for sql in extractor.cursor.queries)
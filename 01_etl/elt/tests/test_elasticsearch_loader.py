@@ -0,0 +1,174 @@
+import fakeredis
+import orjson
+import pytest
+
+from elt_payplan import elasticsearch_loader
+from elt_payplan.elasticsearch_loader import (
+    ACTION_LINE_BYTES,
+    ElasticsearchLoader,
+    encode_source,
+)
+from utils.dead_letter import BaseDeadLetterStorage
+from utils.fingerprint import FingerprintCache
+
+
+class ListDeadLetterStorage(BaseDeadLetterStorage):
+    def __init__(self):
+        self.records = []
+
+    def save(self, records: list) -> None:
+        self.records.extend(records)
+
+
+class FakeBulkClient(object):
+    """Отвечает на _bulk статусами по _id из очереди statuses."""
+
+    def __init__(self, statuses=None):
+        self.statuses = statuses or {}
+        self.sent = []
+
+    def bulk(self, operations):
+        lines = operations.splitlines()
+        ids = [orjson.loads(line)['index']['_id'] for line in lines[::2]]
+        self.sent.append(ids)
+        items = []
+        for doc_id in ids:
+            statuses = self.statuses.get(doc_id) or [201]
+            status = statuses.pop(0)
+            result = {'_id': doc_id, 'status': status}
+            if status >= 300:
+                result['error'] = {'type': 'error_{0}'.format(status)}
+            items.append({'index': result})
+        errors = any('error' in item['index'] for item in items)
+        return {'errors': errors, 'items': items}
+
+
+def action(doc_id, source=b'{}'):
+    return {'_index': 'movies', '_id': doc_id, '_source': source}
+
+
+@pytest.fixture
+def dead_letter():
+    return ListDeadLetterStorage()
+
+
+@pytest.fixture
+def make_loader(monkeypatch, dead_letter):
+    monkeypatch.setattr(elasticsearch_loader.time, 'sleep', lambda _: None)
+
+    def make(client, **kwargs):
+        es_conn = ElasticsearchLoader({}, dead_letter=dead_letter, **kwargs)
+        es_conn.client = client
+        return es_conn
+    return make
+
+
+def test_chunks_limited_by_count_and_bytes():
+    es_conn = ElasticsearchLoader(
+        {}, chunk_size=2, max_chunk_bytes=ACTION_LINE_BYTES * 2 + 20,
+    )
+    actions = [
+        action('a'), action('b'), action('c'), action('d', b'x' * 30),
+    ]
+
+    chunks = list(es_conn.chunk_actions(actions))
+
+    assert [[item['_id'] for item in chunk] for chunk, _ in chunks] == [
+        ['a', 'b'], ['c'], ['d'],
+    ]
+    assert chunks[0][1] == (len(b'{}') + ACTION_LINE_BYTES) * 2
+
+
+def test_oversized_action_gets_own_chunk():
+    es_conn = ElasticsearchLoader({}, max_chunk_bytes=10)
+
+    chunks = list(es_conn.chunk_actions([action('a', b'x' * 50)]))
+
+    assert len(chunks) == 1
+
+
+def test_bulk_body_keeps_encoded_sources():
+    es_conn = ElasticsearchLoader({})
+    source = encode_source({'id': 'a', 'film_ids': {'f1'}})
+    actions = [
+        action('a', source),
+        {'_index': 'movies', '_id': 'b', '_op_type': 'delete'},
+    ]
+
+    lines = es_conn.encode_bulk_body(actions).split(b'\n')
+
+    assert orjson.loads(lines[0]) == {'index': {'_index': 'movies', '_id': 'a'}}
+    assert lines[1] == source == b'{"id":"a","film_ids":["f1"]}'
+    assert orjson.loads(lines[2]) == {
+        'delete': {'_index': 'movies', '_id': 'b'},
+    }
+    assert lines[3:] == [b'']
+
+
+def test_split_failed_items():
+    es_conn = ElasticsearchLoader({})
+    actions = [action('ok'), action('busy'), action('bad')]
+    response = FakeBulkClient({'busy': [429], 'bad': [400]}).bulk(
+        es_conn.encode_bulk_body(actions),
+    )
+
+    retry, failed = es_conn.split_failed_items(actions, response)
+
+    assert [item['_id'] for item in retry] == ['busy']
+    assert [(item['_id'], result['status']) for item, result in failed] == [
+        ('bad', 400),
+    ]
+
+
+def test_rejected_items_are_retried_alone(make_loader, dead_letter):
+    client = FakeBulkClient({'b': [429, 503, 201]})
+    es_conn = make_loader(client)
+
+    dead_ids = es_conn.send_actions('movies', [action('a'), action('b')])
+
+    assert client.sent == [['a', 'b'], ['b'], ['b']]
+    assert dead_ids == []
+    assert es_conn.rejections == 2
+    assert dead_letter.records == []
+
+
+def test_exhausted_and_failed_items_go_to_dead_letter(
+    make_loader, dead_letter,
+):
+    client = FakeBulkClient({'busy': [429] * 3, 'bad': [400]})
+    es_conn = make_loader(client, max_retries=1)
+
+    dead_ids = es_conn.send_actions(
+        'movies', [action('ok'), action('busy'), action('bad')],
+    )
+
+    assert client.sent == [['ok', 'busy', 'bad'], ['busy']]
+    assert sorted(dead_ids) == ['bad', 'busy']
+    assert {
+        record['id']: record['status'] for record in dead_letter.records
+    } == {'bad': 400, 'busy': None}
+
+
+def test_unchanged_documents_are_skipped(make_loader):
+    fingerprints = FingerprintCache(fakeredis.FakeRedis())
+    client = FakeBulkClient()
+    es_conn = make_loader(client, fingerprints=fingerprints)
+    actions = [action('a', b'{"v":1}'), action('b', b'{"v":1}')]
+
+    es_conn.send_chunk('movies', actions, 0)
+    es_conn.send_chunk('movies', actions, 0)
+    es_conn.send_chunk('movies', [action('a', b'{"v":2}')], 0)
+
+    assert client.sent == [['a', 'b'], ['a']]
+    assert (fingerprints.hits, fingerprints.misses) == (2, 3)
+
+
+def test_dead_documents_keep_no_fingerprint(make_loader):
+    fingerprints = FingerprintCache(fakeredis.FakeRedis())
+    client = FakeBulkClient({'a': [400]})
+    es_conn = make_loader(client, fingerprints=fingerprints)
+
+    es_conn.send_chunk('movies', [action('a'), action('b')], 0)
+    es_conn.send_chunk('movies', [action('a'), action('b')], 0)
+
+    assert client.sent == [['a', 'b'], ['a']]
@@ -0,0 +1,173 @@
+import pytest
+
+from elt_payplan import elasticsearch_loader
+from elt_payplan.elasticsearch_loader import ElasticsearchLoader
+from elt_payplan.film_links import (
+    ensure_movie_mapping,
+    film_link_changes,
+    propagate_film_links,
+)
+from pydantic_models import FilmElastick
+
+
+class FakeIndices(object):
+    def __init__(self, properties=None):
+        self.properties = properties
+        self.added = None
+
+    def exists(self, index):
+        return self.properties is not None
+
+    def get_mapping(self, index):
+        return {'movies_v1': {'mappings': {'properties': self.properties}}}
+
+    def put_mapping(self, index, properties):
+        self.added = properties
+
+
+class FakeClient(object):
+    def __init__(self, indices=None, conflicts=()):
+        self.indices = indices
+        self.conflicts = list(conflicts)
+        self.calls = 0
+
+    def options(self, **kwargs):
+        return self
+
+    def update_by_query(self, **kwargs):
+        self.calls += 1
+        conflicts = self.conflicts.pop(0) if self.conflicts else 0
+        return {'updated': 1, 'noops': 0, 'version_conflicts': conflicts}
+
+
+class LinkRecorder(object):
+    """Старые составы фильмов в movies и отправленные scripted update."""
+
+    def __init__(self, sources):
+        self.sources = sources
+        self.requested = []
+        self.updates = {}
+
+    def get_sources(self, index, ids, fields):
+        self.requested.extend(ids)
+        return {
+            doc_id: self.sources[doc_id]
+            for doc_id in ids
+            if doc_id in self.sources
+        }
+
+    def update_documents(self, index, updates):
+        self.updates[index] = {
+            doc_id: update['script']['params']
+            for doc_id, update in updates.items()
+        }
+
+
+def loader(client, max_retries=2):
+    es_conn = ElasticsearchLoader({}, max_retries=max_retries)
+    es_conn.client = client
+    return es_conn
+
+
+def test_link_changes_add_and_remove_films():
+    old_sources = {
+        'f1': {'actors': [{'id': 'p1'}], 'genres': [{'id': 'g1'}]},
+        'f2': {'writers': [{'id': 'p2'}]},
+    }
+    new_sources = {
+        'f1': {'actors': [{'id': 'p3'}], 'genres': [{'id': 'g1'}]},
+    }
+
+    changes = film_link_changes(old_sources, new_sources)
+
+    assert changes['persons'] == {
+        'p1': {'add': [], 'remove': ['f1']},
+        'p2': {'add': [], 'remove': ['f2']},
+        'p3': {'add': ['f1'], 'remove': []},
+    }
+    assert changes['genres'] == {}
+
+
+def test_new_film_adds_itself_everywhere():
+    changes = film_link_changes({}, {
+        'f1': {'directors': [{'id': 'p1'}], 'genres': [{'id': 'g1'}]},
+    })
+
+    assert changes['persons'] == {'p1': {'add': ['f1'], 'remove': []}}
+    assert changes['genres'] == {'g1': {'add': ['f1'], 'remove': []}}
+
+
+def test_propagation_updates_only_changed_links():
+    es_conn = LinkRecorder({
+        'f1': {'actors': [{'id': 'p1'}], 'genres': [{'id': 'g1'}]},
+        'f2': {'writers': [{'id': 'p2'}], 'genres': [{'id': 'g2'}]},
+    })
+    film = FilmElastick(
+        fw_id='f1',
+        title='Фильм',
+        actors=[{'id': 'p3', 'full_name': 'Персона'}],
+        genres=[{'id': 'g1', 'name': 'Жанр'}],
+    )
+
+    propagate_film_links(es_conn, films=[film], deleted_ids=['f2'])
+
+    assert es_conn.requested == ['f1', 'f2']
+    assert es_conn.updates['persons'] == {
+        'p1': {'add': [], 'remove': ['f1']},
+        'p2': {'add': [], 'remove': ['f2']},
+        'p3': {'add': ['f1'], 'remove': []},
+    }
+    assert es_conn.updates['genres'] == {'g2': {'add': [], 'remove': ['f2']}}
+
+
+def test_propagation_without_films_reads_nothing():
+    es_conn = LinkRecorder({})
+
+    propagate_film_links(es_conn)
+
+    assert es_conn.requested == []
+    assert es_conn.updates == {}
+
+
+def test_missing_nested_fields_are_added():
+    indices = FakeIndices({
+        'actors': {'type': 'nested'},
+        'writers': {'type': 'nested'},
+    })
+
+    ensure_movie_mapping(loader(FakeClient(indices)))
+
+    assert set(indices.added) == {
+        'directors', 'directors_names', 'genres', 'genres_names',
+    }
+    assert indices.added['genres']['type'] == 'nested'
+
+
+def test_wrong_field_type_stops_etl():
+    indices = FakeIndices({
+        'actors': {'type': 'nested'},
+        'writers': {'type': 'nested'},
+        'directors': {'type': 'nested'},
+        'genres': {'type': 'keyword'},
+    })
+
+    with pytest.raises(ValueError):
+        ensure_movie_mapping(loader(FakeClient(indices)))
+
+
+def test_update_by_query_repeats_on_conflicts(monkeypatch):
+    monkeypatch.setattr(elasticsearch_loader.time, 'sleep', lambda _: None)
+    client = FakeClient(conflicts=[3, 1, 0])
+
+    loader(client).update_by_query('movies', {}, {})
+
+    assert client.calls == 3
+
+
+def test_update_by_query_fails_when_conflicts_remain(monkeypatch):
+    monkeypatch.setattr(elasticsearch_loader.time, 'sleep', lambda _: None)
+    client = FakeClient(conflicts=[1, 1, 1])
+
+    with pytest.raises(RuntimeError):
+        loader(client).update_by_query('movies', {}, {})
+    assert client.calls == 3
@@ -0,0 +1,67 @@
+import fakeredis
+import pytest
+
+from utils.lease import ShardLeases
+
+
+@pytest.fixture
+def redis_conn():
+    return fakeredis.FakeRedis()
+
+
+def make_leases(redis_conn, worker_id, shards=4):
+    return ShardLeases(redis_conn, shards, worker_id=worker_id, ttl=30.0)
+
+
+def test_single_worker_takes_all_shards(redis_conn):
+    leases = make_leases(redis_conn, 'a')
+
+    assert leases.rebalance() == [0, 1, 2, 3]
+    assert leases.owns(2)
+
+
+def test_new_worker_gets_released_share(redis_conn):
+    first = make_leases(redis_conn, 'a')
+    second = make_leases(redis_conn, 'b')
+    first.rebalance()
+
+    assert second.rebalance() == []
+    kept = first.rebalance()
+    claimed = second.rebalance()
+
+    assert len(kept) == 2
+    assert len(claimed) == 2
+    assert not set(kept) & set(claimed)
+
+
+def test_lost_lease_is_not_renewed(redis_conn):
+    leases = make_leases(redis_conn, 'a')
+    leases.rebalance()
+    redis_conn.set(leases.shard_key(1), 'b')
+
+    leases.heartbeat()
+
+    assert not leases.owns(1)
+    assert leases.owns(0)
+
+
+def test_release_keeps_foreign_lease(redis_conn):
+    leases = make_leases(redis_conn, 'a')
+    leases.rebalance()
+    redis_conn.set(leases.shard_key(0), 'b')
+
+    leases.release(0)
+
+    assert redis_conn.get(leases.shard_key(0)) == b'b'
+
+
+def test_checkpoint_written_only_by_owner(redis_conn):
+    leases = make_leases(redis_conn, 'a')
+    leases.rebalance()
+
+    assert leases.set_if_owner(0, 'film_work:shard:0/4', 'mine')
+    redis_conn.set(leases.shard_key(0), 'b')
+    assert not leases.set_if_owner(0, 'film_work:shard:0/4', 'stale')
+
+    assert redis_conn.get('film_work:shard:0/4') == b'mine'
+    assert not leases.owns(0)
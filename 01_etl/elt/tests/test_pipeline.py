@@ -0,0 +1,57 @@
+import datetime
+import json
+
+from elt_payplan.pipeline import CheckpointTracker
+from utils.state import JsonFileStorage, State
+
+MODIFIED = datetime.datetime(2022, 5, 8, 12, 0)
+
+
+def row(row_id):
+    return {'modified': MODIFIED, 'id': row_id}
+
+
+def checkpoint_id(state, table_name):
+    return json.loads(state.get_state(table_name))['id']
+
+
+def make_tracker(tmp_path):
+    state = State(JsonFileStorage(str(tmp_path.joinpath('state.json'))))
+    tracker = CheckpointTracker(state)
+    batches = (
+        ('genre', 'g1'),
+        ('person', 'p1'),
+        ('genre', 'g2'),
+        ('person', 'p2'),
+    )
+    for seq, (table_name, row_id) in enumerate(batches):
+        tracker.register(seq, table_name, row(row_id))
+    return state, tracker
+
+
+def test_checkpoint_waits_for_earlier_batches(tmp_path):
+    state, tracker = make_tracker(tmp_path)
+
+    tracker.complete(2)
+    tracker.complete(1)
+
+    assert state.get_state('genre') is None
+    assert state.get_state('person') is None
+
+
+def test_checkpoint_moves_by_contiguous_prefix(tmp_path):
+    state, tracker = make_tracker(tmp_path)
+    tracker.complete(3)
+    tracker.complete(1)
+
+    tracker.complete(0)
+
+    assert checkpoint_id(state, 'genre') == 'g1'
+    assert checkpoint_id(state, 'person') == 'p1'
+    assert tracker.next_seq == 2
+
+    tracker.complete(2)
+
+    assert checkpoint_id(state, 'genre') == 'g2'
+    assert checkpoint_id(state, 'person') == 'p2'
+    assert tracker.next_seq == 4
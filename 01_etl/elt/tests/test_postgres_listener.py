@@ -0,0 +1,57 @@
+from elt_payplan import postgres_listener
+from elt_payplan.postgres_listener import PostgresListener
+
+
+class OpenConnection(object):
+    closed = False
+
+
+class ScriptedListener(PostgresListener):
+    """Отдаёт пачки уведомлений по очереди и запоминает таймауты poll."""
+
+    def __init__(self, batches, **kwargs):
+        super().__init__({}, **kwargs)
+        self.connection = OpenConnection()
+        self.batches = list(batches)
+        self.timeouts = []
+
+    def poll(self, timeout):
+        self.timeouts.append(timeout)
+        if not self.batches:
+            return []
+        return self.batches.pop(0)
+
+
+def change(row_id):
+    return {'table': 'film_work', 'operation': 'UPDATE', 'id': row_id}
+
+
+def test_series_of_changes_is_collected_in_one_wait():
+    listener = ScriptedListener(
+        [[change('f1')], [change('f2'), change('f3')], []], debounce=0.5,
+    )
+
+    changes = listener.wait(60)
+
+    assert [item['id'] for item in changes] == ['f1', 'f2', 'f3']
+    assert listener.timeouts == [60, 0.5, 0.5]
+
+
+def test_no_changes_returns_after_one_poll():
+    listener = ScriptedListener([], debounce=0.5)
+
+    assert listener.wait(60) == []
+    assert listener.timeouts == [60]
+
+
+def test_debounce_stops_at_timeout(monkeypatch):
+    clock = iter([0, 30, 61])
+    monkeypatch.setattr(
+        postgres_listener.time, 'monotonic', lambda: next(clock),
+    )
+    listener = ScriptedListener([[change(str(number))] for number in range(5)])
+
+    changes = listener.wait(60)
+
+    assert len(changes) == 2
+    assert len(listener.timeouts) == 2
@@ -0,0 +1,67 @@
+import orjson
+import pytest
+
+from elt_payplan.replay import bulk_files, read_bulk_file, replay_file
+from elt_payplan.sinks import NdjsonFileSink
+from pydantic_models import GenreElastic
+
+
+class BulkRecorder(object):
+    def __init__(self):
+        self.actions = []
+
+    def send_bulk_actions(self, index, actions):
+        self.actions.extend(actions)
+
+
+def genres(count):
+    return [
+        GenreElastic(id='g{0}'.format(number), name='Жанр', film_ids={'f1'})
+        for number in range(count)
+    ]
+
+
+@pytest.mark.parametrize('compress', [True, False])
+def test_snapshot_round_trip(tmp_path, compress):
+    with NdjsonFileSink(tmp_path, compress=compress) as sink:
+        assert sink.write('genres', genres(2)) == 2
+        sink.delete('genres', ['g9'])
+
+    actions = list(read_bulk_file(bulk_files(tmp_path)[0]))
+
+    assert [action['_id'] for action in actions] == ['g0', 'g1', 'g9']
+    assert actions[2]['_op_type'] == 'delete'
+    assert orjson.loads(actions[0]['_source'])['film_ids'] == ['f1']
+
+
+def test_files_rotate_without_splitting_documents(tmp_path):
+    with NdjsonFileSink(tmp_path, compress=False, max_bytes=150) as sink:
+        sink.write('genres', genres(3))
+
+    paths = bulk_files(tmp_path)
+    recorder = BulkRecorder()
+    counts = [replay_file(recorder, path) for path in paths]
+
+    assert len(paths) == 3
+    assert counts == [1, 1, 1]
+    assert not list(tmp_path.glob('*.part'))
+
+
+def test_existing_snapshot_is_not_overwritten(tmp_path):
+    with NdjsonFileSink(tmp_path) as sink:
+        sink.write('genres', genres(1))
+
+    with pytest.raises(FileExistsError):
+        with NdjsonFileSink(tmp_path):
+            pass
+
+
+@pytest.mark.parametrize('max_bytes', [150, 1024])
+def test_failed_snapshot_leaves_no_files(tmp_path, max_bytes):
+    with pytest.raises(RuntimeError):
+        with NdjsonFileSink(tmp_path, max_bytes=max_bytes) as sink:
+            sink.write('genres', genres(3))
+            raise RuntimeError('сбой выгрузки')
+
+    assert not bulk_files(tmp_path)
+    assert not list(tmp_path.iterdir())
@@ -0,0 +1,171 @@
+import datetime
+from operator import itemgetter
+
+import pytest
+
+from elt_payplan.data_transformer import DataTransform
+from elt_payplan.fast_transformer import FastDataTransform
+
+NOW = datetime.datetime(2022, 5, 8, 12, 0)
+
+
+def person_rows(*ids):
+    return [
+        {
+            'id': person_id,
+            'full_name': 'Персона {0}'.format(person_id),
+            'role': 'actor',
+            'film_work_id': 'f1',
+        }
+        for person_id in ids
+    ]
+
+
+def genre_row(genre_id, film_id):
+    return {
+        'id': genre_id,
+        'name': 'Жанр {0}'.format(genre_id),
+        'description': None,
+        'film_work_id': film_id,
+    }
+
+
+def film_row(film_id, person=None, role=None, genre=None):
+    return {
+        'fw_id': film_id,
+        'title': 'Фильм {0}'.format(film_id),
+        'description': None,
+        'rating': 7.5,
+        'type': 'movie',
+        'created': NOW,
+        'modified': NOW,
+        'role': role,
+        'pfw_id': None,
+        'id': person,
+        'full_name': person and 'Персона {0}'.format(person),
+        'genre_id': genre,
+        'name': genre and 'Жанр {0}'.format(genre),
+    }
+
+
+FILM_ROWS = (
+    film_row('f1', 'a', 'actor', 'g1'),
+    film_row('f1', 'a', 'actor', 'g2'),
+    film_row('f1', 'b', 'producer', 'g1'),
+    film_row('f1', 'c', 'director', 'g2'),
+    film_row('f1', 'b', 'actor', 'g1'),
+    film_row('f2'),
+    film_row('f3', 'a', 'director'),
+)
+
+# Персона без фильмов: LEFT JOIN даёт NULL в роли и связи.
+FILMLESS_PERSON = {
+    'id': 'c',
+    'full_name': 'Персона c',
+    'role': None,
+    'film_work_id': None,
+}
+
+
+def as_dicts(documents):
+    return {doc_id: document.dict() for doc_id, document in documents.items()}
+
+
+def test_stream_groups_one_document_per_key():
+    transformer = DataTransform()
+
+    documents = list(transformer.stream_persons(person_rows('a', 'a', 'b')))
+
+    assert [document.id for document in documents] == ['a', 'b']
+
+
+def test_stream_groups_rejects_unsorted_rows():
+    transformer = DataTransform()
+    documents = transformer.stream_persons(person_rows('a', 'b', 'a'))
+
+    with pytest.raises(ValueError):
+        list(documents)
+
+
+@pytest.mark.parametrize('transform, rows', [
+    ('transform_film', FILM_ROWS),
+    ('transform_persons', person_rows('a', 'a', 'b') + [FILMLESS_PERSON]),
+    ('transform_genres', [
+        genre_row('g1', 'f1'), genre_row('g1', 'f2'), genre_row('g2', None),
+    ]),
+])
+def test_fast_transform_matches_default(transform, rows):
+    expected = getattr(DataTransform(), transform)(rows)
+    documents = getattr(FastDataTransform(), transform)(rows)
+
+    assert list(documents) == list(expected)
+    assert as_dicts(documents) == as_dicts(expected)
+
+
+def test_film_less_rows_give_empty_links():
+    persons = FastDataTransform().transform_persons([FILMLESS_PERSON])
+    genres = FastDataTransform().transform_genres([genre_row('g2', None)])
+
+    assert (persons['c'].role, persons['c'].film_ids) == (set(), set())
+    assert genres['g2'].film_ids == set()
+
+
+def film_document_rows(rows):
+    """Строки FILM_DOCUMENTS_SQL: json_agg(DISTINCT ...) по ролям и жанрам."""
+    documents = {}
+    for row in rows:
+        document = documents.setdefault(row['fw_id'], {
+            'fw_id': row['fw_id'],
+            'title': row['title'],
+            'description': row['description'],
+            'rating': row['rating'],
+            'actor': [],
+            'producer': [],
+            'director': [],
+            'genres': [],
+        })
+        person = {'id': row['id'], 'full_name': row['full_name']}
+        if row['role'] and person not in document[row['role']]:
+            document[row['role']].append(person)
+        genre = {'id': row['genre_id'], 'name': row['name']}
+        if row['genre_id'] and genre not in document['genres']:
+            document['genres'].append(genre)
+    return [
+        {
+            'fw_id': document['fw_id'],
+            'title': document['title'],
+            'description': document['description'],
+            'rating': document['rating'],
+            'actors': sorted(document['actor'], key=itemgetter('id')),
+            'writers': sorted(document['producer'], key=itemgetter('id')),
+            'directors': sorted(document['director'], key=itemgetter('id')),
+            'genres': sorted(document['genres'], key=itemgetter('id')),
+        }
+        for document in documents.values()
+    ]
+
+
+def unordered(document):
+    """Документ без порядка вложенных списков: json_agg его не сохраняет."""
+    document = document.dict()
+    for field in ('actors', 'writers', 'directors', 'genres'):
+        document[field] = sorted(document[field], key=itemgetter('id'))
+    document['genres_names'] = sorted(document['genres_names'])
+    return document
+
+
+@pytest.mark.parametrize('transformer_class', [
+    DataTransform, FastDataTransform,
+])
+def test_film_documents_match_joined_rows(transformer_class):
+    expected = DataTransform().transform_film(FILM_ROWS)
+    documents = transformer_class(aggregate_films=True).transform_film(
+        film_document_rows(FILM_ROWS),
+    )
+
+    assert list(documents) == list(expected) == ['f1', 'f2', 'f3']
+    assert {
+        doc_id: unordered(document) for doc_id, document in documents.items()
+    } == {
+        doc_id: unordered(document) for doc_id, document in expected.items()
+    }
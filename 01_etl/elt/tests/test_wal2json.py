@@ -0,0 +1,55 @@
+from elt_payplan.wal2json import change_to_entries
+
+
+def columns(**values):
+    return [{'name': name, 'value': value} for name, value in values.items()]
+
+
+def test_link_update_records_old_and_new_film():
+    entries = change_to_entries({
+        'action': 'U',
+        'table': 'person_film_work',
+        'columns': columns(id='pfw1', film_work_id='f2', person_id='p1'),
+        'identity': columns(id='pfw1', film_work_id='f1', person_id='p1'),
+    })
+
+    assert [entry['film_work_id'] for entry in entries] == ['f2', 'f1']
+    assert {entry['related_id'] for entry in entries} == {'p1'}
+    assert {entry['operation'] for entry in entries} == {'UPDATE'}
+
+
+def test_delete_is_read_from_identity():
+    entries = change_to_entries({
+        'action': 'D',
+        'table': 'genre_film_work',
+        'identity': columns(id='gfw1', film_work_id='f1', genre_id='g1'),
+    })
+
+    assert entries == [{
+        'entity_type': 'genre_film_work',
+        'entity_id': 'gfw1',
+        'operation': 'DELETE',
+        'film_work_id': 'f1',
+        'related_id': 'g1',
+    }]
+
+
+def test_insert_of_entity_has_no_links():
+    entries = change_to_entries({
+        'action': 'I',
+        'table': 'person',
+        'columns': columns(id='p1', full_name='Персона'),
+    })
+
+    assert entries == [{
+        'entity_type': 'person',
+        'entity_id': 'p1',
+        'operation': 'INSERT',
+        'film_work_id': None,
+        'related_id': None,
+    }]
+
+
+def test_transaction_markers_give_no_entries():
+    assert change_to_entries({'action': 'B'}) == []
+    assert change_to_entries({'action': 'C'}) == []
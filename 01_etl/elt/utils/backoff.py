@@ -1,16 +1,31 @@
+import random
 import time
 from functools import wraps
 
-from logger import get_logger
+from utils.logger import get_logger
 
-RETRIES_EXCEPTION = (
+RETRIES_EXCEPTION = ''.join((
     'Повторный запуск. Функция: {function}, ',
-    'завершила рабобу с ошибкой: {exceprion}',
-)
-FINALLY_EXCEPTION = (
-    'Превышено максимальное время ожидания выполнения функции: {function},',
-    'приложение завершило работу с ошибкой {exceprion}',
-)
+    'завершила рабобу с ошибкой: {exception}',
+))
+FINALLY_EXCEPTION = ''.join((
+    'Превышено максимальное время ожидания выполнения функции: {function}, ',
+    'приложение завершило работу с ошибкой {exception}',
+))
+
+
+def jittered_sleep_time(
+    retries, start_sleep_time=0.1, factor=2, border_sleep_time=10,
+):
+    """
+    Время ожидания перед повтором с экспоненциальным ростом и джиттером.
+
+    Берётся случайное значение от 0 до start_sleep_time * factor^retries
+    (но не больше border_sleep_time), чтобы параллельные повторы
+    не приходили в Elasticsearch одновременно.
+    """
+    sleep_time = min(start_sleep_time * factor ** retries, border_sleep_time)
+    return random.uniform(0, sleep_time)  # noqa: S311
 
 
 def backoff(
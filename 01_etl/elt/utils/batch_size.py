@@ -0,0 +1,146 @@
+import time
+from contextlib import contextmanager
+
+from utils.logger import get_logger
+
+MIN_ELAPSED = 1e-6
+BATCH_STATS = ''.join((
+    'Пачка {name}: {rows} строк, {docs} док. за {elapsed:.3f} с ',
+    '({stages}), размер {size}, лучшая скорость {best_rate:.0f} док./с',
+))
+STAGE_STATS = '{stage} {elapsed:.3f} с'
+BATCH_SIZE_CHANGED = 'Размер пачки {name}: {old} -> {new} ({reason})'
+REASON_REJECTIONS = 'Elasticsearch отклонил {rejections} док.'
+REASON_SLOW = 'пачка дольше {seconds} с'
+REASON_RATE_DROP = 'скорость упала с {best:.0f} до {rate:.0f} док./с'
+REASON_RATE_GROWTH = 'скорость {rate:.0f} док./с'
+
+
+class AdaptiveBatchSize(object):  # noqa: WPS230
+    """
+    Размер пачки, подбираемый по скорости загрузки (AIMD).
+
+    После каждой полной пачки размер растёт на increase, пока число
+    документов в секунду не падает. При отказах Elasticsearch, слишком
+    долгой пачке или падении скорости больше чем на tolerance размер
+    уменьшается в decrease раз. Неполные пачки (хвост изменений) размер
+    не меняют: по ним не видно, как система справляется с нагрузкой.
+
+    Скорость считается по времени всей пачки от запроса id до ответа
+    bulk. Этапы внутри пачки засекаются stage() только для журнала:
+    документы собираются по ходу записи, поэтому преобразование и
+    загрузка - один этап.
+    """
+
+    def __init__(  # noqa: WPS211
+        self,
+        name: str,
+        initial: int = 100,
+        min_size: int = 10,
+        max_size: int = 5000,
+        increase: int = None,
+        decrease: float = 0.5,
+        max_seconds: float = 5.0,
+        tolerance: float = 0.1,
+    ):
+        self.name = name
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size)
+        self.size = min(max(initial, min_size), self.max_size)
+        self.increase = increase or max(self.min_size, 1)
+        self.decrease = decrease
+        self.max_seconds = max_seconds
+        self.tolerance = tolerance
+        self.best_rate = 0
+        self.elapsed = 0
+        self.stages = {}
+        self.reason = None
+        self.logging = get_logger(__name__)
+
+    @contextmanager
+    def measure(self):
+        """
+        Засечь время пачки целиком.
+
+        Yields:
+            None: тело блока - обработка одной пачки
+        """
+        self.stages = {}
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.elapsed = time.monotonic() - start
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Засечь этап пачки внутри measure().
+
+        Yields:
+            None: тело блока - этап пачки
+        """
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.stages[name] = time.monotonic() - start
+
+    def stats(self) -> dict:
+        return {
+            'name': self.name,
+            'size': self.size,
+            'best_rate': self.best_rate,
+            'reason': self.reason,
+            'stages': dict(self.stages),
+        }
+
+    def record(self, rows: int, docs: int, rejections: int = 0) -> int:
+        """Учесть завершённую пачку и вернуть размер следующей."""
+        elapsed = max(self.elapsed, MIN_ELAPSED)
+        rate = docs / elapsed
+        stats = self.stats()
+        stats['stages'] = ', '.join(
+            STAGE_STATS.format(stage=stage, elapsed=stage_elapsed)
+            for stage, stage_elapsed in stats['stages'].items()
+        )
+        self.logging.info(BATCH_STATS.format(
+            rows=rows, docs=docs, elapsed=elapsed, **stats,
+        ))
+
+        if rejections:
+            reason = REASON_REJECTIONS.format(rejections=rejections)
+            self.resize(self.shrink(), reason, rate)
+        elif elapsed > self.max_seconds:
+            reason = REASON_SLOW.format(seconds=self.max_seconds)
+            self.resize(self.shrink(), reason, rate)
+        elif rows < self.size:
+            return self.size
+        elif rate < self.best_rate * (1 - self.tolerance):
+            reason = REASON_RATE_DROP.format(best=self.best_rate, rate=rate)
+            self.resize(self.shrink(), reason, rate)
+        else:
+            self.best_rate = max(self.best_rate, rate)
+            reason = REASON_RATE_GROWTH.format(rate=rate)
+            self.resize(self.size + self.increase, reason, self.best_rate)
+        return self.size
+
+    def shrink(self) -> int:
+        return int(self.size * self.decrease)
+
+    def resize(self, size: int, reason: str, best_rate: float) -> None:
+        """
+        Сменить размер в пределах [min_size, max_size].
+
+        После уменьшения лучшая скорость сбрасывается к текущей, чтобы
+        снова искать предел от нового размера.
+        """
+        self.best_rate = best_rate
+        size = min(max(size, self.min_size), self.max_size)
+        if size == self.size:
+            return
+        self.logging.info(BATCH_SIZE_CHANGED.format(
+            name=self.name, old=self.size, new=size, reason=reason,
+        ))
+        self.size = size
+        self.reason = reason
@@ -0,0 +1,35 @@
+import abc
+import json
+from pathlib import Path
+
+from redis import Redis
+
+
+class BaseDeadLetterStorage(object):
+    @abc.abstractmethod
+    def save(self, records: list) -> None:
+        """Сохранить документы, которые не удалось проиндексировать."""
+
+
+class JsonFileDeadLetterStorage(BaseDeadLetterStorage):
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        Path(self.file_path).touch(exist_ok=True)
+
+    def save(self, records: list) -> None:
+        with open(self.file_path, 'a') as write_file:
+            for record in records:
+                write_file.write(json.dumps(record, ensure_ascii=False))
+                write_file.write('\n')
+
+
+class RedisDeadLetterStorage(BaseDeadLetterStorage):
+    def __init__(self, redis_conn: Redis, key: str = 'etl:dead_letter'):
+        self.redis_conn = redis_conn
+        self.key = key
+
+    def save(self, records: list) -> None:
+        if records:
+            self.redis_conn.rpush(self.key, *(
+                json.dumps(record, ensure_ascii=False) for record in records
+            ))
@@ -0,0 +1,76 @@
+import hashlib
+import threading
+from typing import Dict, List
+
+from redis import Redis
+
+FINGERPRINT_BYTES = 16
+
+
+def fingerprint(source: bytes) -> str:
+    return hashlib.blake2b(source, digest_size=FINGERPRINT_BYTES).hexdigest()
+
+
+class FingerprintCache(object):
+    """
+    Отпечатки документов, уже записанных в Elasticsearch.
+
+    Для каждого индекса в Redis хранится хеш _id -> blake2b тела документа.
+    Документ, тело которого не изменилось, повторно не отправляется.
+    """
+
+    def __init__(self, redis_conn: Redis, key_prefix: str = 'etl:fingerprint'):
+        self.redis_conn = redis_conn
+        self.key_prefix = key_prefix
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, index: str) -> str:
+        return '{prefix}:{index}'.format(prefix=self.key_prefix, index=index)
+
+    def changed(self, index: str, actions: List[dict]) -> tuple:
+        """
+        Оставить только действия, которые что-то меняют в индексе.
+
+        Действия index с тем же отпечатком отбрасываются, прочие
+        (update, delete) проходят как есть. Возвращает действия
+        и отпечатки, которые нужно сохранить после успешной записи.
+        """
+        indexed = [
+            action
+            for action in actions
+            if action.get('_op_type', 'index') == 'index'
+        ]
+        if not indexed:
+            return actions, {}
+        stored = dict(zip(
+            (action['_id'] for action in indexed),
+            self.redis_conn.hmget(
+                self.key(index), [action['_id'] for action in indexed],
+            ),
+        ))
+        changed, fingerprints = [], {}
+        for action in actions:
+            if action.get('_op_type', 'index') == 'index':
+                source_fingerprint = fingerprint(action['_source'])
+                stored_fingerprint = stored[action['_id']]
+                if stored_fingerprint == source_fingerprint.encode():
+                    continue
+                fingerprints[action['_id']] = source_fingerprint
+            changed.append(action)
+        with self.lock:
+            self.hits += len(indexed) - len(fingerprints)
+            self.misses += len(fingerprints)
+        return changed, fingerprints
+
+    def save(self, index: str, fingerprints: Dict[str, str]) -> None:
+        if fingerprints:
+            self.redis_conn.hset(self.key(index), mapping=fingerprints)
+
+    def forget(self, index: str, ids: List[str]) -> None:
+        if ids:
+            self.redis_conn.hdel(self.key(index), *ids)
+
+    def clear(self, index: str) -> None:
+        self.redis_conn.delete(self.key(index))
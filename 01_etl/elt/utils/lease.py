@@ -0,0 +1,209 @@
+import math
+import os
+import socket
+import threading
+import time
+import zlib
+from typing import List
+from uuid import uuid4
+
+from redis import Redis
+
+from utils.logger import get_logger
+
+# Продлить или снять аренду может только её владелец.
+RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+# Записать значение, только пока аренда шарда принадлежит воркеру:
+# проверка и запись выполняются в Redis атомарно.
+SET_IF_OWNER_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('set', KEYS[2], ARGV[2])
+end
+return false
+"""
+LEASES_CHANGED = (
+    'Воркер {worker}: шарды {shards} из {count}, воркеров {workers}'
+)
+LEASE_LOST = 'Воркер {worker}: потеряна аренда шарда {shard}'
+HEARTBEAT_FAILED = 'Воркер {worker}: не удалось продлить аренды: {error}'
+
+
+class ShardLeases(object):  # noqa: WPS214, WPS230
+    """
+    Аренда шардов ETL между несколькими воркерами через Redis.
+
+    Шард занимается ключом SET NX с TTL и продлевается фоновым
+    heartbeat. Живые воркеры отмечаются в sorted set; каждый держит
+    не больше ceil(шардов / воркеров) шардов, поэтому при появлении
+    нового воркера лишние аренды отпускаются, а шарды упавшего воркера
+    освобождаются по истечении TTL и разбираются остальными.
+    """
+
+    def __init__(  # noqa: WPS211
+        self,
+        redis_conn: Redis,
+        shards: int,
+        worker_id: str = None,
+        ttl: float = 30.0,
+        key_prefix: str = 'etl:lease',
+    ):
+        self.redis_conn = redis_conn
+        self.shards = shards
+        self.worker_id = worker_id or '{host}:{pid}:{suffix}'.format(
+            host=socket.gethostname(), pid=os.getpid(), suffix=uuid4().hex[:8],
+        )
+        self.ttl = ttl
+        self.key_prefix = key_prefix
+        self.owned = set()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.heartbeat_thread = None
+        self.renew_script = redis_conn.register_script(RENEW_SCRIPT)
+        self.release_script = redis_conn.register_script(RELEASE_SCRIPT)
+        self.set_if_owner_script = redis_conn.register_script(
+            SET_IF_OWNER_SCRIPT,
+        )
+        self.logging = get_logger(__name__)
+
+    @property
+    def ttl_ms(self) -> int:
+        return int(self.ttl * 1000)
+
+    @property
+    def workers_key(self) -> str:
+        return '{prefix}:workers'.format(prefix=self.key_prefix)
+
+    def shard_key(self, shard: int) -> str:
+        return '{prefix}:{count}:{shard}'.format(
+            prefix=self.key_prefix, count=self.shards, shard=shard,
+        )
+
+    def live_workers(self) -> int:
+        """Отметить себя живым и вернуть число живых воркеров."""
+        now = time.time()
+        pipeline = self.redis_conn.pipeline()
+        pipeline.zadd(self.workers_key, {self.worker_id: now})
+        pipeline.zremrangebyscore(self.workers_key, '-inf', now - self.ttl)
+        pipeline.zcard(self.workers_key)
+        return max(pipeline.execute()[-1], 1)
+
+    def heartbeat(self) -> None:
+        """Продлить свои аренды и забыть те, что уже истекли."""
+        self.live_workers()
+        with self.lock:
+            for shard in sorted(self.owned):
+                renewed = self.renew_script(
+                    keys=[self.shard_key(shard)],
+                    args=[self.worker_id, self.ttl_ms],
+                )
+                if not renewed:
+                    self.owned.discard(shard)
+                    self.logging.warning(LEASE_LOST.format(
+                        worker=self.worker_id, shard=shard,
+                    ))
+
+    def claim_order(self) -> List[int]:
+        """Шарды в порядке, зависящем от воркера, чтобы реже сталкиваться."""
+        offset = zlib.crc32(self.worker_id.encode()) % self.shards
+        return [
+            (offset + step) % self.shards for step in range(self.shards)
+        ]
+
+    def rebalance(self) -> List[int]:
+        """Привести число своих шардов к справедливой доле и вернуть их."""
+        self.heartbeat()
+        workers = self.live_workers()
+        share = math.ceil(self.shards / workers)
+        with self.lock:
+            previous = set(self.owned)
+            for shard in sorted(self.owned, reverse=True):
+                if len(self.owned) <= share:
+                    break
+                self.release(shard)
+            for candidate in self.claim_order():
+                if len(self.owned) >= share:
+                    break
+                if candidate in self.owned:
+                    continue
+                claimed = self.redis_conn.set(
+                    self.shard_key(candidate),
+                    self.worker_id,
+                    nx=True,
+                    px=self.ttl_ms,
+                )
+                if claimed:
+                    self.owned.add(candidate)
+            if self.owned != previous:
+                self.logging.info(LEASES_CHANGED.format(
+                    worker=self.worker_id,
+                    shards=sorted(self.owned),
+                    count=self.shards,
+                    workers=workers,
+                ))
+            return sorted(self.owned)
+
+    def owns(self, shard: int) -> bool:
+        with self.lock:
+            return shard in self.owned
+
+    def set_if_owner(self, shard: int, key: str, value: str) -> bool:
+        """
+        Записать key, если аренда шарда ещё у этого воркера.
+
+        Контрольная точка шарда пишется этим методом: воркер, у которого
+        аренда истекла во время пачки, не перезапишет точку нового
+        владельца. При отказе шард сразу считается потерянным.
+        """
+        stored = self.set_if_owner_script(
+            keys=[self.shard_key(shard), key], args=[self.worker_id, value],
+        )
+        if stored:
+            return True
+        with self.lock:
+            self.owned.discard(shard)
+        self.logging.warning(LEASE_LOST.format(
+            worker=self.worker_id, shard=shard,
+        ))
+        return False
+
+    def release(self, shard: int) -> None:
+        self.release_script(
+            keys=[self.shard_key(shard)], args=[self.worker_id],
+        )
+        self.owned.discard(shard)
+
+    def start(self) -> None:
+        """Запустить фоновое продление аренд раз в треть TTL."""
+        self.stopped.clear()
+        self.heartbeat_thread = threading.Thread(
+            target=self.run_heartbeat, daemon=True,
+        )
+        self.heartbeat_thread.start()
+
+    def run_heartbeat(self) -> None:
+        while not self.stopped.wait(self.ttl / 3):
+            try:
+                self.heartbeat()
+            except Exception as exception:
+                self.logging.error(HEARTBEAT_FAILED.format(
+                    worker=self.worker_id, error=exception,
+                ))
+
+    def stop(self) -> None:
+        """Остановить heartbeat и отдать шарды остальным воркерам."""
+        self.stopped.set()
+        with self.lock:
+            for shard in list(self.owned):
+                self.release(shard)
+        self.redis_conn.zrem(self.workers_key, self.worker_id)
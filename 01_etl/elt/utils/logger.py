@@ -2,12 +2,12 @@ import logging
 from pathlib import Path
 
 BASE_PATH = Path(__file__).resolve()
-PATH_TO_LOG = BASE_PATH.parents[4].joinpath('logs', 'backoff')
+PATH_TO_LOG = BASE_PATH.parents[2].joinpath('logs', 'backoff')
 
-_log_format = (
+_log_format = ''.join((
     '%(asctime)s - [%(levelname)s] -  %(name)s - ',
     '(%(filename)s).%(funcName)s(%(lineno)d) - %(message)s',
-)
+))
 
 logging.basicConfig(
     level=logging.DEBUG,
@@ -5,7 +5,7 @@ from typing import Any, Optional
 
 from redis import Redis
 
-from backoff import backoff  # isort: skip
+from utils.backoff import backoff
 
 
 class BaseStorage(object):
@@ -54,13 +54,14 @@ class State(object):
         """Установить состояние для определённого ключа."""
         self.storage.save_state({key: state})
 
+    def set_states(self, states: dict) -> None:
+        """Установить состояния нескольких ключей одной записью."""
+        self.storage.save_state(states)
+
     def get_state(self, key: str) -> Any:
         """Получить состояние по определённому ключу."""
-        state = self.storage.retrieve_state()
-        if key not in state.keys():
-            return None
-        state_object = state[key]
-        if isinstance(state_object, 'bytes'):
+        state_object = self.storage.retrieve_state().get(key)
+        if isinstance(state_object, bytes):
             return state_object.decode('utf8')
         return state_object
 
@@ -71,19 +72,20 @@ class RedisStorage(BaseStorage):
         self.redis_dsl = redis_dsl
         self.redis_conn = None
 
-    @backoff
+    @backoff()
     def connect(self) -> None:
         if self.redis_dsl is None:
             self.redis_conn = self.redis_adapter()
-        self.redis_conn = self.redis_adapter(**self.redis_dsl)
+        else:
+            self.redis_conn = self.redis_adapter(**self.redis_dsl)
 
     def retrieve_state(self) -> dict:
-        if not self.redis_conn.ping():
+        if self.redis_conn is None or not self.redis_conn.ping():
             self.connect()
         return self.redis_conn
 
     def save_state(self, state: dict) -> None:
-        if not self.redis_conn.ping():
+        if self.redis_conn is None or not self.redis_conn.ping():
             self.connect()
         self.redis_conn.mset(state)
 